@@ -0,0 +1,175 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from price_data_utils import DISPLAY_TZ
+
+HOVER_DATE = '%{x|%A, %Y-%m-%d %H:%M}'
+# Above this many points series charts switch to WebGL (Scattergl) step areas; bars have no GL variant
+GL_THRESHOLD = 1000
+FIGURE_CACHE_ENTRIES = 64
+
+# Only the layout keys our charts use, instead of the ~6.5 KB 'plotly' template shipped with every figure
+CHART_TEMPLATE = go.layout.Template(layout={
+    'font': {'color': '#2a3f5f'},
+    'paper_bgcolor': 'white',
+    'plot_bgcolor': 'white',
+    'hovermode': 'closest',
+    'xaxis': {'gridcolor': '#ebf0f8', 'linecolor': '#ebf0f8', 'zeroline': False},
+    'yaxis': {'gridcolor': '#ebf0f8', 'linecolor': '#ebf0f8', 'zeroline': False},
+})
+
+def x_values(df, tz=DISPLAY_TZ):
+    """Bar times as float64 epoch milliseconds shifted to ``tz`` wall-clock time.
+
+    Plotly date axes read numbers as UTC milliseconds, so shifting by the display offset
+    makes the axis and hover labels show ``tz`` times while shipping 8 bytes per point
+    instead of an ISO string.
+    """
+    if 'ts' in df.columns:
+        ts = df['ts'].to_numpy(dtype='int64')
+    else:
+        ts = pd.DatetimeIndex(df['datetime']).as_unit('ns').asi8
+    offset = pd.Timedelta(pd.Timestamp(0, tz='UTC').tz_convert(tz).utcoffset())
+    return (ts + offset.value) / 1e6
+
+def y_values(series):
+    """Values as float32, which serializes to half the bytes of float64."""
+    return series.to_numpy(dtype='float32', na_value=np.nan)
+
+def candlestick_trace(df, name='Price'):
+    return go.Candlestick(
+        x=x_values(df),
+        open=y_values(df['Open']),
+        high=y_values(df['High']),
+        low=y_values(df['Low']),
+        close=y_values(df['Close']),
+        name=name,
+        increasing_line_color='green',
+        decreasing_line_color='red',
+        hovertemplate=HOVER_DATE + '<br>O %{open:.5g}  H %{high:.5g}<br>L %{low:.5g}  C %{close:.5g}<extra></extra>',
+    )
+
+def series_trace(df, column, name, color='blue'):
+    """Bars for short series, a WebGL step area for long ones."""
+    x = x_values(df)
+    y = y_values(df[column])
+    hovertemplate = HOVER_DATE + f'<br>{name} %{{y:.3g}}<extra></extra>'
+    if len(x) > GL_THRESHOLD:
+        return go.Scattergl(x=x, y=y, name=name, mode='lines', line={'shape': 'hv', 'color': color, 'width': 1},
+                            fill='tozeroy', hovertemplate=hovertemplate)
+    return go.Bar(x=x, y=y, name=name, marker_color=color, opacity=0.7, hovertemplate=hovertemplate)
+
+def price_figure(df, kl_levels=None, title=None, height=500):
+    """Candlestick chart with consolidated KL levels drawn as paper-spanning bands."""
+    from kl_overlay_utils import add_kl_overlay
+    fig = go.Figure(candlestick_trace(df))
+    fig = add_kl_overlay(fig, kl_levels or [], df)
+    fig.update_layout(
+        template=CHART_TEMPLATE,
+        title={'text': title, 'x': 0.5, 'xanchor': 'center'} if title else None,
+        xaxis={'type': 'date', 'title': 'Date', 'rangeslider': {'visible': False}},
+        yaxis_title='Price',
+        height=height,
+        margin={'l': 50, 'r': 20, 't': 60 if title else 20, 'b': 40},
+        legend={'orientation': 'h', 'yanchor': 'bottom', 'y': 1.02, 'xanchor': 'right', 'x': 1},
+        uirevision='price',
+    )
+    return fig
+
+def series_figure(df, column, name, title=None, height=300, ref_line=None, color='blue'):
+    """Single-series chart (volume, RVol) with an optional horizontal reference line."""
+    fig = go.Figure(series_trace(df, column, name, color))
+    if ref_line is not None:
+        fig.add_hline(y=ref_line, line_dash='dash', line_color='red', annotation_text=f"{name} = {ref_line}")
+    fig.update_layout(
+        template=CHART_TEMPLATE,
+        title=title,
+        xaxis={'type': 'date'},
+        yaxis_title=name,
+        height=height,
+        margin={'l': 50, 'r': 20, 't': 40 if title else 20, 'b': 40},
+        showlegend=False,
+        uirevision=column,
+    )
+    return fig
+
+def frame_fingerprint(df, columns):
+    """Cheap content hash of the columns a chart plots."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(len(df)).encode())
+    for column in columns:
+        if column in df.columns:
+            digest.update(np.ascontiguousarray(df[column].to_numpy()).tobytes())
+    return digest.hexdigest()
+
+class FigureCache:
+    """Bounded LRU of built figures plus per-chart build metrics (bytes, build_ms, points, reused).
+
+    Reruns with unchanged inputs get the same figure object back without rebuilding or
+    re-measuring it. This saves server-side build time only: ``st.plotly_chart`` still
+    sends the whole figure to the browser on every rerun. The cache and ``stats`` are
+    process-wide, shared by all sessions, and ``stats`` keeps the latest metrics for each
+    chart name from whichever session built or reused it last.
+    """
+
+    def __init__(self, max_entries=FIGURE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._figures = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get_or_build(self, name, key, builder, *args, **kwargs):
+        cache_key = (name, key)
+        with self._lock:
+            entry = self._figures.get(cache_key)
+            if entry is not None:
+                self._figures.move_to_end(cache_key)
+                self._stats[name] = dict(entry[1], reused=True)
+                return entry[0]
+        started = time.perf_counter()
+        fig = builder(*args, **kwargs)
+        build_ms = (time.perf_counter() - started) * 1000
+        stats = {
+            'bytes': len(fig.to_json()),
+            'build_ms': build_ms,
+            'points': sum(len(trace.x) for trace in fig.data if trace.x is not None),
+            'reused': False,
+        }
+        with self._lock:
+            self._figures[cache_key] = (fig, stats)
+            self._figures.move_to_end(cache_key)
+            while len(self._figures) > self.max_entries:
+                self._figures.popitem(last=False)
+            self._stats[name] = stats
+        return fig
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+            self._stats.clear()
+
+_figure_cache = FigureCache()
+
+def cached_figure(name, key, builder, *args, **kwargs):
+    """Build a figure once per (name, key) from the shared cache; see ``FigureCache``."""
+    return _figure_cache.get_or_build(name, key, builder, *args, **kwargs)
+
+def chart_stats():
+    return _figure_cache.stats()
+
+def format_chart_stats(stats):
+    """One-line summary, e.g. 'price 14.2 KB / 9 ms · volume 1.8 KB / 2 ms (cached build)'."""
+    return ' · '.join(
+        f"{name} {s['bytes'] / 1024:.1f} KB / {s['build_ms']:.0f} ms" + (" (cached build)" if s['reused'] else "")
+        for name, s in stats.items()
+    )
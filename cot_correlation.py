@@ -0,0 +1,280 @@
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from cot_data_utils import fetch_cot_frame
+from price_data_utils import DISPLAY_TZ
+
+# Lag k pairs the ratio change reported on week t with the price return of COT week t + k:
+# 0 is the week after the report, negative lags are the weeks leading up to it
+LEAD_LAGS = tuple(range(-4, 5))
+CORRELATION_WINDOWS = (13, 26, 52, 104)
+MIN_PAIRS = 8
+# With a cache, the CLI refetches only this many weeks before the last cached report (for revisions)
+REFETCH_WEEKS = 8
+WEEK = pd.Timedelta(weeks=1)
+CORRELATION_CACHE_PATH = os.getenv('CORRELATION_CACHE_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'data', 'cot_correlation.npz'))
+
+def week_anchors_ns(origin, weeks, tz=DISPLAY_TZ):
+    """Epoch-ns start of the COT week (Wednesday 00:00 in ``tz``) after each weekly report.
+
+    ``origin`` is the first report date (a Tuesday); week i reports on origin + i weeks.
+    """
+    wednesdays = pd.Timestamp(origin).normalize() + pd.Timedelta(days=1) + WEEK * np.arange(weeks)
+    return pd.DatetimeIndex(wednesdays).tz_localize(tz).tz_convert('UTC').as_unit('ns').asi8
+
+def ratio_change_matrix(cot, assets, origin, weeks):
+    """(weeks, assets) weekly change of the net position ratio on the report grid, NaN where missing."""
+    x = np.full((weeks, len(assets)), np.nan)
+    if cot.empty:
+        return x
+    cot = cot.sort_values(['asset', 'report_date'], kind='stable')
+    change = cot.groupby('asset', observed=True, sort=False)['net_position_ratio'].diff().to_numpy()
+    week = ((cot['report_date'] - pd.Timestamp(origin)) / WEEK).round().to_numpy()
+    column = pd.Categorical(cot['asset'].astype(str), categories=list(assets)).codes
+    keep = (column >= 0) & (week >= 0) & (week < weeks)
+    x[week[keep].astype('int64'), column[keep]] = change[keep]
+    return x
+
+def weekly_return_matrix(prices, symbols, anchors_ns):
+    """(len(anchors) - 1, symbols) log return from each COT week start to the next.
+
+    The price at an anchor is the last close before it; anchors with no bar in the week
+    before them (gaps, or weeks not traded yet) give NaN.
+    """
+    close = np.full((len(anchors_ns), len(symbols)), np.nan)
+    groups = {str(s): rows for s, rows in prices.groupby('symbol', observed=True, sort=False)} if len(prices) else {}
+    for j, symbol in enumerate(symbols):
+        rows = groups.get(symbol)
+        if rows is None:
+            continue
+        ts = rows['ts'].to_numpy(dtype='int64')
+        pos = np.searchsorted(ts, anchors_ns, side='left') - 1
+        ok = (pos >= 0) & (ts[np.maximum(pos, 0)] >= anchors_ns - WEEK.value)
+        close[ok, j] = rows['Close'].to_numpy(dtype='float64')[pos[ok]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.diff(np.log(close), axis=0)
+
+def _lagged(r, rows, lag):
+    index = rows + lag
+    valid = (index >= 0) & (index < len(r))
+    return np.where(valid[:, None], r[np.clip(index, 0, len(r) - 1)], np.nan)
+
+def rolling_lag_correlation(x, r, lags=LEAD_LAGS, windows=CORRELATION_WINDOWS, min_pairs=MIN_PAIRS, start=0):
+    """Rolling Pearson correlation of x[t] with r[t + lag], for every lag, window and column.
+
+    ``x`` is (weeks, assets) and ``r`` (weeks + forward weeks, assets). Windows end on
+    week t and only count weeks where both sides are present. Windowed sums of x, y, x²,
+    y² and xy come from prefix sums, so every (lag, window, week, asset) cell costs O(1)
+    and all lags are done in one stacked pass. Only rows from ``start`` on are computed.
+
+    Returns (corr, pairs) shaped (lags, windows, weeks - start, assets), float32 and int16.
+    """
+    weeks, assets = x.shape
+    lo = max(start - max(windows) + 1, 0)
+    rows = np.arange(lo, weeks)
+    # Centre on the column means so the prefix sums of squares don't cancel over long histories
+    y = np.stack([_lagged(r, rows, lag) for lag in lags])
+    xs = np.broadcast_to(x[lo:], y.shape)
+    both = ~np.isnan(xs) & ~np.isnan(y)
+    with np.errstate(invalid='ignore'):
+        xs = np.where(both, xs - np.nanmean(x, axis=0), 0.0)
+        y = np.where(both, y - np.nanmean(r, axis=0), 0.0)
+
+    def prefix(values):
+        return np.concatenate([np.zeros((len(lags), 1, assets)), np.cumsum(values, axis=1)], axis=1)
+
+    sums = [prefix(v) for v in (both.astype('float64'), xs, y, xs * xs, y * y, xs * y)]
+    out_rows = weeks - start
+    corr = np.full((len(lags), len(windows), out_rows, assets), np.nan, dtype='float32')
+    pairs = np.zeros((len(lags), len(windows), out_rows, assets), dtype='int16')
+    end = np.arange(start, weeks) - lo + 1
+    for w, window in enumerate(windows):
+        begin = np.maximum(end - window, 0)
+        n, sx, sy, sxx, syy, sxy = (s[:, end] - s[:, begin] for s in sums)
+        cov = n * sxy - sx * sy
+        var = (n * sxx - sx * sx) * (n * syy - sy * sy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = np.where((n >= min_pairs) & (var > 0), cov / np.sqrt(var), np.nan)
+        corr[:, w] = np.clip(value, -1.0, 1.0)
+        pairs[:, w] = n
+    return corr, pairs
+
+def _first_change(old, new):
+    """First row where two (rows, columns) arrays differ, NaN-aware, counting appended rows."""
+    rows = min(len(old), len(new))
+    same = (old[:rows] == new[:rows]) | (np.isnan(old[:rows]) & np.isnan(new[:rows]))
+    changed = np.flatnonzero(~same.all(axis=1))
+    return int(changed[0]) if len(changed) else rows
+
+def _fill_from(old, new):
+    """``new`` with its missing cells taken from ``old`` over the rows both have."""
+    out = new.copy()
+    rows = min(len(old), len(new))
+    gap = np.isnan(out[:rows])
+    out[:rows][gap] = old[:rows][gap]
+    return out
+
+class CorrelationEngine:
+    """COT ratio changes against COT-week forward returns for all assets, cached incrementally.
+
+    ``update`` rebuilds the weekly inputs on the cached week grid and recomputes only rows
+    from the first week whose inputs changed (a new report, a revised one, or a forward
+    return that became known), reusing the rest. Weeks the new data no longer covers (a
+    sliding fetch window, or only recent reports fetched) keep their cached inputs, so
+    ``update`` can be fed just the latest reports. ``save`` / ``load`` keep the cache
+    between runs.
+    """
+
+    def __init__(self, mapping, lags=LEAD_LAGS, windows=CORRELATION_WINDOWS, min_pairs=MIN_PAIRS):
+        self.assets = list(mapping.keys())
+        self.symbols = [mapping[a] for a in self.assets]
+        self.lags = tuple(lags)
+        self.windows = tuple(windows)
+        self.min_pairs = min_pairs
+        self.origin = None
+        self.x = None
+        self.r = None
+        self.corr = None
+        self.pairs = None
+        self.last_update = {}
+
+    @property
+    def weeks(self):
+        return pd.DatetimeIndex([]) if self.origin is None else pd.date_range(self.origin, periods=len(self.x), freq='7D')
+
+    def update(self, cot, prices):
+        """Refresh from a long-format COT frame and price panel; returns the update stats."""
+        started = time.perf_counter()
+        if cot.empty:
+            return self.last_update
+        origin = pd.Timestamp(cot['report_date'].min()).normalize()
+        # Stay on the cached grid unless the new data starts before it
+        incremental = self.origin is not None and origin >= self.origin
+        if incremental:
+            origin = self.origin
+        weeks = int(round((pd.Timestamp(cot['report_date'].max()) - origin) / WEEK)) + 1
+        forward = max(max(self.lags), 0) + 1
+        x = ratio_change_matrix(cot, self.assets, origin, weeks)
+        r = weekly_return_matrix(prices, self.symbols, week_anchors_ns(origin, weeks + forward))
+        start = 0
+        if incremental:
+            x, r = _fill_from(self.x, x), _fill_from(self.r, r)
+            start = min(_first_change(self.x, x), _first_change(self.r, r) - max(max(self.lags), 0))
+            start = min(max(start, 0), weeks)
+        corr, pairs = rolling_lag_correlation(x, r, self.lags, self.windows, self.min_pairs, start)
+        if start:
+            corr = np.concatenate([self.corr[:, :, :start], corr], axis=2)
+            pairs = np.concatenate([self.pairs[:, :, :start], pairs], axis=2)
+        self.origin, self.x, self.r, self.corr, self.pairs = origin, x, r, corr, pairs
+        self.last_update = {
+            'weeks': weeks,
+            'recomputed_weeks': weeks - start,
+            'seconds': time.perf_counter() - started,
+        }
+        return self.last_update
+
+    def frame(self, week=-1):
+        """Tidy (asset, symbol, lag, window, corr, pairs) rows for one week (latest by default)."""
+        if self.corr is None:
+            return pd.DataFrame(columns=['asset', 'symbol', 'lag', 'window', 'corr', 'pairs'])
+        corr = self.corr[:, :, week]
+        lag, window, asset = np.meshgrid(np.arange(len(self.lags)), np.arange(len(self.windows)),
+                                         np.arange(len(self.assets)), indexing='ij')
+        return pd.DataFrame({
+            'asset': np.array(self.assets, dtype=object)[asset.ravel()],
+            'symbol': np.array(self.symbols, dtype=object)[asset.ravel()],
+            'lag': np.array(self.lags)[lag.ravel()],
+            'window': np.array(self.windows)[window.ravel()],
+            'corr': corr.ravel(),
+            'pairs': self.pairs[:, :, week].ravel(),
+        })
+
+    def lead_lag_matrix(self, window, week=-1):
+        """asset x lag correlations for one window, as of one week (latest by default)."""
+        w = self.windows.index(window)
+        return pd.DataFrame(self.corr[:, w, week].T, index=self.assets, columns=list(self.lags))
+
+    def history(self, asset, lag, window):
+        """Rolling correlation over time for one asset, lag and window."""
+        values = self.corr[self.lags.index(lag), self.windows.index(window), :, self.assets.index(asset)]
+        return pd.Series(values, index=self.weeks, name=asset)
+
+    def cross_asset_matrix(self, lag=0, window=52):
+        """COT asset (rows) x price asset (columns) correlation over the latest window."""
+        weeks = len(self.x)
+        rows = np.arange(max(weeks - window, 0), weeks)
+        x = self.x[rows]
+        y = _lagged(self.r, rows, lag)
+        out = np.full((len(self.assets), len(self.assets)), np.nan)
+        for i in range(len(self.assets)):
+            both = ~np.isnan(x[:, [i]]) & ~np.isnan(y)
+            n = both.sum(axis=0)
+            xs = np.where(both, x[:, [i]], 0.0)
+            ys = np.where(both, y, 0.0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cov = n * (xs * ys).sum(0) - xs.sum(0) * ys.sum(0)
+                var = (n * (xs * xs).sum(0) - xs.sum(0) ** 2) * (n * (ys * ys).sum(0) - ys.sum(0) ** 2)
+                out[i] = np.where((n >= self.min_pairs) & (var > 0), cov / np.sqrt(var), np.nan)
+        return pd.DataFrame(out, index=self.assets, columns=self.assets)
+
+    def save(self, path=CORRELATION_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, assets=np.array(self.assets), symbols=np.array(self.symbols), lags=np.array(self.lags),
+                 windows=np.array(self.windows), min_pairs=self.min_pairs, origin=str(self.origin.date()),
+                 x=self.x, r=self.r, corr=self.corr, pairs=self.pairs)
+        os.replace(tmp, path)
+
+    def load(self, path=CORRELATION_CACHE_PATH):
+        """Restore a saved cache if it was built with the same assets, lags and windows."""
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            if (list(data['assets']) != self.assets or tuple(data['lags']) != self.lags
+                    or tuple(data['windows']) != self.windows or int(data['min_pairs']) != self.min_pairs):
+                return False
+            self.origin = pd.Timestamp(str(data['origin']))
+            self.x, self.r, self.corr, self.pairs = data['x'], data['r'], data['corr'], data['pairs']
+        return True
+
+def main():
+    from cot_screener import load_price_panel
+    from kl_data_utils import COT_FUTURES_MAPPING
+    parser = argparse.ArgumentParser(description="Rolling correlation of weekly COT ratio changes with COT-week forward returns.")
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--interval', default='1h')
+    parser.add_argument('--window', type=int, default=52, choices=CORRELATION_WINDOWS)
+    parser.add_argument('--lag', type=int, default=0, help="lag for the cross-asset matrix")
+    parser.add_argument('--cross', action='store_true', help="also print the COT x price cross-asset matrix")
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+    today = datetime.utcnow().date()
+    since = today - timedelta(weeks=52 * args.years)
+    engine = CorrelationEngine(COT_FUTURES_MAPPING)
+    if not args.no_cache and engine.load() and engine.origin.date() <= since:
+        # Earlier weeks come from the cache; refetch only the recent reports
+        since = max(since, (engine.weeks[-1] - timedelta(weeks=REFETCH_WEEKS)).date())
+    cot = fetch_cot_frame(COT_FUTURES_MAPPING.keys(), since, today)
+    weeks = (today - since).days // 7 + max(LEAD_LAGS) + 2
+    prices = load_price_panel(list(dict.fromkeys(COT_FUTURES_MAPPING.values())), args.interval,
+                              tail_bars=24 * 7 * weeks)
+    stats = engine.update(cot, prices)
+    if not stats:
+        print("No COT reports returned.")
+        return
+    if not args.no_cache:
+        engine.save()
+    print(f"{stats['weeks']} weeks, recomputed {stats['recomputed_weeks']} in {stats['seconds']:.2f}s")
+    pd.set_option('display.width', 200)
+    print(engine.lead_lag_matrix(args.window).round(2).to_string())
+    if args.cross:
+        print(engine.cross_asset_matrix(args.lag, args.window).round(2).to_string())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from http_utils import get_json, CFTC_COT_URL
+
+COT_SELECT = "market_and_exchange_names,report_date_as_yyyy_mm_dd,noncomm_positions_long_all,noncomm_positions_short_all"
+COT_ROW_LIMIT = 50000
+COT_INDEX_WEEKS = 52
+
+def net_position_ratio(long, short):
+    """Vectorized (Long - Short) / (Long + Short), 0.0 where there are no positions."""
+    long = np.asarray(long, dtype='float64')
+    short = np.asarray(short, dtype='float64')
+    total = long + short
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(total == 0, 0.0, (long - short) / total)
+    return ratio
+
+def _quote(name):
+    return "'" + name.replace("'", "''") + "'"
+
+def fetch_cot_frame(asset_names, start_date, end_date):
+    """Fetch COT reports for many assets in one request as a long-format frame.
+
+    Columns: asset (category), report_date (datetime64), long, short, net_position_ratio;
+    sorted by (asset, report_date).
+    """
+    names = list(dict.fromkeys(asset_names))
+    where_clause = (
+        f"market_and_exchange_names in ({', '.join(_quote(n) for n in names)}) AND "
+        f"report_date_as_yyyy_mm_dd BETWEEN '{start_date}' AND '{end_date}'"
+    )
+    params = {
+        "$where": where_clause,
+        "$select": COT_SELECT,
+        "$order": "market_and_exchange_names ASC, report_date_as_yyyy_mm_dd ASC",
+        "$limit": COT_ROW_LIMIT,
+    }
+    return cot_records_to_frame(get_json(CFTC_COT_URL, params=params), names)
+
+def cot_records_to_frame(records, asset_names=None):
+    """Turn CFTC JSON records into the long-format COT frame."""
+    raw = pd.DataFrame.from_records(records, columns=COT_SELECT.split(','))
+    categories = list(asset_names) if asset_names is not None else sorted(raw['market_and_exchange_names'].dropna().unique())
+    cot = pd.DataFrame({
+        'asset': pd.Categorical(raw['market_and_exchange_names'], categories=categories),
+        'report_date': pd.to_datetime(raw['report_date_as_yyyy_mm_dd'], errors='coerce').astype('datetime64[ns]'),
+        'long': pd.to_numeric(raw['noncomm_positions_long_all'], errors='coerce'),
+        'short': pd.to_numeric(raw['noncomm_positions_short_all'], errors='coerce'),
+    })
+    cot = cot.dropna(subset=['asset', 'report_date'])
+    cot['net_position_ratio'] = net_position_ratio(cot['long'], cot['short'])
+    return cot.sort_values(['asset', 'report_date'], kind='stable').reset_index(drop=True)
+
+def add_cot_metrics(cot, index_weeks=COT_INDEX_WEEKS):
+    """Add weekly ratio change and a COT index (0-100 position of the ratio in its lookback range)."""
+    grouped = cot.groupby('asset', observed=True, sort=False)['net_position_ratio']
+    cot = cot.copy()
+    cot['ratio_change'] = grouped.diff()
+    rolling = grouped.rolling(index_weeks, min_periods=1)
+    low = rolling.min().droplevel(0).reindex(cot.index)
+    high = rolling.max().droplevel(0).reindex(cot.index)
+    span = (high - low).to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cot['cot_index'] = np.where(span > 0, 100.0 * (cot['net_position_ratio'].to_numpy() - low.to_numpy()) / span, 50.0)
+    return cot
@@ -0,0 +1,127 @@
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from cot_data_utils import fetch_cot_frame, add_cot_metrics, COT_INDEX_WEEKS
+from http_utils import StaleWhileRevalidate
+from price_data_utils import empty_price_frame
+from price_store import open_price_history
+from rvol_utils import add_rvol
+
+ATR_PERIOD = 14
+PRICE_LOOKBACK_BARS = 24 * 45  # enough sessions for the time-of-day RVol baseline
+COT_MAX_AGE = 3600
+
+# Last good COT frame per (assets, lookback); served stale while it refreshes if the CFTC API is slow or down
+_cot_frames = StaleWhileRevalidate(COT_MAX_AGE)
+
+SCREENER_COLUMNS = [
+    'asset', 'symbol', 'report_date', 'net_position_ratio', 'ratio_change', 'cot_index',
+    'last_close', 'atr', 'rvol', 'nearest_zone_low', 'nearest_zone_high', 'zone_distance_atr',
+]
+
+def load_price_panel(symbols, interval='1h', tail_bars=PRICE_LOOKBACK_BARS):
+    """Combine the tail of each symbol's stored history into one long-format price frame."""
+    frames = []
+    for symbol in symbols:
+        history = open_price_history(symbol, interval)
+        if history is not None and len(history):
+            frames.append(history.slice(int(history.ts[max(len(history) - tail_bars, 0)]), None).to_frame())
+    if not frames:
+        return empty_price_frame()
+    panel = pd.concat(frames, ignore_index=True)
+    panel['symbol'] = panel['symbol'].astype(str).astype('category')
+    return panel
+
+def zones_to_frame(zones_by_symbol):
+    """Flatten {symbol: [zone, ...]} into a long-format (symbol, zone_low, zone_high) frame."""
+    rows = [
+        (symbol, float(z['zone_low']), float(z['zone_high']))
+        for symbol, zones in zones_by_symbol.items() for z in zones
+        if z.get('zone_low') is not None and z.get('zone_high') is not None
+    ]
+    return pd.DataFrame(rows, columns=['symbol', 'zone_low', 'zone_high'])
+
+def price_metrics(prices, atr_period=ATR_PERIOD):
+    """Last close, ATR and time-of-day RVol per symbol from a long-format price frame, all grouped ops."""
+    if prices.empty:
+        return pd.DataFrame(columns=['symbol', 'last_close', 'atr', 'rvol'])
+    prices = add_rvol(prices)
+    prev_close = prices.groupby('symbol', observed=True, sort=False)['Close'].shift(1)
+    high = prices['High'].astype('float64')
+    low = prices['Low'].astype('float64')
+    tr = np.fmax(high - low, np.fmax((high - prev_close).abs(), (low - prev_close).abs()))
+    prices = prices.assign(tr=tr)
+    atr = prices.groupby('symbol', observed=True, sort=False)['tr'].rolling(atr_period, min_periods=1).mean().droplevel(0)
+    prices = prices.assign(atr=atr)
+    last = prices.groupby('symbol', observed=True, sort=False).tail(1)
+    return pd.DataFrame({
+        'symbol': last['symbol'].astype(str).to_numpy(),
+        'last_close': last['Close'].astype('float64').to_numpy(),
+        'atr': last['atr'].to_numpy(),
+        'rvol': last['rvol'].astype('float64').to_numpy(),
+    })
+
+def nearest_zones(last_prices, zones):
+    """Distance from each symbol's last close to its nearest zone (0 inside a zone)."""
+    columns = ['symbol', 'nearest_zone_low', 'nearest_zone_high', 'zone_distance']
+    if zones.empty or last_prices.empty:
+        return pd.DataFrame(columns=columns)
+    merged = zones.merge(last_prices[['symbol', 'last_close']], on='symbol', how='inner')
+    close = merged['last_close'].to_numpy()
+    merged['zone_distance'] = np.maximum.reduce([
+        merged['zone_low'].to_numpy() - close,
+        close - merged['zone_high'].to_numpy(),
+        np.zeros(len(merged)),
+    ])
+    nearest = merged.loc[merged.groupby('symbol', sort=False)['zone_distance'].idxmin()]
+    return nearest.rename(columns={'zone_low': 'nearest_zone_low', 'zone_high': 'nearest_zone_high'})[columns]
+
+def build_screener(cot, prices, zones, mapping, index_weeks=COT_INDEX_WEEKS):
+    """Build one row per asset from long-format COT, price and zone frames.
+
+    ``mapping`` is {cot asset name: symbol}. Every metric comes from grouped operations
+    over the combined frames rather than a per-asset loop.
+    """
+    assets = pd.DataFrame({'asset': list(mapping.keys()), 'symbol': list(mapping.values())})
+    if not cot.empty:
+        latest_cot = add_cot_metrics(cot, index_weeks).groupby('asset', observed=True, sort=False).tail(1)
+        latest_cot = latest_cot[['asset', 'report_date', 'net_position_ratio', 'ratio_change', 'cot_index']]
+        latest_cot = latest_cot.assign(asset=latest_cot['asset'].astype(str))
+        assets = assets.merge(latest_cot, on='asset', how='left')
+    last_prices = price_metrics(prices)
+    assets = assets.merge(last_prices, on='symbol', how='left')
+    assets = assets.merge(nearest_zones(last_prices, zones), on='symbol', how='left')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        assets['zone_distance_atr'] = assets['zone_distance'] / assets['atr']
+    return assets.reindex(columns=SCREENER_COLUMNS)
+
+def download_screener_cot(assets, index_weeks):
+    """Fetch the COT lookback for all assets from the CFTC API in one request."""
+    today = datetime.utcnow().date()
+    return fetch_cot_frame(assets, today - timedelta(weeks=index_weeks + 1), today)
+
+def load_screener(mapping, time_period='weekly', interval='1h', index_weeks=COT_INDEX_WEEKS, zones_by_symbol=None):
+    """Fetch COT for all assets in one request, read prices from the local store, and build the screener.
+
+    COT goes through a stale-while-revalidate cache and the CFTC circuit breaker: the last good
+    frame is used (``attrs['cot_stale']``, ``attrs['cot_age_seconds']``) while it refreshes, and
+    without one the COT columns are left empty (``attrs['cot_error']``).
+    """
+    from kl_overlay_utils import fetch_kl_zones_by_symbol
+    assets = tuple(dict.fromkeys(mapping.keys()))
+    try:
+        cot, age, stale = _cot_frames.get((assets, index_weeks), download_screener_cot, assets, index_weeks)
+        error = None
+    except Exception as e:
+        logging.error(f"Error fetching COT for the screener: {e}")
+        cot, age, stale, error = pd.DataFrame(), None, False, str(e)
+    symbols = list(dict.fromkeys(mapping.values()))
+    prices = load_price_panel(symbols, interval)
+    if zones_by_symbol is None:
+        zones_by_symbol = fetch_kl_zones_by_symbol(symbols, time_period)
+    screener = build_screener(cot, prices, zones_to_frame(zones_by_symbol), mapping, index_weeks)
+    screener.attrs.update(cot_age_seconds=age, cot_stale=stale, cot_error=error)
+    return screener
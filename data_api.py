@@ -0,0 +1,338 @@
+"""Read-only local HTTP API over the price store, CFTC COT data and the KL zone replica.
+
+    python data_api.py --port 8765
+
+    GET /symbols
+    GET /prices/<symbol>?interval=1h&start=2024-01-01&end=2024-03-31&format=json|csv|arrow|parquet
+    GET /cot?assets=<name>[&assets=<name>...]&start=...&end=...&index_weeks=52&format=...
+    GET /zones/<symbol>?period=weekly&levels=1&format=...
+
+Dates are whole calendar days in the display timezone (GMT+3), or raw epoch-ns integers.
+Every response carries an ETag; send it back as If-None-Match to get a 304. Responses are
+sent with chunked encoding. Price ranges are read from the memory-mapped store one chunk at
+a time, so a large range is never copied into memory as a whole (except for Parquet, whose
+footer needs the full file). COT and zone frames are small and are built in memory first.
+"""
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+import pandas as pd
+
+from cot_data_utils import fetch_cot_frame, add_cot_metrics, COT_INDEX_WEEKS
+from http_utils import SingleFlight
+from price_data_utils import date_range_ns
+from price_store import PriceHistory, open_price_history
+
+API_HOST = '127.0.0.1'
+API_PORT = 8765
+STREAM_CHUNK_ROWS = 50_000
+COT_TTL_SECONDS = 900
+COT_CACHE_ENTRIES = 64
+ZONES_TTL_SECONDS = 30
+DEFAULT_COT_WEEKS = 156
+
+FORMATS = {
+    'json': 'application/json',
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+class APIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def frame_etag(df, *parts):
+    """Strong validator from the frame's contents plus any request parts that shape the body."""
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(repr(parts).encode())
+    digest.update(repr(list(df.columns)).encode())
+    if len(df):
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return f'"{digest.hexdigest()}"'
+
+def parse_bound(value, default):
+    """A date (YYYY-MM-DD) or an epoch-ns integer from a query parameter."""
+    if value is None:
+        return default
+    if value.isdigit():
+        return int(value)
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise APIError(400, f"Bad date: {value}")
+
+def ns_range(start, end):
+    """[start_ns, end_ns) for bounds given as dates (whole days) or epoch-ns integers."""
+    start_ns = start if isinstance(start, int) else date_range_ns(start, start)[0]
+    end_ns = end if isinstance(end, int) else date_range_ns(end, end)[1]
+    return start_ns, end_ns
+
+# --- data loaders (module level so tests and other tools can swap them) ---
+
+class _FrameCache:
+    """TTL'd LRU of frames with their ETags; concurrent misses share one upstream fetch."""
+
+    def __init__(self, ttl=COT_TTL_SECONDS, max_entries=COT_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    def get(self, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                return entry[1], entry[2]
+        frame = self._flights.do(key, loader)
+        etag = frame_etag(frame, key)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), frame, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return frame, etag
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_cot_cache = _FrameCache()
+_zones_cache = _FrameCache(ttl=ZONES_TTL_SECONDS)
+
+def load_cot(assets, start_date, end_date, index_weeks=COT_INDEX_WEEKS):
+    """COT history with net_position_ratio, ratio_change and cot_index, plus its ETag."""
+    key = (tuple(assets), str(start_date), str(end_date), index_weeks)
+    def loader():
+        cot = fetch_cot_frame(assets, start_date, end_date)
+        cot = add_cot_metrics(cot, index_weeks) if len(cot) else cot
+        cot = cot.assign(asset=cot['asset'].astype(str))
+        return cot.reset_index(drop=True)
+    return _cot_cache.get(key, loader)
+
+def load_zones(symbol, period='weekly', levels=False):
+    """KL zones from the delta-synced replica, or consolidated levels, synced at most every ZONES_TTL_SECONDS.
+
+    Reads the database only: the dashboard's write-behind queue (and its spool) stays owned
+    by the dashboard process, so writes it has not flushed yet are not shown here.
+    """
+    from supabase_client import get_kl_client
+    from kl_cluster_utils import consolidate_kl_zones, DEFAULT_TOLERANCE_ATR
+    def loader():
+        zones = get_kl_client().sync_kl_zones(symbol, period)
+        if levels:
+            zones = consolidate_kl_zones(zones, tolerance_atr=DEFAULT_TOLERANCE_ATR)
+            for level in zones:
+                level['source_ids'] = ','.join(str(i) for i in level['source_ids'])
+                level['candle_labels'] = ','.join(str(c) for c in level['candle_labels'])
+        return pd.DataFrame(zones)
+    return _zones_cache.get((symbol, period, levels), loader)[0]
+
+def list_symbols():
+    from kl_data_utils import COT_FUTURES_MAPPING
+    return pd.DataFrame({'asset': list(COT_FUTURES_MAPPING.keys()), 'symbol': list(COT_FUTURES_MAPPING.values())})
+
+# --- encoders ---
+
+def iter_chunks(df, rows=None):
+    """Row chunks of an in-memory frame (always at least one, possibly empty)."""
+    rows = rows or STREAM_CHUNK_ROWS
+    for start in range(0, max(len(df), 1), rows):
+        yield df.iloc[start:start + rows]
+
+def iter_history_chunks(view, rows=None):
+    """Frames of ``rows`` bars copied out of a memory-mapped history view one at a time."""
+    rows = rows or STREAM_CHUNK_ROWS
+    for start in range(0, max(len(view), 1), rows):
+        yield PriceHistory(view.symbol, view.interval, {col: arr[start:start + rows] for col, arr in view.columns.items()}, view.version).to_frame()
+
+def encode_json(chunks):
+    yield b'['
+    first = True
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        body = chunk.to_json(orient='records', date_format='iso')[1:-1].encode()
+        yield body if first else b',' + body
+        first = False
+    yield b']'
+
+def encode_csv(chunks):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header).encode()
+        header = False
+
+def encode_arrow(chunks):
+    import pyarrow as pa
+    chunks = iter(chunks)
+    first = next(chunks)
+    schema = pa.Schema.from_pandas(first.iloc[:0], preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for chunk in itertools.chain([first], chunks):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+def encode_parquet(chunks):
+    # Parquet's footer needs the whole file, so this one is built in memory
+    buffer = io.BytesIO()
+    pd.concat(list(chunks), ignore_index=True).to_parquet(buffer, index=False)
+    yield buffer.getvalue()
+
+ENCODERS = {'json': encode_json, 'csv': encode_csv, 'arrow': encode_arrow, 'parquet': encode_parquet}
+
+# --- handler ---
+
+class DataAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    price_root = None
+
+    def log_message(self, fmt, *args):
+        logging.info("data_api %s - " + fmt, self.address_string(), *args)
+
+    def do_GET(self):
+        self._streaming = False
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [unquote(p) for p in url.path.strip('/').split('/') if p]
+        try:
+            fmt = self._format(query)
+            if parts == ['symbols']:
+                df = list_symbols()
+                self._send_frame(df, fmt, frame_etag(df, fmt))
+            elif len(parts) == 2 and parts[0] == 'prices':
+                self._prices(parts[1], query, fmt)
+            elif parts == ['cot']:
+                self._cot(query, fmt)
+            elif len(parts) == 2 and parts[0] == 'zones':
+                period = query.get('period', ['weekly'])[0]
+                levels = query.get('levels', ['0'])[0] in ('1', 'true')
+                df = load_zones(parts[1], period, levels)
+                self._send_frame(df, fmt, frame_etag(df, parts[1], period, levels, fmt))
+            else:
+                raise APIError(404, f"Unknown path: {url.path}")
+        except APIError as e:
+            self._send_error(e.status, str(e))
+        except Exception as e:
+            logging.error(f"data_api error on {self.path}: {e}")
+            if self._streaming:
+                # Headers and part of the body are out; drop the connection without the final
+                # chunk so the client sees a truncated response instead of a status line mid-body
+                self.close_connection = True
+            else:
+                self._send_error(500, str(e))
+
+    def _format(self, query):
+        fmt = query.get('format', ['json'])[0]
+        if fmt not in FORMATS:
+            raise APIError(400, f"Unknown format: {fmt}")
+        if fmt in ('arrow', 'parquet'):
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise APIError(406, f"{fmt} responses need pyarrow installed")
+        return fmt
+
+    def _prices(self, symbol, query, fmt):
+        interval = query.get('interval', ['1h'])[0]
+        history = open_price_history(symbol, interval, self.price_root)
+        if history is None:
+            raise APIError(404, f"No stored prices for {symbol} ({interval})")
+        start = parse_bound(query.get('start', [None])[0], None)
+        end = parse_bound(query.get('end', [None])[0], None)
+        start_ns, end_ns = ns_range(start if start is not None else 0, end if end is not None else 2**62)
+        view = history.slice(start_ns, end_ns)
+        # The store version pins the contents, so the ETag needs no pass over the data
+        etag = '"%s"' % hashlib.blake2b(repr((symbol, interval, history.version, len(view), start_ns, end_ns, fmt)).encode(), digest_size=12).hexdigest()
+        if self._not_modified(etag):
+            return
+        self._send_chunks(iter_history_chunks(view), fmt, etag)
+
+    def _cot(self, query, fmt):
+        assets = [a for value in query.get('assets', []) for a in value.split('|') if a]
+        if not assets:
+            raise APIError(400, "assets is required")
+        today = date.today()
+        start = parse_bound(query.get('start', [None])[0], today - timedelta(weeks=DEFAULT_COT_WEEKS))
+        end = parse_bound(query.get('end', [None])[0], today)
+        if isinstance(start, int) or isinstance(end, int):
+            raise APIError(400, "COT ranges take dates, not epoch-ns")
+        index_weeks = int(query.get('index_weeks', [COT_INDEX_WEEKS])[0])
+        cot, etag = load_cot(assets, start, end, index_weeks)
+        self._send_frame(cot, fmt, etag[:-1] + f'-{fmt}"')
+
+    def _not_modified(self, etag):
+        if etag not in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+            return False
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return True
+
+    def _send_frame(self, df, fmt, etag):
+        if self._not_modified(etag):
+            return
+        self._send_chunks(iter_chunks(df), fmt, etag)
+
+    def _send_chunks(self, chunks, fmt, etag):
+        self.send_response(200)
+        self.send_header('Content-Type', FORMATS[fmt])
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self._streaming = True
+        for piece in ENCODERS[fmt](chunks):
+            if piece:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _send_error(self, status, message):
+        body = json.dumps({'error': message}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def make_server(host=API_HOST, port=API_PORT, price_root=None):
+    """Threaded API server; ``price_root`` overrides the price store directory."""
+    handler = type('BoundDataAPIHandler', (DataAPIHandler,), {'price_root': price_root})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve prices, COT and KL zones over a local read-only HTTP API.")
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    args = parser.parse_args()
+    server = make_server(args.host, args.port)
+    print(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CFTC_COT_URL = "https://publicreporting.cftc.gov/resource/6dca-aqww.json"
+
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) seconds
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+CACHE_ENTRIES = 256
+BREAKER_FAILURES = 5
+BREAKER_RESET_SECONDS = 30.0
+REVALIDATE_INTERVAL = 60.0
+REVALIDATE_WORKERS = 4
+
+_session = None
+_session_lock = threading.Lock()
+
+def create_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+    """Create a keep-alive session with a bounded connection pool and gzip negotiation."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Accept': 'application/json'})
+    return session
+
+def get_session():
+    """Get or create the process-wide pooled session."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+class ConditionalCache:
+    """Bounded LRU of validators (ETag / Last-Modified) and bodies for conditional GETs."""
+
+    def __init__(self, max_entries=CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, etag, last_modified, payload):
+        with self._lock:
+            self._entries[key] = {'etag': etag, 'last_modified': last_modified, 'payload': payload}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_conditional_cache = ConditionalCache()
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is in flight
+    wait and receive the same result (or exception). Nothing is cached afterwards.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn(*args, **kwargs)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+_inflight = SingleFlight()
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+class CircuitBreaker:
+    """Stops calls to an upstream after repeated failures, then lets one trial call through.
+
+    closed -> open after ``failure_threshold`` consecutive failures; open -> half-open
+    after ``reset_timeout`` seconds, where one caller is allowed through; its success
+    closes the breaker and its failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half_open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def retry_in(self):
+        """Seconds until the next trial call is allowed (0 when closed)."""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0)
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial:
+                    logging.error(f"Circuit breaker '{self.name}' opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable; retrying in {self.retry_in():.0f}s")
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name):
+    """Process-wide circuit breaker for an upstream (created on first use)."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+_revalidator = ThreadPoolExecutor(max_workers=REVALIDATE_WORKERS, thread_name_prefix='revalidate')
+_revalidating = set()
+_last_revalidated = {}
+_revalidate_lock = threading.Lock()
+
+def revalidate_in_background(key, fn, *args, min_interval=REVALIDATE_INTERVAL):
+    """Run ``fn(*args)`` on a background worker unless the same key is already running or
+    ran less than ``min_interval`` seconds ago. Returns True if a refresh was started."""
+    now = time.monotonic()
+    with _revalidate_lock:
+        if key in _revalidating or now - _last_revalidated.get(key, -min_interval) < min_interval:
+            return False
+        _revalidating.add(key)
+        _last_revalidated[key] = now
+    def run():
+        try:
+            fn(*args)
+        except Exception as e:
+            logging.error(f"Background refresh of {key} failed: {e}")
+        finally:
+            with _revalidate_lock:
+                _revalidating.discard(key)
+    _revalidator.submit(run)
+    return True
+
+class StaleWhileRevalidate:
+    """Last-good-value cache: fresh entries are served as is, stale ones are served at once
+    while a background refresh runs, and only a missing entry waits for the loader.
+
+    ``get`` returns (value, age_seconds, stale). A failed refresh keeps the old value.
+    """
+
+    def __init__(self, max_age, max_entries=CACHE_ENTRIES, min_interval=REVALIDATE_INTERVAL):
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.min_interval = min_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    def get(self, key, loader, *args):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            value = self._flights.do(key, loader, *args)
+            self.put(key, value)
+            return value, 0.0, False
+        fetched_at, value = entry
+        age = time.time() - fetched_at
+        if age < self.max_age:
+            return value, age, False
+        revalidate_in_background((id(self), key), self._refresh, key, loader, args, min_interval=self.min_interval)
+        return value, age, True
+
+    def _refresh(self, key, loader, args):
+        self.put(key, self._flights.do(key, loader, *args))
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After')
+    try:
+        return min(float(value), BACKOFF_MAX) if value is not None else None
+    except ValueError:
+        return None
+
+def _cache_key(url, params):
+    return url, tuple(sorted((params or {}).items()))
+
+def get_json(url, params=None, timeout=DEFAULT_TIMEOUT, retries=MAX_RETRIES, session=None, cache=_conditional_cache):
+    """GET a JSON resource with pooling, timeouts, jittered retries and conditional requests.
+
+    A cached ETag/Last-Modified is sent as If-None-Match/If-Modified-Since; a 304 returns
+    the cached body. Connection errors, timeouts and 429/5xx responses are retried.
+    Concurrent calls for the same URL and params share one upstream request, and a
+    per-host circuit breaker raises CircuitOpenError instead of calling a failing host.
+    """
+    key = _cache_key(url, params)
+    breaker = get_breaker(urlparse(url).netloc)
+    breaker.check()
+    return _inflight.do(key, _guarded_get_json, breaker, key, url, params, timeout, retries, session or get_session(), cache)
+
+def _guarded_get_json(breaker, *args):
+    # Every outcome records a result, so a half-open trial call never stays claimed
+    try:
+        payload = _get_json(*args)
+    except requests.HTTPError as e:
+        # Client errors mean the host is up; only 429/5xx count against it
+        status = e.response.status_code if e.response is not None else None
+        if status is None or status in RETRY_STATUSES or status >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+    except BaseException:
+        # Connection errors, timeouts, truncated or undecodable bodies, redirect loops, ...
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return payload
+
+def _get_json(key, url, params, timeout, retries, session, cache):
+    cached = cache.get(key) if cache is not None else None
+    headers = {}
+    if cached:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(url, params=params, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+            continue
+        if response.status_code == 304 and cached:
+            return cached['payload']
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            delay = _retry_after(response)
+            time.sleep(delay if delay is not None else backoff_delay(attempt))
+            continue
+        response.raise_for_status()
+        payload = response.json()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if cache is not None and (etag or last_modified):
+            cache.put(key, etag, last_modified, payload)
+        return payload
@@ -0,0 +1,75 @@
+from collections import Counter
+
+DEFAULT_TOLERANCE_ATR = 0.25
+
+def _zone_atr(zone, atr):
+    """Resolve the ATR used to scale the merge tolerance for a zone."""
+    if isinstance(atr, dict):
+        value = atr.get(zone.get('symbol'))
+    else:
+        value = atr
+    if value is None:
+        value = zone.get('atr_value', zone.get('atr'))
+    try:
+        return abs(float(value))
+    except (TypeError, ValueError):
+        return 0.0
+
+def _new_level(zone, zone_low, zone_high, weight, zone_atr):
+    return {
+        'symbol': zone.get('symbol'),
+        'time_period': zone.get('time_period'),
+        'zone_low': zone_low,
+        'zone_high': zone_high,
+        'weight': weight,
+        'atr': zone_atr,
+        '_mid_sum': (zone_low + zone_high) / 2 * weight,
+        'source_ids': [zone.get('id')],
+        'candle_labels': [zone.get('candle_label')],
+        '_types': Counter([zone.get('kl_type')]),
+    }
+
+def _finish_level(level):
+    level['level'] = level.pop('_mid_sum') / level['weight'] if level['weight'] else (level['zone_low'] + level['zone_high']) / 2
+    level['zone_count'] = len(level['source_ids'])
+    types = level.pop('_types')
+    level['kl_type'] = types.most_common(1)[0][0] if types else None
+    return level
+
+def consolidate_kl_zones(kl_zones, tolerance_atr=DEFAULT_TOLERANCE_ATR, atr=None, weight_key=None):
+    """Merge overlapping or near-adjacent KL zones into weighted levels, per symbol.
+
+    Zones are swept in (symbol, zone_low) order; a zone joins the current level when its
+    low is within ``tolerance_atr * ATR`` of the level's high. ``atr`` may be a number, a
+    {symbol: atr} dict, or None to use each zone's own ``atr_value``. Each level keeps the
+    ids and candle labels of the zones it was built from.
+    """
+    zones = [
+        z for z in kl_zones
+        if z.get('zone_high') is not None and z.get('zone_low') is not None
+    ]
+    zones.sort(key=lambda z: (str(z.get('symbol')), float(z['zone_low'])))
+    levels = []
+    current = None
+    for zone in zones:
+        zone_low = float(zone['zone_low'])
+        zone_high = float(zone['zone_high'])
+        weight = float(zone.get(weight_key, 1.0) or 0.0) if weight_key else 1.0
+        zone_atr = _zone_atr(zone, atr)
+        if current is not None and current['symbol'] == zone.get('symbol'):
+            tolerance = tolerance_atr * max(current['atr'], zone_atr)
+            if zone_low <= current['zone_high'] + tolerance:
+                current['zone_high'] = max(current['zone_high'], zone_high)
+                current['weight'] += weight
+                current['atr'] = max(current['atr'], zone_atr)
+                current['_mid_sum'] += (zone_low + zone_high) / 2 * weight
+                current['source_ids'].append(zone.get('id'))
+                current['candle_labels'].append(zone.get('candle_label'))
+                current['_types'][zone.get('kl_type')] += 1
+                continue
+        if current is not None:
+            levels.append(_finish_level(current))
+        current = _new_level(zone, zone_low, zone_high, weight, zone_atr)
+    if current is not None:
+        levels.append(_finish_level(current))
+    return levels
@@ -1,15 +1,46 @@
 import pandas as pd
 from datetime import timedelta
+from price_data_utils import ts_to_datetime, date_range_ns, filter_ts_range
+
+# COT asset name to Yahoo ticker mapping shared by the dashboard, monitor and batch jobs
+COT_FUTURES_MAPPING = {
+    "GOLD - COMMODITY EXCHANGE INC.": "GC=F",
+    "SILVER - COMMODITY EXCHANGE INC.": "SI=F",
+    "PLATINUM - NEW YORK MERCANTILE EXCHANGE": "PL=F",
+    "PALLADIUM - NEW YORK MERCANTILE EXCHANGE": "PA=F",
+    "COPPER - COMMODITY EXCHANGE INC.": "HG=F",
+    "CRUDE OIL - NEW YORK MERCANTILE EXCHANGE": "CL=F",
+    "NATURAL GAS - NEW YORK MERCANTILE EXCHANGE": "NG=F",
+    "E-MINI S&P 500 STOCK INDEX - CHICAGO MERCANTILE EXCHANGE": "ES=F",
+    "E-MINI NASDAQ 100 STOCK INDEX - CHICAGO MERCANTILE EXCHANGE": "NQ=F",
+    "E-MINI DOW JONES STOCK INDEX - CHICAGO BOARD OF TRADE": "YM=F",
+    "EURO FX - CHICAGO MERCANTILE EXCHANGE": "6E=F",
+    "BRITISH POUND STERLING - CHICAGO MERCANTILE EXCHANGE": "6B=F",
+    "JAPANESE YEN - CHICAGO MERCANTILE EXCHANGE": "6J=F",
+    "AUSTRALIAN DOLLAR - CHICAGO MERCANTILE EXCHANGE": "6A=F",
+    "CANADIAN DOLLAR - CHICAGO MERCANTILE EXCHANGE": "6C=F",
+    "SWISS FRANC - CHICAGO MERCANTILE EXCHANGE": "6S=F",
+    "NEW ZEALAND DOLLAR - CHICAGO MERCANTILE EXCHANGE": "6N=F",
+    "BITCOIN - CHICAGO MERCANTILE EXCHANGE": "BTC-USD",
+    "ETHER - CHICAGO MERCANTILE EXCHANGE": "ETH-USD",
+    "DOLLAR INDEX - ICE FUTURES U.S.": "DX-Y.NYB",
+    "SPDR S&P 500 ETF TRUST": "SPY",
+}
 
 def filter_to_wednesday_tuesday_from_latest(df):
     """Filter DataFrame to only include data from the previous Wednesday to the following Tuesday, calculated from the latest date in the DataFrame."""
-    if df.empty or 'datetime' not in df.columns:
+    if df.empty or ('datetime' not in df.columns and 'ts' not in df.columns):
         return df
-    latest_date = df['datetime'].max().date()
+    if 'datetime' in df.columns:
+        latest_date = df['datetime'].max().date()
+    else:
+        latest_date = ts_to_datetime([df['ts'].max()])[0].date()
     days_since_wednesday = (latest_date.weekday() - 2) % 7
     last_wednesday = latest_date - timedelta(days=days_since_wednesday)
     prev_wednesday = last_wednesday - timedelta(days=7)
     prev_tuesday = prev_wednesday + timedelta(days=6)
+    if 'datetime' not in df.columns:
+        return filter_ts_range(df, *date_range_ns(prev_wednesday, prev_tuesday))
     mask = (df['datetime'].dt.date >= prev_wednesday) & (df['datetime'].dt.date <= prev_tuesday)
     return df[mask]
 
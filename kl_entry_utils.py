@@ -1,10 +1,46 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from supabase_client import get_kl_client, format_kl_zone_for_db
-import requests
+from supabase_client import get_kl_write_queue, format_kl_zone_for_db
+from price_data_utils import normalize_price_frame, date_range_ns, filter_ts_range
+from price_store import open_price_history, write_price_history, is_fresh, expected_last_bar_ns
+from http_utils import (get_json, CFTC_COT_URL, SingleFlight, StaleWhileRevalidate, CircuitOpenError,
+                        get_breaker, revalidate_in_background)
+from cot_data_utils import net_position_ratio
+from rvol_utils import add_rvol, TOD_SESSIONS
+from market_structure import swing_flags, build_structure_index
 from yahooquery import Ticker
-# import logging  # No longer needed for UI debug
+import requests
+import threading
+import time
+import logging
+
+# How old the newest stored bar may be before fetch_price_data goes back to Yahoo
+STORE_MAX_AGE = {
+    '1m': pd.Timedelta(minutes=2).value,
+    '1h': pd.Timedelta(hours=2).value,
+    '1d': pd.Timedelta(days=1).value,
+}
+# Calendar span loaded ahead of the requested range so RVol baselines are complete
+RVOL_LOOKBACK_NS = pd.Timedelta(days=TOD_SESSIONS * 7 // 5 + 4).value
+# Yahoo downloads: per-request timeout (seconds) and how many may run at once across sessions
+PRICE_TIMEOUT = 30
+PRICE_MAX_CONCURRENT = 4
+# COT reports are weekly; after this many seconds a cached frame is served stale while it refreshes
+COT_MAX_AGE = 3600
+
+_price_flights = SingleFlight()
+_price_slots = threading.BoundedSemaphore(PRICE_MAX_CONCURRENT)
+# (symbol, interval) -> epoch-ns of the last download Yahoo answered, even with no new bars
+_price_checked = {}
+_cot_frames = StaleWhileRevalidate(COT_MAX_AGE)
+
+def mark_age(df, age_seconds, stale):
+    """Record how old the data behind a frame is, for the UI's staleness notice."""
+    df.attrs['age_seconds'] = float(age_seconds)
+    df.attrs['stale'] = bool(stale)
+    return df
 
 def get_current_quarter_dates():
     today = datetime.utcnow().date()
@@ -20,7 +56,7 @@ def get_current_quarter_dates():
     end = today
     return start, end
 
-def calculate_kl_zone(candle_label, df, cot_net_change, atr_multiplier=2.0):
+def calculate_kl_zone(candle_label, df, cot_net_change, atr_multiplier=2.0, atr_period=14, swing_window=3):
     # st.write(f"[KL Calc] calculate_kl_zone: candle_label={candle_label}, cot_net_change={cot_net_change}, atr_multiplier={atr_multiplier}")
     if isinstance(candle_label, str):
         candle_label = pd.to_datetime(candle_label)
@@ -31,20 +67,20 @@ def calculate_kl_zone(candle_label, df, cot_net_change, atr_multiplier=2.0):
     row_pos = df.index.get_loc(match_idx[0])
     point_data = df.iloc[row_pos]
     try:
-        atr = calculate_atr(df).iloc[row_pos]
+        atr = calculate_atr(df, period=atr_period).iloc[row_pos]
     except Exception as e:
         # st.write(f"Error calculating ATR: {e}")
         return None
     base_zone_size = atr * atr_multiplier
     cot_weight = abs(cot_net_change) if cot_net_change is not None else 0.5
     zone_size = base_zone_size * (1 + cot_weight)
-    swing_highs, swing_lows = identify_swing_points(df)
-    # st.write(f"[KL Calc] swing_highs={swing_highs}, swing_lows={swing_lows}")
-    if row_pos in swing_highs:
+    structure = build_structure_index(df, scales=(swing_window,))
+    swing_type = structure.kl_type(row_pos, swing_window)
+    if swing_type == "Swing High":
         zone_high = point_data['High'] + zone_size
         zone_low = point_data['High'] - zone_size * 0.5
         kl_type = "Swing High"
-    elif row_pos in swing_lows:
+    elif swing_type == "Swing Low":
         zone_high = point_data['Low'] + zone_size * 0.5
         zone_low = point_data['Low'] - zone_size
         kl_type = "Swing Low"
@@ -59,8 +95,13 @@ def calculate_kl_zone(candle_label, df, cot_net_change, atr_multiplier=2.0):
         'zone_high': zone_high,
         'zone_low': zone_low,
         'atr': atr,
+        'atr_multiplier': atr_multiplier,
+        'atr_period': atr_period,
+        'swing_window': swing_window,
         'cot_net_change': cot_net_change,
         'kl_type': kl_type,
+        'structure': structure.label(row_pos, swing_window),
+        'trend': structure.at(row_pos, swing_window)['trend'],
         'zone_size': zone_size
     }
     # st.write(f"[KL Calc] KL zone result: {result}")
@@ -90,122 +131,127 @@ def calculate_atr(df, period=14):
     return atr
 
 def identify_swing_points(df, window=3):
-    st.write(f"[KL Calc] identify_swing_points: window={window}")
-    highs = df['High']
-    lows = df['Low']
-    swing_highs = []
-    swing_lows = []
-    st.write(f"[KL Calc] DataFrame index: {df.index.tolist()}")
-    st.write(f"[KL Calc] DataFrame length: {len(df)}")
-    for i in range(window, len(df) - window):
-        try:
-            high_val = highs.iloc[i]
-            high_window = highs.iloc[i - window:i + window + 1]
-            low_val = lows.iloc[i]
-            low_window = lows.iloc[i - window:i + window + 1]
-            st.write(f"[KL Calc] i={i}, high_val={high_val}, high_window={list(high_window)}, low_val={low_val}, low_window={list(low_window)}")
-            if high_val == max(high_window):
-                swing_highs.append(i)
-            if low_val == min(low_window):
-                swing_lows.append(i)
-        except Exception as e:
-            st.write(f"[KL Calc] Exception at i={i}: {e}")
-            raise
-    st.write(f"[KL Calc] Found swing_highs: {swing_highs}, swing_lows: {swing_lows}")
-    return swing_highs, swing_lows
+    """Positions of bars whose high (low) is the extreme of the 2 * window + 1 bars around them."""
+    is_high, is_low = swing_flags(df['High'].to_numpy(), df['Low'].to_numpy(), window)
+    return np.flatnonzero(is_high).tolist(), np.flatnonzero(is_low).tolist()
 
 def fetch_price_data(symbol, start_date=None, end_date=None, interval="1h"):
     """Fetch price data using yahooquery for a specific date range (current quarter up to today)."""
     try:
         if start_date is None or end_date is None:
             start_date, end_date = get_current_quarter_dates()
-        st.write(f"[DEBUG] Fetching price data for {symbol} from {start_date} to {end_date}")
-        t = Ticker(symbol, timeout=60)
-        hist = t.history(start=start_date, end=end_date, interval=interval)
-        if isinstance(hist, pd.DataFrame) and not hist.empty:
-            if isinstance(hist.index, pd.MultiIndex):
-                hist = hist.reset_index()
-            column_mapping = {
-                'open': 'Open',
-                'high': 'High', 
-                'low': 'Low',
-                'close': 'Close',
-                'volume': 'Volume',
-                'adjclose': 'Adj Close'
-            }
-            for old_col, new_col in column_mapping.items():
-                if old_col in hist.columns:
-                    hist = hist.rename(columns={old_col: new_col})
-            if 'Close' in hist.columns:
-                hist['price'] = hist['Close']
-            elif 'close' in hist.columns:
-                hist['price'] = hist['close']
-            if 'Volume' not in hist.columns and 'volume' in hist.columns:
-                hist = hist.rename(columns={'volume': 'Volume'})
-            if 'Date' in hist.columns:
-                hist = hist.rename(columns={'Date': 'date'})
-            elif 'Datetime' in hist.columns:
-                hist = hist.rename(columns={'Datetime': 'date'})
-            elif 'date' not in hist.columns and 'datetime' in hist.columns:
-                hist = hist.rename(columns={'datetime': 'date'})
-            hist["datetime"] = pd.to_datetime(hist["date"], errors="coerce", utc=True)
-            hist["datetime"] = hist["datetime"].dt.tz_convert('Etc/GMT-3')
-            hist = hist.dropna(subset=["datetime"])
-            hist = hist.sort_values("datetime")
-            if 'Volume' in hist.columns:
-                hist = hist.dropna(subset=["Volume"])
-                hist = hist[hist["Volume"] > 0]
-                hist["avg_volume"] = hist["Volume"].rolling(window=5).mean()
-                hist["rvol"] = hist["Volume"] / hist["avg_volume"]
-                hist["rvol"] = hist["rvol"].fillna(1.0)
+        start_ns, end_ns = date_range_ns(start_date, end_date)
+        # Download the RVol lookback too, so the stored history covers this range next time
+        download_start = pd.Timestamp(start_ns - RVOL_LOOKBACK_NS, tz='UTC').date()
+        key = (symbol, interval, str(download_start), str(end_date))
+        download_args = (key, download_price_data, symbol, download_start, end_date, interval)
+        # Serve from the shared memory-mapped store when it already holds recent bars
+        history = open_price_history(symbol, interval)
+        max_age = STORE_MAX_AGE.get(interval, STORE_MAX_AGE['1h'])
+        covers = history is not None and len(history) > 0 and int(history.ts[0]) <= start_ns
+        # A recent download with nothing newer (e.g. a holiday) also counts as up to date
+        checked = time.time_ns() - _price_checked.get((symbol, interval), 0) < max_age
+        stale = False
+        if covers and (checked or is_fresh(history, start_ns, max_age)):
+            # Include enough earlier sessions for the time-of-day RVol baseline
+            hist = history.slice(start_ns - RVOL_LOOKBACK_NS, end_ns).to_frame()
+        elif covers:
+            # Stale but usable: serve the last good bars now and refresh the store behind the session
+            hist = history.slice(start_ns - RVOL_LOOKBACK_NS, end_ns).to_frame()
+            stale = True
+            revalidate_in_background(key, _price_flights.do, *download_args)
+        else:
+            st.write(f"[DEBUG] Fetching price data for {symbol} from {start_date} to {end_date}")
+            # Sessions asking for the same range at the same time share one download
+            hist = _price_flights.do(*download_args)
+        if not hist.empty:
+            # How far the data lags the bar the market should have printed by now
+            age = max(expected_last_bar_ns(history) - int(hist['ts'].iloc[-1]), 0) / 1e9
+            hist = add_rvol(hist)
             # Filter to the exact date range (in case API returns more)
-            mask = (hist['datetime'].dt.date >= start_date) & (hist['datetime'].dt.date <= end_date)
-            hist = hist[mask]
-            return hist
+            hist = filter_ts_range(hist, start_ns, end_ns).reset_index(drop=True)
+            return mark_age(hist, age, stale)
         else:
             st.error(f"No data returned for symbol {symbol}")
             return pd.DataFrame()
+    except CircuitOpenError as e:
+        st.error(f"Price data for {symbol} is temporarily unavailable: {e}")
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"Error fetching price data for {symbol}: {e}")
         return pd.DataFrame()
 
+def download_price_data(symbol, start_date, end_date, interval="1h"):
+    """Download one symbol from Yahoo, normalize it and write it through to the price store.
+
+    Raises CircuitOpenError without calling Yahoo while its circuit breaker is open. Only
+    transport errors and timeouts count against the breaker; "no data" answers for one
+    symbol (yahooquery's dict/str results) mean Yahoo itself is up.
+    """
+    breaker = get_breaker('yahoo')
+    breaker.check()
+    with _price_slots:
+        try:
+            t = Ticker(symbol, timeout=PRICE_TIMEOUT)
+            hist = t.history(start=start_date, end=end_date, interval=interval)
+        except (requests.RequestException, TimeoutError, ConnectionError):
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.record_success()
+            raise
+    breaker.record_success()
+    if isinstance(hist, pd.DataFrame):
+        _price_checked[(symbol, interval)] = time.time_ns()
+    hist = normalize_price_frame(hist, symbol=symbol)
+    try:
+        write_price_history(hist, interval)
+    except OSError as e:
+        logging.error(f"Error writing {symbol} to price store: {e}")
+    return hist
+
 def fetch_cot_data(cot_asset_name, start_date=None, end_date=None):
     """Fetch COT data for the specified asset and date range (current quarter up to today)."""
     try:
         if start_date is None or end_date is None:
             start_date, end_date = get_current_quarter_dates()
-        st.write(f"[DEBUG] Fetching COT data for {cot_asset_name} from {start_date} to {end_date}")
-        base_url = "https://publicreporting.cftc.gov/resource/6dca-aqww.json"
-        where_clause = (
-            f"market_and_exchange_names = '{cot_asset_name}' AND "
-            f"report_date_as_yyyy_mm_dd BETWEEN '{start_date}' AND '{end_date}'"
-        )
-        params = {
-            "$where": where_clause,
-            "$select": "market_and_exchange_names,report_date_as_yyyy_mm_dd,noncomm_positions_long_all,noncomm_positions_short_all",
-            "$order": "report_date_as_yyyy_mm_dd ASC"
-        }
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        cot_data = response.json()
-        cot_df = pd.DataFrame.from_records(cot_data)
-        if not cot_df.empty and len(cot_df) >= 2:
-            cot_df['noncomm_positions_long_all'] = pd.to_numeric(cot_df['noncomm_positions_long_all'], errors='coerce')
-            cot_df['noncomm_positions_short_all'] = pd.to_numeric(cot_df['noncomm_positions_short_all'], errors='coerce')
-            cot_df['net_position_ratio'] = cot_df.apply(
-                lambda row: calculate_net_position_ratio(
-                    row['noncomm_positions_long_all'], 
-                    row['noncomm_positions_short_all']
-                ), axis=1
-            )
-            cot_df = cot_df.sort_values('report_date_as_yyyy_mm_dd')
-            # Filter to the exact date range
-            cot_df = cot_df[(cot_df['report_date_as_yyyy_mm_dd'] >= str(start_date)) & (cot_df['report_date_as_yyyy_mm_dd'] <= str(end_date))]
-        return cot_df
+        # The last good frame is served at once (marked stale past COT_MAX_AGE) while it refreshes
+        cot_df, age, stale = _cot_frames.get((cot_asset_name, str(start_date), str(end_date)),
+                                             download_cot_data, cot_asset_name, start_date, end_date)
+        return mark_age(cot_df.copy(), age, stale)
+    except CircuitOpenError as e:
+        st.error(f"COT data is temporarily unavailable: {e}")
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"Error fetching COT data: {e}")
         return pd.DataFrame()
 
+def download_cot_data(cot_asset_name, start_date, end_date):
+    """Query the CFTC API for one asset's reports and add net_position_ratio."""
+    logging.info(f"Fetching COT data for {cot_asset_name} from {start_date} to {end_date}")
+    where_clause = (
+        f"market_and_exchange_names = '{cot_asset_name}' AND "
+        f"report_date_as_yyyy_mm_dd BETWEEN '{start_date}' AND '{end_date}'"
+    )
+    params = {
+        "$where": where_clause,
+        "$select": "market_and_exchange_names,report_date_as_yyyy_mm_dd,noncomm_positions_long_all,noncomm_positions_short_all",
+        "$order": "report_date_as_yyyy_mm_dd ASC"
+    }
+    cot_data = get_json(CFTC_COT_URL, params=params)
+    cot_df = pd.DataFrame.from_records(cot_data)
+    if not cot_df.empty and len(cot_df) >= 2:
+        cot_df['noncomm_positions_long_all'] = pd.to_numeric(cot_df['noncomm_positions_long_all'], errors='coerce')
+        cot_df['noncomm_positions_short_all'] = pd.to_numeric(cot_df['noncomm_positions_short_all'], errors='coerce')
+        cot_df['net_position_ratio'] = net_position_ratio(
+            cot_df['noncomm_positions_long_all'],
+            cot_df['noncomm_positions_short_all']
+        )
+        cot_df = cot_df.sort_values('report_date_as_yyyy_mm_dd')
+        # Filter to the exact date range
+        cot_df = cot_df[(cot_df['report_date_as_yyyy_mm_dd'] >= str(start_date)) & (cot_df['report_date_as_yyyy_mm_dd'] <= str(end_date))]
+    return cot_df
+
 
 # 1. Fetch price (with rvol) and COT data for the latest quarter
 def fetch_quarter_data(symbol, cot_asset_name, price_interval='1h'):
@@ -214,7 +260,7 @@ def fetch_quarter_data(symbol, cot_asset_name, price_interval='1h'):
     return price_data, cot_data
 
 # 2. Accept user-specified price datetime/candle label and calculate the KL range
-def calculate_kl_for_label(price_data, cot_data, candle_label, atr_multiplier=2.0):
+def calculate_kl_for_label(price_data, cot_data, candle_label, atr_multiplier=2.0, atr_period=14, swing_window=3):
     # st.write(f"[KL Calc] calculate_kl_for_label: candle_label={candle_label}, atr_multiplier={atr_multiplier}")
     if isinstance(candle_label, str):
         date_label_to_dt = {dt.strftime('%A, %Y-%m-%d %H:%M'): dt for dt in price_data['datetime']}
@@ -241,46 +287,22 @@ def calculate_kl_for_label(price_data, cot_data, candle_label, atr_multiplier=2.
         cot_net_changes = cot_data['net_position_ratio'].diff().dropna()
         cot_weight = abs(cot_net_changes).sum()
     # st.write(f"[DEBUG] Computed cot_weight (sum of abs net changes): {cot_weight}")
-    kl_zone = calculate_kl_zone(selected_dt, price_data, cot_weight, atr_multiplier=atr_multiplier)
+    kl_zone = calculate_kl_zone(selected_dt, price_data, cot_weight, atr_multiplier=atr_multiplier,
+                                atr_period=atr_period, swing_window=swing_window)
     # st.write(f"[DEBUG] KL zone result: {kl_zone}")
     return kl_zone
 
-# 3. Make an entry in the Supabase database, using candle_label as unique identifier
+# 3. Queue an entry for the Supabase database, using candle_label as unique identifier.
+# The write-behind queue spools it locally and upserts it in the background, so the UI
+# returns immediately and sees the zone through the queue's overlay until it is flushed.
 def insert_kl_to_supabase(kl_zone, symbol, cot_asset_name, candle_label, time_period='weekly', chart_interval='1h'):
-    # st.write(f"[KL DB] insert_kl_to_supabase: symbol={symbol}, candle_label={candle_label}, time_period={time_period}, chart_interval={chart_interval}")
-    kl_client = get_kl_client()
     db_data = format_kl_zone_for_db(kl_zone, symbol, cot_asset_name, time_period)
     db_data['chart_interval'] = chart_interval
     db_data['candle_label'] = candle_label  # Add unique identifier
     try:
-        existing = kl_client.get_kl_zones_for_symbol(symbol, time_period)
-        duplicate = None
-        for entry in existing:
-            if entry.get('candle_label') == candle_label:
-                duplicate = entry
-                break
-        if duplicate:
-            # st.write(f"[KL DB] Duplicate found, updating id={duplicate['id']}")
-            try:
-                db_result = kl_client.update_kl_zone(duplicate['id'], db_data)
-                action = 'updated'
-                # st.write(f"[KL DB] Update result: {db_result}")
-                return {'action': action, 'result': db_result}
-            except Exception as e:
-                # st.write(f"[KL DB] Update failed: {e}")
-                return {'action': 'update_failed', 'error': str(e)}
-        else:
-            # st.write(f"[KL DB] No duplicate found, inserting new KL zone.")
-            try:
-                db_result = kl_client.insert_kl_zone(db_data)
-                action = 'inserted'
-                # st.write(f"[KL DB] Insert result: {db_result}")
-                return {'action': action, 'result': db_result}
-            except Exception as e:
-                # st.write(f"[KL DB] Insert failed: {e}")
-                return {'action': 'insert_failed', 'error': str(e)}
+        row = get_kl_write_queue().enqueue_upsert(db_data)
+        return {'action': 'queued', 'result': row}
     except Exception as e:
-        # st.write(f"[KL DB] DB error: {e}")
-        return {'action': 'db_error', 'error': str(e)}
+        return {'action': 'queue_failed', 'error': str(e)}
 
 # Note: The Supabase table schema should include a 'candle_label' (string, unique per symbol/period) field for uniqueness. 
\ No newline at end of file
@@ -0,0 +1,254 @@
+import argparse
+import logging
+import time
+from bisect import bisect_right
+
+import pandas as pd
+from yahooquery import Ticker
+
+from kl_cluster_utils import consolidate_kl_zones, DEFAULT_TOLERANCE_ATR
+from kl_data_utils import COT_FUTURES_MAPPING
+
+POLL_SECONDS = 60
+ZONE_RELOAD_SECONDS = 300
+
+class ZoneIndex:
+    """Sorted boundary index over a symbol's consolidated KL levels.
+
+    Levels are disjoint after consolidation, so their bounds form one sorted list
+    [low0, high0, low1, high1, ...]. ``locate`` returns the bisect position of a price:
+    an odd position means the price is inside level ``pos // 2``, an even one that it
+    sits between levels.
+    """
+
+    def __init__(self, levels):
+        self.levels = sorted(levels, key=lambda l: l['zone_low'])
+        self.bounds = []
+        for level in self.levels:
+            self.bounds.append(float(level['zone_low']))
+            self.bounds.append(float(level['zone_high']))
+
+    def __len__(self):
+        return len(self.levels)
+
+    def locate(self, price):
+        return bisect_right(self.bounds, price)
+
+class ZoneMonitor:
+    """Checks each incoming bar against the symbol's KL levels and emits enter/exit/break events."""
+
+    def __init__(self, zones_by_symbol=None, tolerance_atr=DEFAULT_TOLERANCE_ATR, on_event=None):
+        self.tolerance_atr = tolerance_atr
+        self.on_event = on_event
+        self.indexes = {}
+        self.positions = {}
+        self.entered_from = {}
+        self.last_price = {}
+        self.last_ts = {}
+        for symbol, zones in (zones_by_symbol or {}).items():
+            self.set_zones(symbol, zones)
+
+    def set_zones(self, symbol, kl_zones):
+        """Replace a symbol's zones, keeping its position consistent with the last seen price."""
+        self.indexes[symbol] = ZoneIndex(consolidate_kl_zones(kl_zones, tolerance_atr=self.tolerance_atr))
+        entered_from = self.entered_from.pop(symbol, None)
+        if symbol in self.last_price:
+            pos = self.indexes[symbol].locate(self.last_price[symbol])
+            self.positions[symbol] = pos
+            # Still inside a level: the side price came from does not change with a reload
+            if pos % 2 == 1:
+                self.entered_from[symbol] = entered_from
+        else:
+            self.positions.pop(symbol, None)
+
+    def _event(self, kind, symbol, ts, price, level_pos, side):
+        level = self.indexes[symbol].levels[level_pos]
+        return {
+            'event': kind,
+            'symbol': symbol,
+            'ts': ts,
+            'price': price,
+            'side': side,
+            'level': level['level'],
+            'zone_low': level['zone_low'],
+            'zone_high': level['zone_high'],
+            'source_ids': level['source_ids'],
+        }
+
+    def on_bar(self, symbol, ts, price):
+        """Process one bar close; returns the list of events it triggered."""
+        index = self.indexes.get(symbol)
+        if index is None or len(index) == 0:
+            return []
+        if symbol in self.last_ts and ts <= self.last_ts[symbol]:
+            return []
+        self.last_ts[symbol] = ts
+        self.last_price[symbol] = price
+        new_pos = index.locate(price)
+        old_pos = self.positions.get(symbol)
+        self.positions[symbol] = new_pos
+        if old_pos is None:
+            if new_pos % 2 == 1:
+                self.entered_from[symbol] = None
+            return []
+        if new_pos == old_pos:
+            return []
+        events = []
+        upward = new_pos > old_pos
+        side = 'below' if upward else 'above'
+        # Leaving the level we were in: back out the way we came is an exit, through it a break.
+        # If we started inside it the entry side is unknown, so it only counts as an exit
+        if old_pos % 2 == 1:
+            entered_from = self.entered_from.pop(symbol, None)
+            exit_side = 'above' if upward else 'below'
+            kind = 'break' if entered_from is not None and entered_from != exit_side else 'exit'
+            events.append(self._event(kind, symbol, ts, price, old_pos // 2, exit_side))
+        # Levels jumped over entirely within one bar are breaks
+        lo, hi = sorted((old_pos, new_pos))
+        crossed = list(range((lo + 1) // 2, hi // 2))
+        if not upward:
+            crossed.reverse()
+        for k in crossed:
+            events.append(self._event('break', symbol, ts, price, k, side))
+        if new_pos % 2 == 1:
+            self.entered_from[symbol] = side
+            events.append(self._event('enter', symbol, ts, price, new_pos // 2, side))
+        if self.on_event is not None:
+            for event in events:
+                self.on_event(event)
+        return events
+
+    def reload_zones(self, zone_loader):
+        """Replace every symbol's zones with ``zone_loader()`` ({symbol: [zone, ...]}); keeps the old ones on error."""
+        try:
+            zones_by_symbol = zone_loader()
+        except Exception as e:
+            logging.error(f"Error reloading KL zones: {e}")
+            return
+        for symbol, zones in zones_by_symbol.items():
+            self.set_zones(symbol, zones)
+
+    def run(self, feed, poll_seconds=POLL_SECONDS, max_polls=None, zone_loader=None, reload_seconds=ZONE_RELOAD_SECONDS):
+        """Poll the feed and process every bar until it is exhausted or max_polls is reached.
+
+        With a ``zone_loader``, zones are reloaded every ``reload_seconds`` so zones added or
+        deleted while the monitor runs are picked up.
+        """
+        polls = 0
+        reloaded = time.monotonic()
+        while max_polls is None or polls < max_polls:
+            started = time.monotonic()
+            if zone_loader is not None and started - reloaded >= reload_seconds:
+                self.reload_zones(zone_loader)
+                reloaded = started
+            bars = feed.poll()
+            polls += 1
+            if bars is None:
+                break
+            for symbol, ts, price in bars:
+                self.on_bar(symbol, ts, price)
+            if getattr(feed, 'exhausted', False):
+                break
+            elapsed = time.monotonic() - started
+            if poll_seconds and elapsed < poll_seconds:
+                time.sleep(poll_seconds - elapsed)
+        return polls
+
+class ReplayPriceFeed:
+    """Replays recorded bars from a CSV/Parquet file or DataFrame, one timestamp per poll.
+
+    Stand-in for a live feed in tests and backfills. Expects ``symbol``, ``datetime``
+    (or epoch-ns ``ts``) and ``close``/``Close`` columns.
+    """
+
+    def __init__(self, source):
+        if isinstance(source, pd.DataFrame):
+            df = source
+        elif str(source).endswith('.parquet'):
+            df = pd.read_parquet(source)
+        else:
+            df = pd.read_csv(source)
+        close_col = 'close' if 'close' in df.columns else 'Close'
+        if 'ts' in df.columns:
+            ts = df['ts'].to_numpy(dtype='int64')
+        else:
+            ts = pd.to_datetime(df['datetime'], utc=True).dt.as_unit('ns').astype('int64').to_numpy()
+        df = pd.DataFrame({'symbol': df['symbol'].astype(str).to_numpy(), 'ts': ts, 'close': df[close_col].to_numpy(dtype='float64')})
+        df = df.sort_values('ts', kind='stable')
+        self._batches = [
+            list(zip(group['symbol'], group['ts'], group['close']))
+            for _, group in df.groupby('ts', sort=True)
+        ]
+        self._next = 0
+        self.exhausted = not self._batches
+
+    def poll(self):
+        if self._next >= len(self._batches):
+            self.exhausted = True
+            return []
+        batch = self._batches[self._next]
+        self._next += 1
+        self.exhausted = self._next >= len(self._batches)
+        return batch
+
+class YahooPriceFeed:
+    """Polls yahooquery for the latest bars of all symbols in a single request."""
+
+    def __init__(self, symbols, interval='1m', period='1d'):
+        self.symbols = list(symbols)
+        self.interval = interval
+        self.period = period
+        self.last_ts = {}
+        self.exhausted = False
+
+    def poll(self):
+        try:
+            hist = Ticker(self.symbols, timeout=30).history(period=self.period, interval=self.interval)
+        except Exception as e:
+            logging.error(f"Error polling price feed: {e}")
+            return []
+        if not isinstance(hist, pd.DataFrame) or hist.empty:
+            return []
+        hist = hist.reset_index()
+        ts = pd.to_datetime(hist['date'], utc=True).dt.as_unit('ns').astype('int64').to_numpy()
+        bars = []
+        for symbol, t, close in zip(hist['symbol'], ts, hist['close']):
+            if pd.isna(close) or t <= self.last_ts.get(symbol, -1):
+                continue
+            bars.append((symbol, int(t), float(close)))
+        for symbol, t, _ in bars:
+            self.last_ts[symbol] = max(t, self.last_ts.get(symbol, -1))
+        bars.sort(key=lambda bar: bar[1])
+        return bars
+
+def load_zones_by_symbol(symbols, time_period='weekly'):
+    """Fetch KL zones for all symbols with one query and group them by symbol."""
+    from kl_overlay_utils import fetch_kl_zones_by_symbol
+    return fetch_kl_zones_by_symbol(symbols, time_period)
+
+def print_event(event):
+    when = pd.Timestamp(event['ts'], tz='UTC').tz_convert('Etc/GMT-3')
+    line = (f"{when:%Y-%m-%d %H:%M} {event['symbol']:<9} {event['event'].upper():<5} "
+            f"{event['zone_low']:.5f}-{event['zone_high']:.5f} from {event['side']} @ {event['price']:.5f}")
+    print(line)
+    logging.info(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch prices against stored KL zones for all mapped symbols.")
+    parser.add_argument('--replay', help="CSV/Parquet file of bars to replay instead of polling Yahoo")
+    parser.add_argument('--time-period', default='weekly')
+    parser.add_argument('--tolerance-atr', type=float, default=DEFAULT_TOLERANCE_ATR)
+    parser.add_argument('--poll-seconds', type=float, default=POLL_SECONDS)
+    parser.add_argument('--reload-seconds', type=float, default=ZONE_RELOAD_SECONDS, help="How often to reload KL zones while polling")
+    args = parser.parse_args()
+
+    symbols = list(dict.fromkeys(COT_FUTURES_MAPPING.values()))
+    monitor = ZoneMonitor(load_zones_by_symbol(symbols, args.time_period), args.tolerance_atr, on_event=print_event)
+    if args.replay:
+        monitor.run(ReplayPriceFeed(args.replay), poll_seconds=0)
+    else:
+        monitor.run(YahooPriceFeed(symbols), poll_seconds=args.poll_seconds,
+                    zone_loader=lambda: load_zones_by_symbol(symbols, args.time_period), reload_seconds=args.reload_seconds)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
-from supabase_client import get_kl_client
+from supabase_client import get_kl_client, get_kl_write_queue
 import plotly.graph_objects as go
 
-# 1. Fetch KL zones from Supabase for a given symbol and period
+# 1. Fetch KL zones for a given symbol and period (delta-synced local replica plus queued writes)
 def fetch_kl_zones(symbol, period='weekly'):
     kl_client = get_kl_client()
-    return kl_client.get_kl_zones_for_symbol(symbol, period)
+    return get_kl_write_queue().overlay(kl_client.sync_kl_zones(symbol, period), symbol, period)
+
+# 1a. Fetch KL zones for many symbols with one query, grouped by symbol
+def fetch_kl_zones_by_symbol(symbols, period='weekly'):
+    kl_client = get_kl_client()
+    zones_by_symbol = {symbol: [] for symbol in symbols}
+    for zone in kl_client.search_kl_zones(time_period=period):
+        if zone.get('symbol') in zones_by_symbol:
+            zones_by_symbol[zone['symbol']].append(zone)
+    return zones_by_symbol
 
 # 2. Overlay KL zones on a Plotly figure (horizontal lines + rectangle highlight)
 def add_kl_overlay(fig, kl_zones, price_data):
@@ -12,11 +21,12 @@ def add_kl_overlay(fig, kl_zones, price_data):
         # Draw horizontal lines
         fig.add_hline(y=kl['zone_high'], line_dash="dash", line_color="red", annotation_text="KL High")
         fig.add_hline(y=kl['zone_low'], line_dash="dash", line_color="blue", annotation_text="KL Low")
-        # Draw rectangle between the lines
+        # Draw rectangle between the lines, spanning the plot width (no per-chart dates to ship)
         fig.add_shape(
             type="rect",
-            x0=price_data['datetime'].min(),
-            x1=price_data['datetime'].max(),
+            xref="paper",
+            x0=0,
+            x1=1,
             y0=kl['zone_low'],
             y1=kl['zone_high'],
             fillcolor="rgba(255, 0, 0, 0.1)",  # semi-transparent
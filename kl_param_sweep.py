@@ -0,0 +1,172 @@
+import itertools
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from market_structure import swing_flags
+
+ATR_PERIODS = (7, 14, 21, 28)
+SWING_WINDOWS = (2, 3, 5, 8)
+ATR_MULTIPLIERS = (1.0, 1.5, 2.0, 2.5, 3.0)
+COT_WEIGHTS = (0.0, 0.25, 0.5, 1.0)
+HORIZON_BARS = 24
+
+# kl_type codes in the sweep arrays
+GENERAL, SWING_HIGH, SWING_LOW = 0, 1, 2
+KL_TYPE_NAMES = {GENERAL: 'General', SWING_HIGH: 'Swing High', SWING_LOW: 'Swing Low'}
+
+def atr_matrix(high, low, close, periods=ATR_PERIODS):
+    """ATR for several periods at once, shape (len(periods), n).
+
+    Same definition as ``calculate_atr``: rolling mean of true range with min_periods=1.
+    """
+    prev_close = np.concatenate([[np.nan], close[:-1]])
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    csum = np.concatenate([[0.0], np.cumsum(tr)])
+    pos = np.arange(1, len(tr) + 1)
+    periods = np.asarray(periods)[:, None]
+    lo = np.maximum(pos - periods, 0)
+    return (csum[pos] - csum[lo]) / (pos - lo)
+
+def swing_type_matrix(high, low, windows=SWING_WINDOWS):
+    """kl_type code per bar for several swing windows, shape (len(windows), n).
+
+    Same rule as ``identify_swing_points``: a bar is a swing high (low) when its high (low)
+    equals the max (min) of the ``2 * window + 1`` bars centred on it; swing high wins ties.
+    """
+    types = np.full((len(windows), len(high)), GENERAL, dtype='int8')
+    for k, window in enumerate(windows):
+        is_high, is_low = swing_flags(high, low, window)
+        types[k] = np.where(is_high, SWING_HIGH, np.where(is_low, SWING_LOW, GENERAL))
+    return types
+
+def forward_extremes(close, horizon=HORIZON_BARS):
+    """Max and min close over the next ``horizon`` bars (NaN where the window runs off the end)."""
+    n = len(close)
+    fut_max = np.full(n, np.nan)
+    fut_min = np.full(n, np.nan)
+    if n > horizon:
+        windows = sliding_window_view(close[1:], horizon)
+        fut_max[:len(windows)] = windows.max(axis=1)
+        fut_min[:len(windows)] = windows.min(axis=1)
+    return fut_max, fut_min
+
+def sweep_kl_zones(df, periods=ATR_PERIODS, windows=SWING_WINDOWS, multipliers=ATR_MULTIPLIERS,
+                   cot_weights=COT_WEIGHTS, horizon=HORIZON_BARS):
+    """Compute KL zones for every bar under a full parameter grid in one broadcast pass.
+
+    Zones follow ``calculate_kl_zone``: size = ATR * multiplier * (1 + cot_weight), placed
+    around the high/low depending on the swing type. Returns a dict with ``zone_high`` and
+    ``zone_low`` arrays of shape (P, W, M, C, n), ``kl_type`` codes of shape (W, n), and a
+    ``metrics`` frame with one row per combination, scored on swing bars only:
+
+    - zone_count: swing zones evaluated
+    - hold_rate: share where no close went beyond the zone's far side within ``horizon`` bars
+    - mean_width_pct: average zone width as a percent of the close
+    """
+    high = df['High'].to_numpy(dtype='float64')
+    low = df['Low'].to_numpy(dtype='float64')
+    close = df['Close'].to_numpy(dtype='float64')
+    atr = atr_matrix(high, low, close, periods)                                   # (P, n)
+    kl_type = swing_type_matrix(high, low, windows)                               # (W, n)
+    scale = np.asarray(multipliers)[:, None] * (1 + np.asarray(cot_weights))[None, :]  # (M, C)
+    size = atr[:, None, None, None, :] * scale[None, None, :, :, None]            # (P, 1, M, C, n)
+    is_high = (kl_type == SWING_HIGH)[None, :, None, None, :]
+    is_low = (kl_type == SWING_LOW)[None, :, None, None, :]
+    zone_high = np.where(is_high, high + size, np.where(is_low, low + 0.5 * size, high + 0.5 * size)).astype('float32')
+    zone_low = np.where(is_high, high - 0.5 * size, np.where(is_low, low - size, low - 0.5 * size)).astype('float32')
+
+    fut_max, fut_min = forward_extremes(close, horizon)
+    evaluable = ~np.isnan(fut_max)
+    swing = (kl_type != GENERAL) & evaluable[None, :]                             # (W, n)
+    with np.errstate(invalid='ignore'):
+        broke = np.where(is_high, fut_max > zone_high, fut_min < zone_low)        # (P, W, M, C, n)
+    counts = swing.sum(axis=1)                                                    # (W,)
+    held = (~broke & swing[None, :, None, None, :]).sum(axis=-1)                  # (P, W, M, C)
+    width_pct = 100.0 * (zone_high - zone_low) / close
+    width_sum = np.where(swing[None, :, None, None, :], width_pct, 0.0).sum(axis=-1)
+
+    grid = list(itertools.product(range(len(periods)), range(len(windows)), range(len(multipliers)), range(len(cot_weights))))
+    p, w, m, c = (np.array(axis) for axis in zip(*grid))
+    zone_count = counts[w]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        metrics = pd.DataFrame({
+            'atr_period': np.asarray(periods)[p],
+            'swing_window': np.asarray(windows)[w],
+            'atr_multiplier': np.asarray(multipliers)[m],
+            'cot_weight': np.asarray(cot_weights)[c],
+            'zone_count': zone_count,
+            'hold_rate': held[p, w, m, c] / zone_count,
+            'mean_width_pct': width_sum[p, w, m, c] / zone_count,
+        })
+    return {
+        'periods': tuple(periods),
+        'windows': tuple(windows),
+        'multipliers': tuple(multipliers),
+        'cot_weights': tuple(cot_weights),
+        'zone_high': zone_high,
+        'zone_low': zone_low,
+        'kl_type': kl_type,
+        'metrics': metrics,
+    }
+
+def zones_for(sweep, df, atr_period, swing_window, atr_multiplier, cot_weight, swings_only=True):
+    """Zone set for one grid point as a frame (swing bars only by default)."""
+    p = sweep['periods'].index(atr_period)
+    w = sweep['windows'].index(swing_window)
+    m = sweep['multipliers'].index(atr_multiplier)
+    c = sweep['cot_weights'].index(cot_weight)
+    kl_type = sweep['kl_type'][w]
+    zones = pd.DataFrame({
+        'ts': df['ts'].to_numpy() if 'ts' in df.columns else np.arange(len(df)),
+        'kl_type': pd.Categorical.from_codes(kl_type, categories=[KL_TYPE_NAMES[k] for k in sorted(KL_TYPE_NAMES)]),
+        'zone_high': sweep['zone_high'][p, w, m, c],
+        'zone_low': sweep['zone_low'][p, w, m, c],
+    })
+    return zones[kl_type != GENERAL].reset_index(drop=True) if swings_only else zones
+
+def sweep_all_symbols(prices, **grid):
+    """Run the sweep for every symbol in a long-format price frame.
+
+    Returns per-symbol metrics plus an ``overall`` frame that pools zone counts across
+    symbols, so grid points can be ranked on all assets at once.
+    """
+    per_symbol = []
+    for symbol, rows in prices.groupby('symbol', observed=True, sort=False):
+        metrics = sweep_kl_zones(rows, **grid)['metrics']
+        metrics.insert(0, 'symbol', str(symbol))
+        per_symbol.append(metrics)
+    if not per_symbol:
+        return {'per_symbol': pd.DataFrame(), 'overall': pd.DataFrame()}
+    per_symbol = pd.concat(per_symbol, ignore_index=True)
+    keys = ['atr_period', 'swing_window', 'atr_multiplier', 'cot_weight']
+    weighted = per_symbol.assign(
+        held=per_symbol['hold_rate'].fillna(0) * per_symbol['zone_count'],
+        width=per_symbol['mean_width_pct'].fillna(0) * per_symbol['zone_count'],
+    )
+    overall = weighted.groupby(keys, as_index=False)[['zone_count', 'held', 'width']].sum()
+    overall['hold_rate'] = overall.pop('held') / overall['zone_count']
+    overall['mean_width_pct'] = overall.pop('width') / overall['zone_count']
+    return {'per_symbol': per_symbol, 'overall': overall}
+
+def main():
+    import argparse
+    from cot_screener import load_price_panel
+    from kl_data_utils import COT_FUTURES_MAPPING
+    parser = argparse.ArgumentParser(description="Sweep KL zone parameters over the local price store.")
+    parser.add_argument('--interval', default='1h')
+    parser.add_argument('--bars', type=int, default=24 * 365, help="trailing bars per symbol")
+    parser.add_argument('--horizon', type=int, default=HORIZON_BARS)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('symbols', nargs='*')
+    args = parser.parse_args()
+    symbols = args.symbols or list(dict.fromkeys(COT_FUTURES_MAPPING.values()))
+    prices = load_price_panel(symbols, args.interval, tail_bars=args.bars)
+    result = sweep_all_symbols(prices, horizon=args.horizon)
+    if result['overall'].empty:
+        print("No stored prices; run `python price_store.py` first.")
+        return
+    print(result['overall'].sort_values(['hold_rate', 'mean_width_pct'], ascending=[False, True]).head(args.top).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
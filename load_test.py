@@ -0,0 +1,385 @@
+"""Headless load test for the KL dashboard, fully offline.
+
+Yahoo, the CFTC endpoint and the Supabase KL store are replaced by local stand-ins
+(synthetic prices, a local HTTP server for COT, an in-memory kl_zones table), and the
+Streamlit app is driven through ``streamlit.testing`` with many concurrent sessions:
+
+    python load_test.py --sessions 20 --concurrency 8 --iterations 5
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_kl_dashboard.py')
+FLOWS = ('load', 'select_asset', 'add_kl', 'remove_kl', 'refresh')
+PERCENTILES = (50, 95, 99)
+
+# --- Yahoo stand-in ---
+
+class SyntheticTicker:
+    """Drop-in for yahooquery.Ticker returning a seeded hourly random walk per symbol."""
+
+    latency = 0.0
+    calls = 0
+    _lock = threading.Lock()
+
+    def __init__(self, symbols, timeout=None, **kwargs):
+        self.symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+
+    def history(self, start=None, end=None, interval='1h', period=None):
+        with SyntheticTicker._lock:
+            SyntheticTicker.calls += 1
+        time.sleep(self.latency)
+        now = pd.Timestamp.now(tz='UTC').floor('h')
+        start = pd.Timestamp(start, tz='UTC') if start is not None else now - pd.Timedelta(days=90)
+        end = min(pd.Timestamp(end, tz='UTC') + pd.Timedelta(days=1), now) if end is not None else now
+        # Round the clock, so the stored history always looks fresh to fetch_price_data
+        dates = pd.date_range(start, end, freq='h', inclusive='left')
+        frames = []
+        for symbol in self.symbols:
+            rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+            close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.002, len(dates))))
+            spread = close * rng.uniform(0.0005, 0.003, len(dates))
+            frames.append(pd.DataFrame({
+                'open': np.concatenate([[close[0]], close[:-1]]) if len(close) else close,
+                'high': close + spread,
+                'low': close - spread,
+                'close': close,
+                'volume': rng.integers(100, 5000, len(dates)),
+            }, index=pd.MultiIndex.from_product([[symbol], dates], names=['symbol', 'date'])))
+        return pd.concat(frames) if frames else pd.DataFrame()
+
+# --- CFTC stand-in ---
+
+def synthetic_cot_records(names, start, end):
+    """Weekly (Tuesday) non-commercial positions for each asset between two dates."""
+    records = []
+    for name in names:
+        rng = np.random.default_rng(zlib.crc32(name.encode()))
+        for day in pd.date_range(start, end, freq='W-TUE'):
+            records.append({
+                'market_and_exchange_names': name,
+                'report_date_as_yyyy_mm_dd': day.strftime('%Y-%m-%dT00:00:00.000'),
+                'noncomm_positions_long_all': str(int(rng.integers(50_000, 250_000))),
+                'noncomm_positions_short_all': str(int(rng.integers(50_000, 250_000))),
+            })
+    return records
+
+class StubCOTHandler(BaseHTTPRequestHandler):
+    """Answers the SoQL queries the app sends to the CFTC resource, with ETag support."""
+
+    protocol_version = 'HTTP/1.1'
+    requests = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        type(self).requests += 1
+        where = parse_qs(urlparse(self.path).query).get('$where', [''])[0]
+        names = re.findall(r"'((?:[^']|'')*)'", where.split(' AND ')[0])
+        dates = re.findall(r"BETWEEN '([^']+)' AND '([^']+)'", where)
+        start, end = dates[0] if dates else ('2000-01-01', '2000-01-01')
+        body = json.dumps(synthetic_cot_records([n.replace("''", "'") for n in names], start, end)).encode()
+        etag = '"%08x"' % zlib.crc32(body)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+# --- Supabase stand-in ---
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+class _Query:
+    def __init__(self, store, op, payload=None, on_conflict=None):
+        self.store = store
+        self.op = op
+        self.payload = payload
+        self.on_conflict = on_conflict
+        self.filters = []
+        self.order_by = None
+        self.limit_to = None
+
+    def select(self, columns='*'):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def is_(self, column, value):
+        self.filters.append(lambda row: row.get(column) is None)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: (row.get(column) or '') >= value)
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, n):
+        self.limit_to = n
+        return self
+
+    def execute(self):
+        time.sleep(self.store.latency)
+        with self.store.lock:
+            if self.op == 'upsert':
+                return _Response(self.store.upsert(self.payload, self.on_conflict.split(',')))
+            matched = [row for row in self.store.rows.values() if all(f(row) for f in self.filters)]
+            if self.op == 'update':
+                now = _utcnow_iso()
+                for row in matched:
+                    row.update(self.payload, updated_at=now)
+                return _Response([dict(row) for row in matched])
+            if self.order_by:
+                column, desc = self.order_by
+                matched.sort(key=lambda row: row.get(column) or '', reverse=desc)
+            return _Response([dict(row) for row in matched[:self.limit_to]])
+
+class _Table:
+    def __init__(self, store):
+        self.store = store
+
+    def select(self, columns='*'):
+        return _Query(self.store, 'select')
+
+    def upsert(self, rows, on_conflict=None):
+        return _Query(self.store, 'upsert', rows, on_conflict)
+
+    def update(self, payload):
+        return _Query(self.store, 'update', payload)
+
+def _utcnow_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+class InMemoryKLStore:
+    """Thread-safe stand-in for the Supabase client, holding kl_zones rows in memory."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.rows = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def table(self, name):
+        return _Table(self)
+
+    def upsert(self, rows, conflict_columns):
+        rows = rows if isinstance(rows, list) else [rows]
+        now = _utcnow_iso()
+        by_key = {tuple(r.get(c) for c in conflict_columns): r for r in self.rows.values()}
+        written = []
+        for row in rows:
+            existing = by_key.get(tuple(row.get(c) for c in conflict_columns))
+            if existing is None:
+                existing = {'id': next(self._ids), 'created_at': now, 'deleted_at': None}
+                self.rows[existing['id']] = existing
+            existing.update(row, updated_at=now, deleted_at=row.get('deleted_at'))
+            written.append(dict(existing))
+        return written
+
+# --- wiring ---
+
+class StandIns:
+    """Install the local stand-ins into the app's modules, and restore the originals on exit."""
+
+    def __init__(self, workdir, yahoo_latency=0.0, kl_latency=0.0):
+        self.workdir = workdir
+        self.yahoo_latency = yahoo_latency
+        self.kl_latency = kl_latency
+        self._saved = []
+
+    def _patch(self, module, name, value):
+        self._saved.append((module, name, getattr(module, name)))
+        setattr(module, name, value)
+
+    def __enter__(self):
+        import cot_data_utils
+        import kl_entry_utils
+        import price_store
+        import supabase_client
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubCOTHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        cot_url = f'http://127.0.0.1:{self.server.server_address[1]}/resource/cot.json'
+        SyntheticTicker.latency = self.yahoo_latency
+        SyntheticTicker.calls = 0
+        StubCOTHandler.requests = 0
+        self.kl_store = InMemoryKLStore(self.kl_latency)
+        self._patch(kl_entry_utils, 'Ticker', SyntheticTicker)
+        self._patch(kl_entry_utils, 'CFTC_COT_URL', cot_url)
+        self._patch(cot_data_utils, 'CFTC_COT_URL', cot_url)
+        self._patch(price_store, 'PRICE_STORE_DIR', os.path.join(self.workdir, 'prices'))
+        self._patch(supabase_client, 'create_client', lambda url, key, options=None: self.kl_store)
+        self._patch(supabase_client, '_kl_client', supabase_client.SupabaseKLClient())
+        self._patch(supabase_client, '_write_queue', supabase_client.KLWriteBehindQueue(
+            kl_client=supabase_client._kl_client, spool_path=os.path.join(self.workdir, 'kl_write_spool.jsonl')))
+        return self
+
+    def __exit__(self, *exc):
+        import supabase_client
+        supabase_client._write_queue.close()
+        self.server.shutdown()
+        for module, name, value in reversed(self._saved):
+            setattr(module, name, value)
+
+# --- sessions ---
+
+def _button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+def _selectbox(at, label):
+    return next(s for s in at.selectbox if s.label == label)
+
+def run_session(session_id, iterations, assets, seed=0, app_path=APP_PATH, timeout=120):
+    """One simulated user: load, then per iteration select asset, add KL, remove KL, refresh.
+
+    Returns (app, [(flow, seconds, error)]); the app is returned so it stays alive for the
+    memory measurement.
+    """
+    from streamlit.testing.v1 import AppTest
+    rng = random.Random(seed * 100_003 + session_id)
+    at = AppTest.from_file(app_path, default_timeout=timeout)
+    timings = []
+
+    def timed(flow, action):
+        started = time.perf_counter()
+        error = None
+        try:
+            action()
+            if at.exception:
+                error = at.exception[0].message
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        timings.append((flow, time.perf_counter() - started, error))
+
+    def add_kl():
+        candles = _selectbox(at, "Select candle for KL calculation:")
+        candles.set_value(rng.choice(candles.options))
+        _button(at, "Add KL Entry").click().run()
+
+    def remove_kl():
+        labels = [s for s in at.selectbox if s.key == 'remove-kl-dropdown']
+        if labels:
+            labels[0].set_value(rng.choice(labels[0].options))
+            _button(at, "Remove KL Entry").click().run()
+        else:
+            at.run()
+
+    timed('load', at.run)
+    for _ in range(iterations):
+        timed('select_asset', lambda: at.sidebar.selectbox[0].set_value(rng.choice(assets)).run())
+        timed('add_kl', add_kl)
+        timed('remove_kl', remove_kl)
+        timed('refresh', lambda: _button(at, "Refresh KLs").click().run())
+    return at, timings
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def summarize(timings, wall_seconds, sessions, rss_delta):
+    """Latency percentiles per flow and overall, throughput and memory per session."""
+    frame = pd.DataFrame(timings, columns=['flow', 'seconds', 'error'])
+    rows = []
+    for flow, group in [('all', frame)] + [(f, frame[frame['flow'] == f]) for f in FLOWS]:
+        if group.empty:
+            continue
+        ms = group['seconds'].to_numpy() * 1000
+        row = {'flow': flow, 'reruns': len(group), 'errors': int(group['error'].notna().sum())}
+        row.update({f'p{p}_ms': float(np.percentile(ms, p)) for p in PERCENTILES})
+        rows.append(row)
+    return {
+        'sessions': sessions,
+        'wall_seconds': wall_seconds,
+        'throughput_rps': len(frame) / wall_seconds if wall_seconds else 0.0,
+        'memory_per_session_mb': rss_delta / sessions / 2**20 if sessions else 0.0,
+        'latency': rows,
+        'errors': frame['error'].dropna().value_counts().head(5).to_dict(),
+    }
+
+def run_load_test(sessions=10, concurrency=4, iterations=3, assets=None, seed=0,
+                  yahoo_latency=0.0, kl_latency=0.0, app_path=APP_PATH):
+    """Run ``sessions`` simulated users, ``concurrency`` at a time, against the stand-ins."""
+    from kl_data_utils import COT_FUTURES_MAPPING
+    assets = list(assets or COT_FUTURES_MAPPING.keys())
+    with tempfile.TemporaryDirectory() as workdir, StandIns(workdir, yahoo_latency, kl_latency) as stand_ins:
+        # One untimed session first, so imports and first downloads are not billed to the run
+        run_session(-1, 0, assets, seed, app_path)
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda i: run_session(i, iterations, assets, seed, app_path), range(sessions)))
+        wall = time.perf_counter() - started
+        # Sessions are still referenced here, so this counts what each one keeps alive
+        rss_delta = max(_rss_bytes() - rss_before, 0)
+        report = summarize([t for _, timings in results for t in timings], wall, sessions, rss_delta)
+        # Includes the warm-up session
+        report['upstream'] = {
+            'yahoo_downloads': SyntheticTicker.calls,
+            'cot_requests': StubCOTHandler.requests,
+            'kl_rows': len(stand_ins.kl_store.rows),
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the KL dashboard.")
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=3, help="flow cycles per session")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--yahoo-latency', type=float, default=0.0, help="seconds added to each price download")
+    parser.add_argument('--kl-latency', type=float, default=0.0, help="seconds added to each KL store request")
+    parser.add_argument('--app', default=APP_PATH)
+    parser.add_argument('--json', action='store_true', help="print the raw report as JSON")
+    args = parser.parse_args()
+    report = run_load_test(args.sessions, args.concurrency, args.iterations, seed=args.seed,
+                           yahoo_latency=args.yahoo_latency, kl_latency=args.kl_latency, app_path=args.app)
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+        return
+    print(pd.DataFrame(report['latency']).to_string(index=False, float_format='%.1f'))
+    print(f"\n{report['sessions']} sessions in {report['wall_seconds']:.1f}s: "
+          f"{report['throughput_rps']:.1f} reruns/s, {report['memory_per_session_mb']:.1f} MB/session")
+    print(f"upstream: {report['upstream']}")
+    for error, count in report['errors'].items():
+        print(f"error x{count}: {error}")
+
+if __name__ == "__main__":
+    main()
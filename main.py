@@ -5,6 +5,7 @@ st.set_page_config(page_title="KL Weekly Dashboard", page_icon="📊", layout="w
 
 import pandas as pd
 import plotly.graph_objects as go
+from chart_utils import CHART_TEMPLATE, HOVER_DATE, x_values, y_values, series_trace
 from kl_core import get_enriched_price_data, get_latest_cot_change, calculate_kl_zone
 
 COT_FUTURES_MAPPING = {
@@ -35,16 +36,14 @@ def create_price_chart_with_kl(df, kl_zone=None, title="Price Chart"):
     if not all([open_col, high_col, low_col, close_col]):
         st.error(f"Missing required OHLC columns. Available columns: {list(df.columns)}")
         return fig
-    hover_text = df['datetime'].dt.strftime('%A, %Y-%m-%d %H:%M')
     fig.add_trace(go.Candlestick(
-        x=df['datetime'],
-        open=df[open_col],
-        high=df[high_col],
-        low=df[low_col],
-        close=df[close_col],
+        x=x_values(df),
+        open=y_values(df[open_col]),
+        high=y_values(df[high_col]),
+        low=y_values(df[low_col]),
+        close=y_values(df[close_col]),
         name='OHLC',
-        hovertext=hover_text,
-        hoverinfo="text"
+        hovertemplate=HOVER_DATE + '<extra></extra>'
     ))
     # Add KL zone as horizontal lines if provided
     if kl_zone:
@@ -64,6 +63,8 @@ def create_price_chart_with_kl(df, kl_zone=None, title="Price Chart"):
             fig.add_hline(y=price, line_dash="dash", line_color=color, annotation_text=f"{kl_type} KL")
     fig.update_layout(
         title=title,
+        template=CHART_TEMPLATE,
+        xaxis_type='date',
         xaxis_title='Date',
         yaxis_title='Price',
         xaxis_rangeslider_visible=False,
@@ -75,16 +76,12 @@ def create_price_chart_with_kl(df, kl_zone=None, title="Price Chart"):
 def create_rvol_chart(df, title="RVol Chart"):
     fig = go.Figure()
     if 'rvol' in df.columns:
-        fig.add_trace(go.Bar(
-            x=df['datetime'],
-            y=df['rvol'],
-            name='RVol',
-            marker_color='blue',
-            opacity=0.7
-        ))
+        fig.add_trace(series_trace(df, 'rvol', 'RVol'))
         fig.add_hline(y=1.0, line_dash="dash", line_color="red", annotation_text="RVol = 1.0")
     fig.update_layout(
         title=title,
+        template=CHART_TEMPLATE,
+        xaxis_type='date',
         xaxis_title='Date',
         yaxis_title='RVol',
         height=300,
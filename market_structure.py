@@ -0,0 +1,258 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+STRUCTURE_SCALES = (3, 10, 30)
+
+# Swing labels against the previous swing of the same side (EQH/EQL: equal to it, e.g. a double top)
+NO_LABEL, HH, LH, HL, LL, EQH, EQL = 0, 1, 2, 3, 4, 5, 6
+LABELS = ('', 'HH', 'LH', 'HL', 'LL', 'EQH', 'EQL')
+# Largest ts -> position lookup table we build (4 bytes per interval step)
+MAX_LOOKUP_BUCKETS = 10_000_000
+
+def rolling_max(values, size):
+    """Max over every run of ``size`` consecutive values, length ``n - size + 1``.
+
+    van Herk/Gil-Werman: split into blocks of ``size``, take prefix and suffix maxima
+    inside each block, and each window is the max of one suffix and one prefix. O(n)
+    whatever the window, like a monotonic deque, but as three numpy passes.
+    """
+    values = np.asarray(values, dtype='float64')
+    n = len(values)
+    if n < size:
+        return np.empty(0)
+    blocks = np.concatenate([values, np.full((-n) % size, -np.inf)]).reshape(-1, size)
+    prefix = np.maximum.accumulate(blocks, axis=1).ravel()
+    suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    return np.maximum(suffix[:n - size + 1], prefix[size - 1:n])
+
+def rolling_min(values, size):
+    return -rolling_max(-np.asarray(values, dtype='float64'), size)
+
+def swing_flags(high, low, window):
+    """Boolean swing-high / swing-low flags: the bar's high (low) is the extreme of the
+    ``2 * window + 1`` bars centred on it, and strictly beyond the ``window`` bars before it,
+    so only the first bar of a tied plateau counts. Bars within ``window`` of either end are
+    never swings."""
+    high = np.asarray(high, dtype='float64')
+    low = np.asarray(low, dtype='float64')
+    n = len(high)
+    is_high = np.zeros(n, dtype=bool)
+    is_low = np.zeros(n, dtype=bool)
+    if n >= 2 * window + 1:
+        centre = slice(window, n - window)
+        before = slice(0, n - 2 * window)
+        is_high[centre] = (high[centre] == rolling_max(high, 2 * window + 1)) & (high[centre] > rolling_max(high, window)[before])
+        is_low[centre] = (low[centre] == rolling_min(low, 2 * window + 1)) & (low[centre] < rolling_min(low, window)[before])
+    return is_high, is_low
+
+def _label_swings(prices, up, down, equal):
+    previous = np.concatenate([[np.nan], prices[:-1]])
+    labels = np.where(prices > previous, up, np.where(prices < previous, down, equal))
+    return np.where(np.isnan(previous), NO_LABEL, labels).astype('int8')
+
+def _confirmed_level(n, positions, prices, window):
+    """Per bar: price and ordinal of the latest swing confirmed by then (``window`` bars after it)."""
+    ordinal = np.full(n, -1, dtype='int64')
+    confirmed = positions + window
+    keep = confirmed < n
+    if not keep.any():
+        return np.full(n, np.nan), ordinal
+    ordinal[confirmed[keep]] = np.arange(keep.sum())
+    ordinal = np.maximum.accumulate(ordinal)
+    level = np.where(ordinal >= 0, prices[keep][np.maximum(ordinal, 0)], np.nan)
+    return level, ordinal
+
+def _first_break(broken, ordinal):
+    """Positions of the first bar that breaks each swing level."""
+    hits = np.flatnonzero(broken)
+    if len(hits) == 0:
+        return hits
+    _, first = np.unique(ordinal[hits], return_index=True)
+    return hits[first]
+
+def scale_structure(high, low, close, window):
+    """Swings, HH/LH/HL/LL labels, breaks of structure and trend for one scale.
+
+    Returns per-bar arrays: ``swing`` (1 high, -1 low, 3 both), ``high_label`` /
+    ``low_label`` (label codes on swing bars, EQH/EQL when equal to the previous swing), ``last_high`` / ``last_low`` (latest
+    confirmed swing levels), ``bos`` (1 bullish / -1 bearish break on the breaking bar)
+    and ``trend`` (direction of the latest break, 0 before any).
+    """
+    high = np.asarray(high, dtype='float64')
+    low = np.asarray(low, dtype='float64')
+    close = np.asarray(close, dtype='float64')
+    n = len(high)
+    is_high, is_low = swing_flags(high, low, window)
+    high_pos = np.flatnonzero(is_high)
+    low_pos = np.flatnonzero(is_low)
+    high_label = np.zeros(n, dtype='int8')
+    low_label = np.zeros(n, dtype='int8')
+    high_label[high_pos] = _label_swings(high[high_pos], HH, LH, EQH)
+    low_label[low_pos] = _label_swings(low[low_pos], HL, LL, EQL)
+    last_high, high_ordinal = _confirmed_level(n, high_pos, high[high_pos], window)
+    last_low, low_ordinal = _confirmed_level(n, low_pos, low[low_pos], window)
+    with np.errstate(invalid='ignore'):
+        bos = np.zeros(n, dtype='int8')
+        bos[_first_break(close > last_high, high_ordinal)] = 1
+        bos[_first_break(close < last_low, low_ordinal)] = -1
+    last_break = np.maximum.accumulate(np.where(bos != 0, np.arange(n), -1))
+    trend = np.where(last_break >= 0, bos[np.maximum(last_break, 0)], 0).astype('int8')
+    swing = is_high.astype('int8') - is_low.astype('int8') + 3 * (is_high & is_low).astype('int8')
+    return {
+        'swing': swing,
+        'high_label': high_label,
+        'low_label': low_label,
+        'last_high': last_high.astype('float32'),
+        'last_low': last_low.astype('float32'),
+        'bos': bos,
+        'trend': trend,
+    }
+
+class StructureIndex:
+    """Market structure for one symbol at several scales, as compact per-bar arrays.
+
+    ``position`` maps a timestamp to its bar (the latest bar at or before it) through a
+    lookup table over the typical (median) bar step, so ``at`` / ``kl_type`` / ``label``
+    queries are O(1) array reads; the odd off-grid bar only costs a binary search.
+    """
+
+    def __init__(self, symbol, ts, scales, structure):
+        self.symbol = symbol
+        self.ts = np.asarray(ts, dtype='int64')
+        self.scales = tuple(scales)
+        self.structure = structure
+        self._step = None
+        self._lookup = None
+        if len(self.ts) > 1:
+            # Median, not minimum: one off-grid live bar must not shrink the step and blow up the table
+            step = int(np.median(np.diff(self.ts)))
+            buckets = (int(self.ts[-1]) - int(self.ts[0])) // step + 1 if step > 0 else 0
+            if 0 < buckets <= MAX_LOOKUP_BUCKETS:
+                grid = self.ts[0] + np.arange(buckets, dtype='int64') * step
+                self._step = step
+                self._lookup = (np.searchsorted(self.ts, grid, side='right') - 1).astype('int32')
+
+    def __len__(self):
+        return len(self.ts)
+
+    def position(self, ts):
+        """Bar position for an epoch-ns timestamp (latest bar at or before it), -1 if before the first."""
+        ts = int(ts)
+        if len(self.ts) == 0 or ts < self.ts[0]:
+            return -1
+        if self._lookup is None:
+            return int(np.searchsorted(self.ts, ts, side='right')) - 1
+        bucket = (ts - int(self.ts[0])) // self._step
+        pos = int(self._lookup[min(bucket, len(self._lookup) - 1)])
+        # Bars between the bucket start and ts (off-grid or shorter steps)
+        if pos + 1 < len(self.ts) and self.ts[pos + 1] <= ts:
+            pos = int(np.searchsorted(self.ts, ts, side='right')) - 1
+        return pos
+
+    def at(self, pos, scale):
+        """Structure state at a bar position for one scale."""
+        s = self.structure[scale]
+        swing = int(s['swing'][pos])
+        trend = int(s['trend'][pos])
+        return {
+            'swing_high': swing in (1, 3),
+            'swing_low': swing in (-1, 3),
+            'high_label': LABELS[s['high_label'][pos]],
+            'low_label': LABELS[s['low_label'][pos]],
+            'last_high': float(s['last_high'][pos]),
+            'last_low': float(s['last_low'][pos]),
+            'bos': int(s['bos'][pos]),
+            'trend': 'up' if trend > 0 else 'down' if trend < 0 else None,
+        }
+
+    def kl_type(self, pos, scale):
+        """KL zone type for a bar, as calculate_kl_zone names it (swing high wins ties)."""
+        swing = self.structure[scale]['swing'][pos]
+        return "Swing High" if swing in (1, 3) else "Swing Low" if swing == -1 else "General"
+
+    def label(self, pos, scale):
+        """HH/LH/EQH for swing highs, HL/LL/EQL for swing lows, '' otherwise (high wins ties)."""
+        s = self.structure[scale]
+        return LABELS[s['high_label'][pos] or s['low_label'][pos]]
+
+    def swings(self, scale):
+        """Swing points at one scale as a frame (ts, side, pos, label), in bar order."""
+        s = self.structure[scale]
+        rows = []
+        for side, flags, labels in (
+            ('high', np.isin(s['swing'], (1, 3)), s['high_label']),
+            ('low', np.isin(s['swing'], (-1, 3)), s['low_label']),
+        ):
+            pos = np.flatnonzero(flags)
+            rows.append(pd.DataFrame({
+                'ts': self.ts[pos],
+                'side': side,
+                'pos': pos,
+                'label': [LABELS[c] for c in labels[pos]],
+            }))
+        return pd.concat(rows, ignore_index=True).sort_values('pos', kind='stable').reset_index(drop=True)
+
+    def latest(self):
+        """State at the last bar for every scale."""
+        return {scale: self.at(len(self) - 1, scale) for scale in self.scales} if len(self) else {}
+
+def build_structure_index(df, scales=STRUCTURE_SCALES, symbol=None):
+    """Build a StructureIndex from one symbol's bars (canonical frame with ts/High/Low/Close)."""
+    high = df['High'].to_numpy(dtype='float64')
+    low = df['Low'].to_numpy(dtype='float64')
+    close = df['Close'].to_numpy(dtype='float64')
+    if 'ts' in df.columns:
+        ts = df['ts'].to_numpy(dtype='int64')
+    else:
+        ts = pd.DatetimeIndex(df['datetime']).as_unit('ns').asi8
+    if symbol is None and 'symbol' in df.columns and len(df):
+        symbol = str(df['symbol'].iloc[0])
+    structure = {scale: scale_structure(high, low, close, scale) for scale in scales}
+    return StructureIndex(symbol, ts, scales, structure)
+
+def build_structure_indexes(prices, scales=STRUCTURE_SCALES):
+    """{symbol: StructureIndex} for a long-format price frame sorted by (symbol, ts)."""
+    return {
+        str(symbol): build_structure_index(rows, scales, str(symbol))
+        for symbol, rows in prices.groupby('symbol', observed=True, sort=False)
+    }
+
+def structure_summary(indexes):
+    """One row per (symbol, scale) with the current trend and the latest swing labels."""
+    rows = []
+    for symbol, index in indexes.items():
+        for scale, state in index.latest().items():
+            swings = index.swings(scale)
+            last = swings.groupby('side').tail(1).set_index('side')['label']
+            rows.append({
+                'symbol': symbol,
+                'scale': scale,
+                'trend': state['trend'],
+                'last_high_label': last.get('high', ''),
+                'last_low_label': last.get('low', ''),
+                'last_high': state['last_high'],
+                'last_low': state['last_low'],
+            })
+    return pd.DataFrame(rows)
+
+def main():
+    from cot_screener import load_price_panel
+    from kl_data_utils import COT_FUTURES_MAPPING
+    parser = argparse.ArgumentParser(description="Market structure (HH/HL/LH/LL, breaks of structure) from the price store.")
+    parser.add_argument('--interval', default='1h')
+    parser.add_argument('--bars', type=int, default=24 * 365 * 5)
+    parser.add_argument('--scales', default=','.join(str(s) for s in STRUCTURE_SCALES))
+    parser.add_argument('symbols', nargs='*')
+    args = parser.parse_args()
+    symbols = args.symbols or list(dict.fromkeys(COT_FUTURES_MAPPING.values()))
+    scales = tuple(int(s) for s in args.scales.split(','))
+    prices = load_price_panel(symbols, args.interval, tail_bars=args.bars)
+    if prices.empty:
+        print("No stored prices; run `python price_store.py` first.")
+        return
+    print(structure_summary(build_structure_indexes(prices, scales)).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+# Timezone the dashboards display candles in
+DISPLAY_TZ = 'Etc/GMT-3'
+
+# Canonical compact price schema: one row per bar, no derived or string columns
+PRICE_SCHEMA = {
+    'ts': 'int64',          # bar open, epoch nanoseconds UTC
+    'symbol': 'category',
+    'Open': 'float32',
+    'High': 'float32',
+    'Low': 'float32',
+    'Close': 'float32',
+    'Volume': 'int64',
+}
+
+_FIELD_ALIASES = {
+    'Open': ('open', 'Open'),
+    'High': ('high', 'High'),
+    'Low': ('low', 'Low'),
+    'Close': ('close', 'Close'),
+    'Volume': ('volume', 'Volume'),
+}
+_TIME_ALIASES = ('date', 'Date', 'Datetime', 'datetime')
+_SYMBOL_ALIASES = ('symbol', 'ticker')
+
+def empty_price_frame():
+    """Return an empty frame with the canonical price schema."""
+    return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in PRICE_SCHEMA.items()})
+
+def to_epoch_ns(values):
+    """Convert datetimes (naive = UTC, tz-aware, strings or mixed offsets) to int64 epoch ns."""
+    dt = pd.to_datetime(values, errors='coerce', utc=True)
+    if isinstance(dt, pd.Series):
+        dt = pd.DatetimeIndex(dt)
+    mask = dt.isna()
+    ts = dt.as_unit('ns').asi8.copy()
+    ts[mask] = np.iinfo(np.int64).min
+    return ts
+
+def _find(hist, aliases):
+    for name in aliases:
+        if name in hist.columns:
+            return hist[name].to_numpy()
+        if name in (hist.index.names or []):
+            return hist.index.get_level_values(name).to_numpy()
+    return None
+
+def normalize_price_frame(hist, symbol=None, drop_zero_volume=True):
+    """Normalize any yahooquery history shape into the compact price schema in one pass.
+
+    Accepts the (symbol, date) MultiIndex frame, a reset frame, a DatetimeIndex frame, or
+    the dict yahooquery returns on errors. Columns are read straight out of the index or
+    frame without renaming, filtered with a single mask and sorted once by (symbol, ts).
+    """
+    if not isinstance(hist, pd.DataFrame) or hist.empty:
+        return empty_price_frame()
+    times = _find(hist, _TIME_ALIASES)
+    if times is None:
+        if not isinstance(hist.index, pd.DatetimeIndex):
+            return empty_price_frame()
+        times = hist.index
+    ts = to_epoch_ns(times)
+    symbols = _find(hist, _SYMBOL_ALIASES)
+    if symbols is None:
+        symbols = np.full(len(hist), symbol if symbol is not None else '', dtype=object)
+    fields = {}
+    for field, aliases in _FIELD_ALIASES.items():
+        values = _find(hist, aliases)
+        if values is None:
+            values = np.full(len(hist), np.nan)
+        fields[field] = pd.to_numeric(values, errors='coerce')
+    volume = np.nan_to_num(np.asarray(fields['Volume'], dtype='float64'), nan=0.0)
+    mask = (ts != np.iinfo(np.int64).min) & ~np.isnan(np.asarray(fields['Close'], dtype='float64'))
+    if drop_zero_volume:
+        mask &= volume > 0
+    codes = pd.Categorical(np.asarray(symbols)[mask].astype(str))
+    order = np.lexsort((ts[mask], codes.codes))
+    out = pd.DataFrame({
+        'ts': ts[mask][order],
+        'symbol': codes[order],
+        'Open': np.asarray(fields['Open'], dtype='float32')[mask][order],
+        'High': np.asarray(fields['High'], dtype='float32')[mask][order],
+        'Low': np.asarray(fields['Low'], dtype='float32')[mask][order],
+        'Close': np.asarray(fields['Close'], dtype='float32')[mask][order],
+        'Volume': volume[mask][order].astype('int64'),
+    })
+    # Yahoo repeats the last (still forming) bar at times; keep the latest copy
+    dup = (out['ts'].to_numpy()[1:] == out['ts'].to_numpy()[:-1]) & (out['symbol'].cat.codes.to_numpy()[1:] == out['symbol'].cat.codes.to_numpy()[:-1])
+    if dup.any():
+        out = out[np.append(~dup, True)].reset_index(drop=True)
+    return out
+
+def _localize(value, tz):
+    ts = pd.Timestamp(value)
+    return ts.tz_localize(tz) if ts.tzinfo is None else ts.tz_convert(tz)
+
+def date_range_ns(start_date, end_date, tz=DISPLAY_TZ):
+    """Return [start, end) epoch-ns bounds covering whole calendar dates in the given timezone."""
+    start = _localize(start_date, tz).normalize()
+    end = _localize(end_date, tz).normalize() + timedelta(days=1)
+    return start.as_unit('ns').value, end.as_unit('ns').value
+
+def filter_ts_range(df, start_ns, end_ns):
+    """Keep rows with start_ns <= ts < end_ns."""
+    ts = df['ts'].to_numpy()
+    return df[(ts >= start_ns) & (ts < end_ns)]
+
+def ts_to_datetime(ts, tz=DISPLAY_TZ):
+    """View int64 epoch-ns timestamps as a tz-aware DatetimeIndex."""
+    return pd.DatetimeIndex(np.asarray(ts, dtype='int64').view('datetime64[ns]')).tz_localize('UTC').tz_convert(tz)
+
+def with_datetime(df, tz=DISPLAY_TZ):
+    """Add a tz-aware ``datetime`` column for display code; apply to the slice being shown."""
+    if df.empty or 'ts' not in df.columns:
+        return df
+    df = df.copy()
+    df['datetime'] = ts_to_datetime(df['ts'].to_numpy(), tz)
+    return df
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers in one process are still serialized by the thread lock
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from price_data_utils import PRICE_SCHEMA, empty_price_frame, normalize_price_frame
+
+PRICE_STORE_DIR = os.getenv('PRICE_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'prices'))
+STORE_COLUMNS = [col for col in PRICE_SCHEMA if col != 'symbol']
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = 'LOCK'
+
+class PriceHistory:
+    """Read-only, memory-mapped view of one symbol/interval history.
+
+    Columns are numpy memmaps shared through the OS page cache, so ``slice`` returns
+    zero-copy views; ``to_frame`` copies only the rows you ask for.
+    """
+
+    def __init__(self, symbol, interval, columns, version=None):
+        self.symbol = symbol
+        self.interval = interval
+        self.columns = columns
+        self.version = version
+
+    def __len__(self):
+        return len(self.columns['ts'])
+
+    @property
+    def ts(self):
+        return self.columns['ts']
+
+    def slice(self, start_ns=None, end_ns=None):
+        """Return the bars with start_ns <= ts < end_ns as views over the mapped arrays."""
+        lo = 0 if start_ns is None else int(np.searchsorted(self.ts, start_ns, side='left'))
+        hi = len(self) if end_ns is None else int(np.searchsorted(self.ts, end_ns, side='left'))
+        return PriceHistory(self.symbol, self.interval, {col: arr[lo:hi] for col, arr in self.columns.items()}, self.version)
+
+    def to_frame(self):
+        """Materialize the view as a frame in the canonical price schema."""
+        if len(self) == 0:
+            return empty_price_frame()
+        data = {'ts': np.array(self.ts)}
+        data['symbol'] = pd.Categorical.from_codes(np.zeros(len(self), dtype='int8'), categories=[self.symbol])
+        for col in STORE_COLUMNS[1:]:
+            data[col] = np.array(self.columns[col])
+        return pd.DataFrame(data)
+
+def _symbol_dir(symbol, interval, root=None):
+    safe = re.sub(r'[^A-Za-z0-9._=^-]', '_', symbol)
+    return os.path.join(root or PRICE_STORE_DIR, safe, interval)
+
+def _current_version(base):
+    try:
+        with open(os.path.join(base, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+_open_lock = threading.Lock()
+_open_cache = {}
+
+def open_price_history(symbol, interval='1h', root=None):
+    """Open a symbol's stored history read-only; returns None if nothing is stored.
+
+    Handles are cached per process and reused until the writer publishes a new version,
+    so repeated opens from reruns or sessions cost one small file read.
+    """
+    base = _symbol_dir(symbol, interval, root)
+    version = _current_version(base)
+    if version is None:
+        return None
+    key = (base, version)
+    with _open_lock:
+        history = _open_cache.get(key)
+        if history is not None:
+            return history
+    path = os.path.join(base, version)
+    try:
+        columns = {col: np.load(os.path.join(path, f'{col}.npy'), mmap_mode='r') for col in STORE_COLUMNS}
+    except FileNotFoundError:
+        # Version was pruned between reading CURRENT and opening it; retry on the new one
+        return open_price_history(symbol, interval, root) if _current_version(base) != version else None
+    history = PriceHistory(symbol, interval, columns, version)
+    with _open_lock:
+        for stale in [k for k in _open_cache if k[0] == base]:
+            del _open_cache[stale]
+        _open_cache[key] = history
+    return history
+
+HOUR_NS = 3_600_000_000_000
+WEEK_HOURS = 168
+# Weeks of stored bars used to learn which hours of the week a symbol trades
+TRADING_PROFILE_WEEKS = 4
+
+def expected_last_bar_ns(history, now_ns=None, weeks=TRADING_PROFILE_WEEKS):
+    """Start of the latest hour up to now in which the symbol usually trades.
+
+    The trading hours come from the hour-of-week slots that hold bars in the last
+    ``weeks`` of stored history, so weekends and daily breaks don't count as missing data
+    (24/7 symbols simply have every slot). Falls back to ``now_ns`` with no history.
+    """
+    now_ns = time.time_ns() if now_ns is None else now_ns
+    if history is None or len(history) == 0:
+        return now_ns
+    recent = history.slice(int(history.ts[-1]) - weeks * WEEK_HOURS * HOUR_NS, None).ts
+    # Epoch hour 0 is a Thursday; any fixed origin works as long as it is used consistently
+    traded = np.zeros(WEEK_HOURS, dtype=bool)
+    traded[(np.asarray(recent, dtype='int64') // HOUR_NS) % WEEK_HOURS] = True
+    now_hour = now_ns // HOUR_NS
+    back = np.arange(WEEK_HOURS)
+    hits = np.flatnonzero(traded[(now_hour - back) % WEEK_HOURS])
+    return int((now_hour - back[hits[0]]) * HOUR_NS) if len(hits) else now_ns
+
+def is_fresh(history, start_ns, max_age_ns, now_ns=None):
+    """True if the stored history reaches back to start_ns and its last bar is within max_age_ns
+    of the symbol's expected last trading bar (see ``expected_last_bar_ns``)."""
+    if history is None or len(history) == 0:
+        return False
+    return int(history.ts[0]) <= start_ns and int(history.ts[-1]) >= expected_last_bar_ns(history, now_ns) - max_age_ns
+
+def load_price_frame(symbol, interval='1h', start_ns=None, end_ns=None, root=None):
+    """Return the stored bars for a range as a canonical price frame (empty if not stored)."""
+    history = open_price_history(symbol, interval, root)
+    if history is None:
+        return empty_price_frame()
+    return history.slice(start_ns, end_ns).to_frame()
+
+def _write_version(base, columns):
+    version = f'v-{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+    path = os.path.join(base, version)
+    os.makedirs(path)
+    for col in STORE_COLUMNS:
+        np.save(os.path.join(path, f'{col}.npy'), np.ascontiguousarray(columns[col], dtype=PRICE_SCHEMA[col]))
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'rows': int(len(columns['ts']))}, f)
+    # Publish atomically: readers see either the old or the new version, never a partial one
+    pointer = os.path.join(base, f'{CURRENT_FILE}.{uuid.uuid4().hex[:8]}')
+    with open(pointer, 'w') as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(base, CURRENT_FILE))
+    return version
+
+def _version_time(name):
+    try:
+        return int(name.split('-')[1])
+    except (IndexError, ValueError):
+        return None
+
+def _prune_versions(base, keep, previous):
+    """Remove versions older than ``previous``; newer ones may belong to a writer about to publish.
+
+    Readers that still map a pruned version keep working; the files go away on last close.
+    """
+    cutoff = _version_time(previous) if previous else None
+    if cutoff is None:
+        return
+    for name in os.listdir(base):
+        created = _version_time(name) if name.startswith('v-') else None
+        if created is not None and created < cutoff and name not in keep:
+            shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+@contextmanager
+def _writer_lock(base):
+    """Serialize merge, publish and prune per symbol/interval, across threads and processes."""
+    with _write_locks_guard:
+        lock = _write_locks.setdefault(base, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(base, LOCK_FILE), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def write_price_history(df, interval='1h', root=None):
+    """Merge canonical price rows into the store, one new version per symbol.
+
+    Rows for timestamps already stored are replaced by the incoming ones.
+    """
+    written = {}
+    if df is None or df.empty:
+        return written
+    for symbol, rows in df.groupby('symbol', observed=True, sort=False):
+        base = _symbol_dir(str(symbol), interval, root)
+        os.makedirs(base, exist_ok=True)
+        with _writer_lock(base):
+            written[str(symbol)] = _merge_and_publish(base, str(symbol), rows, interval, root)
+    return written
+
+def _merge_and_publish(base, symbol, rows, interval, root):
+    previous = _current_version(base)
+    existing = open_price_history(symbol, interval, root)
+    new_cols = {col: rows[col].to_numpy() for col in STORE_COLUMNS}
+    if existing is not None and len(existing):
+        merged = {col: np.concatenate([new_cols[col], existing.columns[col]]) for col in STORE_COLUMNS}
+    else:
+        merged = new_cols
+    # np.unique keeps the first occurrence, i.e. the incoming row
+    _, first = np.unique(merged['ts'], return_index=True)
+    merged = {col: arr[first] for col, arr in merged.items()}
+    if existing is not None and len(first) == len(existing) and all(
+            np.array_equal(merged[col], existing.columns[col], equal_nan=merged[col].dtype.kind == 'f') for col in STORE_COLUMNS):
+        # Nothing new (e.g. a refresh over a closed market): keep the current version
+        return len(first)
+    version = _write_version(base, merged)
+    _prune_versions(base, {version, previous}, previous)
+    return len(first)
+
+def ingest_prices(symbols, interval='1h', period='730d', root=None):
+    """Fetch history for all symbols in one yahooquery request and write it to the store."""
+    from yahooquery import Ticker
+    hist = Ticker(list(symbols), timeout=60).history(period=period, interval=interval)
+    return write_price_history(normalize_price_frame(hist), interval, root)
+
+def main():
+    from kl_data_utils import COT_FUTURES_MAPPING
+    parser = argparse.ArgumentParser(description="Refresh the memory-mapped price store.")
+    parser.add_argument('--interval', default='1h')
+    parser.add_argument('--period', default='730d')
+    parser.add_argument('symbols', nargs='*')
+    args = parser.parse_args()
+    symbols = args.symbols or list(dict.fromkeys(COT_FUTURES_MAPPING.values()))
+    for symbol, rows in ingest_prices(symbols, args.interval, args.period).items():
+        print(f"{symbol}: {rows} bars stored")
+
+if __name__ == "__main__":
+    main()
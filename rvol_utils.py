@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from price_data_utils import DISPLAY_TZ
+
+RVOL_WINDOWS = (5, 20, 60)
+TOD_SESSIONS = 20
+NS_PER_HOUR = 3_600_000_000_000
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+def _segment_starts(codes):
+    """Index of the first row of each row's symbol segment (rows sorted by symbol)."""
+    n = len(codes)
+    boundary = np.ones(n, dtype=bool)
+    boundary[1:] = codes[1:] != codes[:-1]
+    return np.maximum.accumulate(np.where(boundary, np.arange(n), 0))
+
+def rolling_means(values, codes, windows=RVOL_WINDOWS):
+    """Trailing means over several windows at once from one cumulative sum, per symbol segment.
+
+    Returns {window: array}; a row's mean uses up to ``window`` rows of its own symbol
+    (fewer at the start of a segment, like ``min_periods=1``).
+    """
+    values = np.asarray(values, dtype='float64')
+    n = len(values)
+    csum = np.concatenate([[0.0], np.cumsum(values)])
+    pos = np.arange(n)
+    start = _segment_starts(codes)
+    means = {}
+    for window in windows:
+        lo = np.maximum(pos - window + 1, start)
+        means[window] = (csum[pos + 1] - csum[lo]) / (pos + 1 - lo)
+    return means
+
+def time_of_day_rvol(ts, volume, codes, sessions=TOD_SESSIONS, tz_offset_hours=3):
+    """RVol of each hourly bar against the same hour over the previous ``sessions`` sessions.
+
+    Each symbol's trading days are numbered as sessions, bars are scattered into a
+    (symbol, session, hour) array, and trailing per-hour sums and counts come from
+    cumulative sums along the session axis before being gathered back per bar.
+    """
+    ts = np.asarray(ts, dtype='int64')
+    volume = np.asarray(volume, dtype='float64')
+    codes = np.asarray(codes, dtype='int64')
+    if len(ts) == 0:
+        return np.empty(0)
+    local = ts + tz_offset_hours * NS_PER_HOUR
+    day = local // NS_PER_DAY
+    hour = (local % NS_PER_DAY) // NS_PER_HOUR
+    day = day - day.min()
+    n_days = int(day.max()) + 1
+    # Session ordinal = rank of the bar's day among the days its symbol traded
+    days, inverse = np.unique(codes * n_days + day, return_inverse=True)
+    first = np.searchsorted(days, np.arange(int(codes.max()) + 1) * n_days)
+    session = inverse - first[codes]
+    shape = (int(codes.max()) + 1, int(session.max()) + 2, 24)
+    grid = np.zeros(shape)
+    seen = np.zeros(shape)
+    # Several bars in one hour slot (e.g. sub-hourly data) are summed into the slot
+    np.add.at(grid, (codes, session + 1, hour), volume)
+    np.add.at(seen, (codes, session + 1, hour), 1.0)
+    csum = np.cumsum(grid, axis=1)
+    ccount = np.cumsum(seen > 0, axis=1)
+    lo = np.maximum(session - sessions, 0)
+    # Previous sessions only: [session - sessions, session - 1]
+    total = csum[codes, session, hour] - csum[codes, lo, hour]
+    count = ccount[codes, session, hour] - ccount[codes, lo, hour]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        baseline = np.where(count > 0, total / count, np.nan)
+        return np.where(baseline > 0, grid[codes, session + 1, hour] / baseline, np.nan)
+
+def add_rvol(prices, windows=RVOL_WINDOWS, sessions=TOD_SESSIONS, tz=DISPLAY_TZ):
+    """Add ``rvol_<w>`` for each window, ``rvol_tod`` and the headline ``rvol`` to a canonical price frame.
+
+    Works on any number of symbols at once; rows must be sorted by (symbol, ts), as
+    ``normalize_price_frame`` returns them. All columns are float32.
+    """
+    if prices.empty:
+        return prices.assign(**{f'rvol_{w}': np.float32(np.nan) for w in windows}, rvol_tod=np.float32(np.nan), rvol=np.float32(np.nan))
+    codes = prices['symbol'].cat.codes.to_numpy() if hasattr(prices['symbol'], 'cat') else pd.factorize(prices['symbol'])[0]
+    codes = codes.astype('int64')
+    volume = prices['Volume'].to_numpy(dtype='float64')
+    columns = {}
+    for window, mean in rolling_means(volume, codes, windows).items():
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns[f'rvol_{window}'] = np.where(mean > 0, volume / mean, np.nan).astype('float32')
+    offset = pd.Timestamp(0, tz='UTC').tz_convert(tz).utcoffset()
+    offset_hours = int(offset.total_seconds() // 3600)
+    columns['rvol_tod'] = time_of_day_rvol(prices['ts'].to_numpy(), volume, codes, sessions, offset_hours).astype('float32')
+    # Headline rvol: same hour vs. previous sessions, 20-bar where that history is missing
+    fallback = columns.get('rvol_20', next(iter(columns.values())))
+    columns['rvol'] = np.where(np.isnan(columns['rvol_tod']), fallback, columns['rvol_tod']).astype('float32')
+    return prices.assign(**columns)
@@ -0,0 +1,41 @@
+import time
+import streamlit as st
+from cot_data_utils import COT_INDEX_WEEKS
+from cot_screener import load_screener
+from kl_data_utils import COT_FUTURES_MAPPING
+
+st.set_page_config(page_title="COT & KL Screener", layout="wide")
+st.title("COT & KL Screener")
+
+with st.sidebar:
+    st.header("Screener Settings")
+    time_period = st.selectbox("KL period", ['weekly', 'quarterly'], index=0)
+    index_weeks = st.slider("COT index lookback (weeks)", 13, 156, COT_INDEX_WEEKS)
+    st.markdown("---")
+    st.info("Prices come from the local price store (run `python price_store.py` to refresh it); COT is fetched from the CFTC API.")
+
+@st.cache_data(ttl=900, show_spinner=False)
+def cached_screener(time_period, index_weeks):
+    return load_screener(COT_FUTURES_MAPPING, time_period=time_period, index_weeks=index_weeks)
+
+started = time.perf_counter()
+screener = cached_screener(time_period, index_weeks)
+elapsed = time.perf_counter() - started
+if screener.attrs.get('cot_error'):
+    st.error(f"COT data is unavailable, COT columns are empty: {screener.attrs['cot_error']}")
+elif screener.attrs.get('cot_stale'):
+    st.warning(f"COT data is {screener.attrs['cot_age_seconds'] / 3600:.1f}h old; refreshing in the background.")
+
+st.dataframe(
+    screener.sort_values('zone_distance_atr', na_position='last'),
+    use_container_width=True,
+    hide_index=True,
+    column_config={
+        'net_position_ratio': st.column_config.NumberColumn("Net ratio", format="%.3f"),
+        'ratio_change': st.column_config.NumberColumn("Weekly change", format="%+.3f"),
+        'cot_index': st.column_config.ProgressColumn("COT index", min_value=0, max_value=100, format="%.0f"),
+        'zone_distance_atr': st.column_config.NumberColumn("Zone distance (ATR)", format="%.2f"),
+        'rvol': st.column_config.NumberColumn("RVol", format="%.2f"),
+    },
+)
+st.caption(f"{len(screener)} assets in {elapsed * 1000:.0f} ms")
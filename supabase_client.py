@@ -1,10 +1,17 @@
 import os
+import json
+import time
 import uuid
-from datetime import datetime
+import atexit
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional
+import httpx
 import pandas as pd
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
 from dotenv import load_dotenv
+from http_utils import backoff_delay, SingleFlight
 import streamlit as st
 import logging
 
@@ -14,6 +21,69 @@ logging.basicConfig(filename='supabase_client.log', level=logging.ERROR, format=
 # Load environment variables
 load_dotenv()
 
+# Columns served by the (symbol, time_period, created_at DESC) covering index, see supabase_schema.sql
+KL_ZONE_COLUMNS = 'id,symbol,time_period,created_at,kl_type,zone_high,zone_low,zone_size,atr_value,atr_multiplier,cot_net_change,candle_label,chart_interval'
+SYNC_COLUMNS = KL_ZONE_COLUMNS + ',updated_at,deleted_at'
+KL_ZONE_CONFLICT = 'symbol,time_period,candle_label'
+# Re-read this much before the watermark so rows committed late with an earlier updated_at are not missed
+SYNC_OVERLAP = timedelta(seconds=30)
+# purge_kl_zone_tombstones hard-deletes tombstones after 30 days by default; a replica that has not
+# synced for longer may have missed deletes that are gone from the table, so it re-reads everything
+FULL_RESYNC_AFTER = timedelta(days=29)
+# One bounded keep-alive pool shared by every session's requests; waiting for a free
+# connection counts against the pool timeout instead of opening more sockets
+KL_POOL_CONNECTIONS = 16
+KL_POOL_KEEPALIVE = 8
+KL_TIMEOUT = httpx.Timeout(30.0, connect=5.0, pool=10.0)
+
+def _parse_ts(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')) if value else None
+
+def _utcnow_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+def kl_zone_row(kl_zone_data: Dict) -> Dict:
+    """Build the kl_zones row written for a formatted KL zone (minimal required fields)"""
+    return {
+        'symbol': kl_zone_data['symbol'],
+        'kl_type': kl_zone_data['kl_type'],
+        'zone_high': float(kl_zone_data['zone_high']),
+        'zone_low': float(kl_zone_data['zone_low']),
+        'zone_size': float(kl_zone_data['zone_size']),
+        'atr_value': float(kl_zone_data['atr']),
+        'atr_multiplier': float(kl_zone_data.get('atr_multiplier', 2.0)),
+        'candle_label': str(kl_zone_data['candle_label']),
+        'time_period': kl_zone_data.get('time_period', 'weekly'),
+        'chart_interval': kl_zone_data.get('chart_interval', '1h'),
+        'deleted_at': None,  # re-adding a removed candle revives its tombstone
+    }
+
+class KLZoneReplica:
+    """Local copy of one (symbol, time_period) zone list plus its updated_at watermark."""
+
+    def __init__(self):
+        self.rows = {}
+        self.watermark = None
+        self.synced_at = None
+
+    def needs_full_sync(self, now=None):
+        if self.synced_at is None:
+            return True
+        return (now or time.time()) - self.synced_at > FULL_RESYNC_AFTER.total_seconds()
+
+    def apply(self, rows):
+        for row in rows:
+            if row.get('deleted_at'):
+                self.rows.pop(row['id'], None)
+            else:
+                self.rows[row['id']] = row
+            updated = _parse_ts(row.get('updated_at'))
+            if updated is not None and (self.watermark is None or updated > self.watermark):
+                self.watermark = updated
+
+    def zones(self):
+        return sorted(self.rows.values(), key=lambda r: r.get('created_at') or '', reverse=True)
+
 class SupabaseKLClient:
     """Client for managing KL zones in Supabase database"""
     
@@ -24,25 +94,26 @@ class SupabaseKLClient:
         if not self.supabase_url or not self.supabase_key:
             raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
         
-        self.client: Client = create_client(self.supabase_url, self.supabase_key)
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=KL_POOL_CONNECTIONS, max_keepalive_connections=KL_POOL_KEEPALIVE),
+            timeout=KL_TIMEOUT,
+            follow_redirects=True,
+        )
+        # The timeout lives on the pooled client; postgrest ignores its own when given one
+        options = ClientOptions(httpx_client=self.http_client)
+        self.client: Client = create_client(self.supabase_url, self.supabase_key, options=options)
+        self._replicas = {}
+        self._replica_lock = threading.Lock()
+        # Concurrent identical reads from different sessions share one round trip
+        self._reads = SingleFlight()
     
     def insert_kl_zone(self, kl_zone_data: Dict) -> Optional[Dict]:
         """Insert a new KL zone into the database (minimal required fields)"""
         try:
-            insert_data = {
-                'symbol': kl_zone_data['symbol'],
-                'kl_type': kl_zone_data['kl_type'],
-                'zone_high': float(kl_zone_data['zone_high']),
-                'zone_low': float(kl_zone_data['zone_low']),
-                'zone_size': float(kl_zone_data['zone_size']),
-                'atr_value': float(kl_zone_data['atr']),
-                'atr_multiplier': float(kl_zone_data.get('atr_multiplier', 2.0)),
-                'candle_label': str(kl_zone_data['candle_label']),
-                'time_period': kl_zone_data.get('time_period', 'weekly'),
-                'chart_interval': kl_zone_data.get('chart_interval', '1h'),
-            }
-            response = self.client.table('kl_zones').insert(insert_data).execute()
+            insert_data = kl_zone_row(kl_zone_data)
+            response = self.client.table('kl_zones').upsert(insert_data, on_conflict=KL_ZONE_CONFLICT).execute()
             if response.data:
+                self._apply_to_replica(response.data)
                 return response.data[0]
             else:
                 st.error("No data returned from insert operation")
@@ -55,8 +126,11 @@ class SupabaseKLClient:
     
     def get_kl_zones_for_symbol(self, symbol: str, time_period: str = 'weekly') -> List[Dict]:
         """Retrieve KL zones for a specific symbol and time period"""
+        return self._reads.do(('zones', symbol, time_period), self._get_kl_zones_for_symbol, symbol, time_period)
+
+    def _get_kl_zones_for_symbol(self, symbol: str, time_period: str) -> List[Dict]:
         try:
-            response = self.client.table('kl_zones').select('*').eq('symbol', symbol).eq('time_period', time_period).order('created_at', desc=True).execute()
+            response = self.client.table('kl_zones').select(KL_ZONE_COLUMNS).eq('symbol', symbol).eq('time_period', time_period).is_('deleted_at', 'null').order('created_at', desc=True).execute()
             
             if response.data:
                 return response.data
@@ -87,7 +161,7 @@ class SupabaseKLClient:
             return pd.DataFrame()
     
     def get_kl_zones_stats(self, symbol: str, time_period: str = 'weekly') -> Dict:
-        """Get KL zones statistics for a symbol"""
+        """Get KL zones statistics for a symbol (read from the trigger-maintained kl_zones_stats row)"""
         try:
             response = self.client.rpc('get_kl_zones_stats', {
                 'p_symbol': symbol,
@@ -113,9 +187,10 @@ class SupabaseKLClient:
             return {}
     
     def delete_kl_zone(self, zone_id: str) -> bool:
-        """Delete a KL zone by ID"""
+        """Soft-delete a KL zone by ID (leaves a tombstone for replicas to sync)"""
         try:
-            response = self.client.table('kl_zones').delete().eq('id', zone_id).execute()
+            response = self.client.table('kl_zones').update({'deleted_at': _utcnow_iso()}).eq('id', zone_id).is_('deleted_at', 'null').execute()
+            self._apply_to_replica(response.data)
             return len(response.data) > 0
         except Exception as e:
             st.error(f"Error deleting KL zone: {e}")
@@ -123,9 +198,10 @@ class SupabaseKLClient:
             return False
     
     def delete_kl_zones_for_session(self, session_id: str) -> bool:
-        """Delete all KL zones for a specific session"""
+        """Soft-delete all KL zones for a specific session"""
         try:
-            response = self.client.table('kl_zones').delete().eq('session_id', session_id).execute()
+            response = self.client.table('kl_zones').update({'deleted_at': _utcnow_iso()}).eq('session_id', session_id).is_('deleted_at', 'null').execute()
+            self._apply_to_replica(response.data)
             return len(response.data) > 0
         except Exception as e:
             st.error(f"Error deleting KL zones for session: {e}")
@@ -138,6 +214,7 @@ class SupabaseKLClient:
             response = self.client.table('kl_zones').update(update_data).eq('id', zone_id).execute()
             
             if response.data:
+                self._apply_to_replica(response.data)
                 return response.data[0]
             else:
                 return None
@@ -150,7 +227,7 @@ class SupabaseKLClient:
     def get_all_kl_zones(self, limit: int = 100) -> List[Dict]:
         """Get all KL zones with limit"""
         try:
-            response = self.client.table('kl_zones').select('*').order('created_at', desc=True).limit(limit).execute()
+            response = self.client.table('kl_zones').select('*').is_('deleted_at', 'null').order('created_at', desc=True).limit(limit).execute()
             
             if response.data:
                 return response.data
@@ -164,8 +241,11 @@ class SupabaseKLClient:
     
     def search_kl_zones(self, symbol: str = None, kl_type: str = None, time_period: str = None) -> List[Dict]:
         """Search KL zones with filters"""
+        return self._reads.do(('search', symbol, kl_type, time_period), self._search_kl_zones, symbol, kl_type, time_period)
+
+    def _search_kl_zones(self, symbol: str, kl_type: str, time_period: str) -> List[Dict]:
         try:
-            query = self.client.table('kl_zones').select('*')
+            query = self.client.table('kl_zones').select('*').is_('deleted_at', 'null')
             
             if symbol:
                 query = query.eq('symbol', symbol)
@@ -186,16 +266,308 @@ class SupabaseKLClient:
             logging.error(f"Error searching KL zones: {e}")
             return []
 
-# Global client instance
+    def sync_kl_zones(self, symbol: str, time_period: str = 'weekly', full: bool = False) -> List[Dict]:
+        """Bring the local replica for a symbol up to date and return its zones.
+
+        The first call (or full=True, or FULL_RESYNC_AFTER since the last sync) reads all live
+        rows into a new replica that replaces the old one once complete; later calls only fetch
+        rows whose updated_at is past the replica's watermark, tombstones included, and apply
+        them. On error the current replica is returned unchanged. Concurrent syncs of the same
+        replica share one request.
+        """
+        self._reads.do(('sync', symbol, time_period, full), self._sync_replica, symbol, time_period, full)
+        return self.get_replica_zones(symbol, time_period)
+
+    def _sync_replica(self, symbol: str, time_period: str, full: bool):
+        key = (symbol, time_period)
+        with self._replica_lock:
+            replica = self._replicas.get(key)
+            if replica is None or full or replica.needs_full_sync():
+                replica = None
+            watermark = replica.watermark if replica is not None else None
+        started = time.time()
+        try:
+            query = self.client.table('kl_zones').select(SYNC_COLUMNS).eq('symbol', symbol).eq('time_period', time_period)
+            if watermark is None:
+                query = query.is_('deleted_at', 'null')
+            else:
+                query = query.gte('updated_at', (watermark - SYNC_OVERLAP).isoformat())
+            rows = query.order('updated_at').execute().data or []
+            if replica is None:
+                # Readers keep the old replica until the new one is complete; own writes that land
+                # on the old one meanwhile are past the new watermark and come back with the next delta
+                fresh = KLZoneReplica()
+                fresh.apply(rows)
+                fresh.synced_at = started
+                with self._replica_lock:
+                    self._replicas[key] = fresh
+            else:
+                with self._replica_lock:
+                    replica.apply(rows)
+                    replica.synced_at = started
+        except Exception as e:
+            logging.error(f"Error syncing KL zones for {symbol}: {e}")
+
+    def get_replica_zones(self, symbol: str, time_period: str = 'weekly') -> List[Dict]:
+        """Zones from the local replica, newest first, without a round trip (empty if never synced)"""
+        with self._replica_lock:
+            replica = self._replicas.get((symbol, time_period))
+            return replica.zones() if replica is not None else []
+
+    def _apply_to_replica(self, rows: Optional[List[Dict]]):
+        # Reflect our own writes locally; the next delta sync confirms them
+        with self._replica_lock:
+            for row in rows or []:
+                replica = self._replicas.get((row.get('symbol'), row.get('time_period')))
+                if replica is not None:
+                    replica.apply([row])
+
+# Global client instance, shared by all Streamlit sessions (it is safe to use from any thread)
 _kl_client = None
+_kl_client_lock = threading.Lock()
 
 def get_kl_client() -> SupabaseKLClient:
     """Get or create a global KL client instance"""
     global _kl_client
     if _kl_client is None:
-        _kl_client = SupabaseKLClient()
+        with _kl_client_lock:
+            if _kl_client is None:
+                _kl_client = SupabaseKLClient()
     return _kl_client
 
+WRITE_SPOOL_PATH = os.getenv('KL_WRITE_SPOOL', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kl_write_spool.jsonl'))
+WRITE_BATCH_SIZE = 100
+WRITE_LINGER_SECONDS = 0.2
+WRITE_MAX_ATTEMPTS = 8
+# SQLSTATE classes for a lost connection, rolled-back transaction, exhausted resources or shutdown
+TRANSIENT_SQLSTATE_CLASSES = ('08', '40', '53', '57')
+
+def is_transient_error(error) -> bool:
+    """True for failures that say nothing about the rows: transport errors, timeouts, overloaded or
+    restarting servers. Those are retried indefinitely; anything else counts as the server rejecting the write."""
+    if isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        # Non-JSON error bodies (gateway errors) carry the HTTP status
+        return code >= 500 or code in (408, 429)
+    if isinstance(code, str):
+        # PGRST000-003: PostgREST could not reach the database or get a pooled connection
+        return code.startswith('PGRST00') or code[:2] in TRANSIENT_SQLSTATE_CLASSES
+    return False
+
+class KLWriteBehindQueue:
+    """Accepts KL zone writes immediately and flushes them to Supabase from a background worker.
+
+    Writes are coalesced by (symbol, time_period, candle_label), so only the latest write per
+    candle is sent, and go out as one batched upsert (plus one soft-delete per symbol/period)
+    per flush. Every accepted write is appended to a local JSONL spool before returning and
+    replayed on startup, so pending writes survive restarts. Failed flushes are retried with
+    jittered backoff; transient failures (see ``is_transient_error``) are retried until they
+    succeed, while writes the server rejects ``WRITE_MAX_ATTEMPTS`` times are moved to
+    ``<spool>.rejected``.
+    """
+
+    def __init__(self, kl_client=None, spool_path=WRITE_SPOOL_PATH, batch_size=WRITE_BATCH_SIZE, linger=WRITE_LINGER_SECONDS):
+        self._kl_client = kl_client
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.linger = linger
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._replay_spool()
+        self._worker = threading.Thread(target=self._run, name='kl-write-behind', daemon=True)
+        self._worker.start()
+
+    @property
+    def kl_client(self):
+        if self._kl_client is None:
+            self._kl_client = get_kl_client()
+        return self._kl_client
+
+    def enqueue_upsert(self, kl_zone_data: Dict) -> Dict:
+        """Queue an insert/update of a formatted KL zone; returns the row that will be written"""
+        row = kl_zone_row(kl_zone_data)
+        self._enqueue({'op': 'upsert', 'key': [row['symbol'], row['time_period'], row['candle_label']], 'row': row})
+        return row
+
+    def enqueue_delete(self, symbol: str, time_period: str, candle_label: str):
+        """Queue a soft delete of the zone for a candle"""
+        self._enqueue({'op': 'delete', 'key': [symbol, time_period, str(candle_label)], 'deleted_at': _utcnow_iso()})
+
+    def _enqueue(self, op):
+        op['attempts'] = 0
+        with self._cond:
+            self._append_spool(op)
+            key = tuple(op['key'])
+            self._pending.pop(key, None)
+            self._pending[key] = op
+            self._cond.notify_all()
+
+    def pending(self, symbol: str, time_period: str = 'weekly') -> List[Dict]:
+        """Writes for a symbol/period that have not reached the database yet"""
+        with self._cond:
+            return [op for key, op in self._pending.items() if key[0] == symbol and key[1] == time_period]
+
+    def overlay(self, zones: List[Dict], symbol: str, time_period: str = 'weekly') -> List[Dict]:
+        """Apply pending writes on top of zones read from the database or replica"""
+        ops = {op['key'][2]: op for op in self.pending(symbol, time_period)}
+        if not ops:
+            return zones
+        merged = [z for z in zones if str(z.get('candle_label')) not in ops]
+        for label, op in ops.items():
+            if op['op'] == 'upsert':
+                existing = next((z for z in zones if str(z.get('candle_label')) == label), {})
+                merged.insert(0, {**existing, **op['row'], 'id': existing.get('id', f'pending:{label}'), 'pending': True})
+        return merged
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued write has been flushed (or the timeout passes)"""
+        with self._cond:
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._pending, timeout)
+
+    def close(self, timeout: float = 5.0):
+        self.flush(timeout)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    # --- spool ---
+
+    def _append_spool(self, op):
+        with open(self.spool_path, 'a') as f:
+            f.write(json.dumps(op) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite_spool(self):
+        # Compact to the still-pending writes; atomic so a crash leaves the old or new spool
+        if not self._pending:
+            if os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+            return
+        tmp = f'{self.spool_path}.{uuid.uuid4().hex[:8]}'
+        with open(tmp, 'w') as f:
+            for op in self._pending.values():
+                f.write(json.dumps(op) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.spool_path)
+
+    def _replay_spool(self):
+        try:
+            with open(self.spool_path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                op = json.loads(line)
+            except ValueError:
+                continue  # torn last line from a crash mid-append
+            key = tuple(op['key'])
+            self._pending.pop(key, None)
+            self._pending[key] = op
+
+    # --- worker ---
+
+    def _write(self, ops):
+        table = self.kl_client.client.table('kl_zones')
+        upserts = [op['row'] for op in ops if op['op'] == 'upsert']
+        written = []
+        if upserts:
+            written += table.upsert(upserts, on_conflict=KL_ZONE_CONFLICT).execute().data or []
+        deletes = {}
+        for op in ops:
+            if op['op'] == 'delete':
+                deletes.setdefault((op['key'][0], op['key'][1]), []).append(op)
+        for (symbol, time_period), group in deletes.items():
+            labels = [op['key'][2] for op in group]
+            response = table.update({'deleted_at': group[-1]['deleted_at']}).eq('symbol', symbol).eq('time_period', time_period).in_('candle_label', labels).is_('deleted_at', 'null').execute()
+            written += response.data or []
+        self.kl_client._apply_to_replica(written)
+
+    def _flush_once(self) -> bool:
+        with self._cond:
+            batch = list(self._pending.items())[:self.batch_size]
+        if not batch:
+            return True
+        done, rejected, transient = [], [], False
+        try:
+            self._write([op for _, op in batch])
+            done = batch
+        except Exception as e:
+            logging.error(f"Error flushing {len(batch)} KL zone writes: {e}")
+            if is_transient_error(e):
+                # The host is down or overloaded; retry the whole batch later, one row at a time would only add load
+                transient = True
+            elif len(batch) == 1:
+                rejected = batch
+            else:
+                # Isolate the write(s) the server rejects so they cannot block the rest
+                for item in batch:
+                    try:
+                        self._write([item[1]])
+                        done.append(item)
+                    except Exception as item_error:
+                        logging.error(f"Error flushing KL zone write {item[0]}: {item_error}")
+                        if is_transient_error(item_error):
+                            transient = True
+                            break
+                        rejected.append(item)
+        with self._cond:
+            for key, op in done:
+                if self._pending.get(key) is op:
+                    del self._pending[key]
+            for key, op in rejected:
+                op['attempts'] = op.get('attempts', 0) + 1
+                if op['attempts'] >= WRITE_MAX_ATTEMPTS and self._pending.get(key) is op:
+                    logging.error(f"Giving up on KL zone write {key} after {op['attempts']} attempts")
+                    with open(f'{self.spool_path}.rejected', 'a') as f:
+                        f.write(json.dumps(op) + '\n')
+                    del self._pending[key]
+            self._rewrite_spool()
+            self._cond.notify_all()
+        return not rejected and not transient
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._stopped)
+                if self._stopped and not self._pending:
+                    return
+            # Let bursts of clicks coalesce into one batch
+            time.sleep(self.linger)
+            if self._flush_once():
+                failures = 0
+            else:
+                failures += 1
+                with self._cond:
+                    if self._stopped:
+                        return
+                    self._cond.wait(backoff_delay(failures))
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+def get_kl_write_queue() -> KLWriteBehindQueue:
+    """Get or create the global write-behind queue"""
+    global _write_queue
+    if _write_queue is None:
+        with _write_queue_lock:
+            if _write_queue is None:
+                _write_queue = KLWriteBehindQueue()
+                atexit.register(_write_queue.close)
+    return _write_queue
+
 def format_kl_zone_for_db(kl_zone: dict, symbol: str, cot_asset_name: str, time_period: str = 'weekly') -> dict:
     """Format KL zone data for database insertion (minimal required fields)."""
     return {
@@ -205,7 +577,7 @@ def format_kl_zone_for_db(kl_zone: dict, symbol: str, cot_asset_name: str, time_
         'zone_low': float(kl_zone['zone_low']),
         'zone_size': float(kl_zone['zone_size']),
         'atr': float(kl_zone['atr']),
-        'atr_multiplier': 2.0,
+        'atr_multiplier': float(kl_zone.get('atr_multiplier', 2.0)),
         'candle_label': str(kl_zone['candle_label']),  # Use candle_label as unique identifier
         'time_period': time_period,
         'chart_interval': '1h',
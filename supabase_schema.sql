@@ -3,6 +3,7 @@
 
 -- Drop the existing kl_zones table if it exists
 DROP TABLE IF EXISTS kl_zones CASCADE;
+DROP TABLE IF EXISTS kl_zones_stats CASCADE;
 
 -- Create the kl_zones table with all required fields for KL entry
 CREATE TABLE kl_zones (
@@ -21,6 +22,7 @@ CREATE TABLE kl_zones (
     chart_interval VARCHAR(10) NOT NULL DEFAULT '1h',
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    deleted_at TIMESTAMP WITH TIME ZONE, -- soft delete: tombstones let replicas sync deletions
     session_id VARCHAR(100),
     user_notes TEXT,
     CONSTRAINT valid_zone CHECK (zone_high > zone_low),
@@ -30,7 +32,13 @@ CREATE TABLE kl_zones (
 );
 
 -- Indexes for performance
-CREATE INDEX idx_kl_zones_symbol ON kl_zones(symbol);
+-- Covering index for the per-symbol zone lookup (symbol, time_period, newest first);
+-- also serves plain symbol filters through its leading column
+CREATE INDEX idx_kl_zones_symbol_period_created ON kl_zones(symbol, time_period, created_at DESC)
+    INCLUDE (id, kl_type, zone_high, zone_low, zone_size, atr_value, atr_multiplier, cot_net_change, candle_label, chart_interval)
+    WHERE deleted_at IS NULL;
+-- Delta sync: rows (including tombstones) changed since a replica's updated_at watermark
+CREATE INDEX idx_kl_zones_symbol_period_updated ON kl_zones(symbol, time_period, updated_at);
 CREATE INDEX idx_kl_zones_datetime ON kl_zones(created_at);
 CREATE INDEX idx_kl_zones_type ON kl_zones(kl_type);
 CREATE INDEX idx_kl_zones_period ON kl_zones(time_period);
@@ -71,6 +79,7 @@ SELECT
     created_at,
     user_notes
 FROM kl_zones
+WHERE deleted_at IS NULL
 ORDER BY created_at DESC;
 
 -- Create a function to get KL zones for a specific symbol and time period
@@ -112,11 +121,106 @@ BEGIN
     FROM kl_zones kz
     WHERE kz.symbol = p_symbol 
     AND kz.time_period = p_time_period
+    AND kz.deleted_at IS NULL
     ORDER BY kz.created_at DESC;
 END;
 $$ LANGUAGE plpgsql;
 
--- Create a function to get KL zones summary statistics
+-- Per-symbol statistics, kept up to date incrementally by triggers so reads never scan kl_zones
+CREATE TABLE IF NOT EXISTS kl_zones_stats (
+    symbol VARCHAR(20) NOT NULL,
+    time_period VARCHAR(10) NOT NULL,
+    total_zones BIGINT NOT NULL DEFAULT 0,
+    sum_zone_size DECIMAL(20, 5) NOT NULL DEFAULT 0,
+    sum_cot_change DECIMAL(20, 6) NOT NULL DEFAULT 0,
+    cot_change_count BIGINT NOT NULL DEFAULT 0,
+    swing_high_count BIGINT NOT NULL DEFAULT 0,
+    swing_low_count BIGINT NOT NULL DEFAULT 0,
+    general_count BIGINT NOT NULL DEFAULT 0,
+    latest_kl_datetime TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (symbol, time_period)
+);
+
+-- Add (p_sign = 1) or remove (p_sign = -1) one live row's contribution to its symbol's stats
+CREATE OR REPLACE FUNCTION kl_zones_stats_apply(r kl_zones, p_sign INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO kl_zones_stats AS s (
+        symbol, time_period, total_zones, sum_zone_size, sum_cot_change, cot_change_count,
+        swing_high_count, swing_low_count, general_count, latest_kl_datetime
+    ) VALUES (
+        r.symbol, r.time_period, p_sign, p_sign * r.zone_size,
+        p_sign * COALESCE(r.cot_net_change, 0), p_sign * (r.cot_net_change IS NOT NULL)::INTEGER,
+        p_sign * (r.kl_type = 'Swing High')::INTEGER,
+        p_sign * (r.kl_type = 'Swing Low')::INTEGER,
+        p_sign * (r.kl_type = 'General')::INTEGER,
+        CASE WHEN p_sign > 0 THEN r.created_at END
+    )
+    ON CONFLICT (symbol, time_period) DO UPDATE SET
+        total_zones = s.total_zones + EXCLUDED.total_zones,
+        sum_zone_size = s.sum_zone_size + EXCLUDED.sum_zone_size,
+        sum_cot_change = s.sum_cot_change + EXCLUDED.sum_cot_change,
+        cot_change_count = s.cot_change_count + EXCLUDED.cot_change_count,
+        swing_high_count = s.swing_high_count + EXCLUDED.swing_high_count,
+        swing_low_count = s.swing_low_count + EXCLUDED.swing_low_count,
+        general_count = s.general_count + EXCLUDED.general_count,
+        latest_kl_datetime = GREATEST(s.latest_kl_datetime, EXCLUDED.latest_kl_datetime);
+
+    -- A removed row may have been the latest one; re-read the max through the covering index
+    IF p_sign < 0 THEN
+        UPDATE kl_zones_stats s
+        SET latest_kl_datetime = (
+            SELECT MAX(kz.created_at) FROM kl_zones kz
+            WHERE kz.symbol = r.symbol AND kz.time_period = r.time_period
+            AND kz.deleted_at IS NULL
+        )
+        WHERE s.symbol = r.symbol AND s.time_period = r.time_period
+        AND s.latest_kl_datetime IS NOT DISTINCT FROM r.created_at;
+    END IF;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION maintain_kl_zones_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Tombstoned rows do not count, so soft deletes and restores move rows out of / into the stats
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.deleted_at IS NULL THEN
+        PERFORM kl_zones_stats_apply(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.deleted_at IS NULL THEN
+        PERFORM kl_zones_stats_apply(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER maintain_kl_zones_stats
+    AFTER INSERT OR UPDATE OR DELETE ON kl_zones
+    FOR EACH ROW
+    EXECUTE FUNCTION maintain_kl_zones_stats();
+
+-- Backfill stats for rows that existed before the triggers (no-op on a fresh table)
+INSERT INTO kl_zones_stats (
+    symbol, time_period, total_zones, sum_zone_size, sum_cot_change, cot_change_count,
+    swing_high_count, swing_low_count, general_count, latest_kl_datetime
+)
+SELECT
+    symbol,
+    time_period,
+    COUNT(*),
+    COALESCE(SUM(zone_size), 0),
+    COALESCE(SUM(cot_net_change), 0),
+    COUNT(cot_net_change),
+    COUNT(*) FILTER (WHERE kl_type = 'Swing High'),
+    COUNT(*) FILTER (WHERE kl_type = 'Swing Low'),
+    COUNT(*) FILTER (WHERE kl_type = 'General'),
+    MAX(created_at)
+FROM kl_zones
+WHERE deleted_at IS NULL
+GROUP BY symbol, time_period
+ON CONFLICT (symbol, time_period) DO NOTHING;
+
+-- Create a function to get KL zones summary statistics (single primary-key lookup)
 CREATE OR REPLACE FUNCTION get_kl_zones_stats(
     p_symbol VARCHAR(20),
     p_time_period VARCHAR(10) DEFAULT 'weekly'
@@ -133,21 +237,28 @@ RETURNS TABLE (
 BEGIN
     RETURN QUERY
     SELECT 
-        COUNT(*) as total_zones,
-        AVG(zone_size) as avg_zone_size,
-        AVG(cot_net_change) as avg_cot_change,
-        COUNT(*) FILTER (WHERE kl_type = 'Swing High') as swing_high_count,
-        COUNT(*) FILTER (WHERE kl_type = 'Swing Low') as swing_low_count,
-        COUNT(*) FILTER (WHERE kl_type = 'General') as general_count,
-        MAX(created_at) as latest_kl_datetime
-    FROM kl_zones
-    WHERE symbol = p_symbol 
-    AND time_period = p_time_period;
+        COALESCE(s.total_zones, 0) as total_zones,
+        (s.sum_zone_size / NULLIF(s.total_zones, 0))::DECIMAL(15, 5) as avg_zone_size,
+        (s.sum_cot_change / NULLIF(s.cot_change_count, 0))::DECIMAL(10, 6) as avg_cot_change,
+        COALESCE(s.swing_high_count, 0) as swing_high_count,
+        COALESCE(s.swing_low_count, 0) as swing_low_count,
+        COALESCE(s.general_count, 0) as general_count,
+        s.latest_kl_datetime
+    -- Always one row, zero counts when the symbol has no stats row yet (as the old aggregate did)
+    FROM (SELECT 1) AS one
+    LEFT JOIN kl_zones_stats s
+        ON s.symbol = p_symbol
+        AND s.time_period = p_time_period;
 END;
 $$ LANGUAGE plpgsql;
 
 -- Enable Row Level Security (for future user authentication)
 ALTER TABLE kl_zones ENABLE ROW LEVEL SECURITY;
+ALTER TABLE kl_zones_stats ENABLE ROW LEVEL SECURITY;
+
+-- Stats are written only by the triggers; clients just read them
+CREATE POLICY "Allow public read access" ON kl_zones_stats
+    FOR SELECT USING (true);
 
 -- Create policy for public read access (adjust based on your security needs)
 CREATE POLICY "Allow public read access" ON kl_zones
@@ -190,4 +301,21 @@ BEGIN
         ALTER TABLE kl_zones
         ADD CONSTRAINT unique_symbol_period_candlelabel UNIQUE (symbol, time_period, candle_label);
     END IF;
-END$$; 
\ No newline at end of file
+END$$;
+
+ALTER TABLE kl_zones
+ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
+
+-- Hard-delete tombstones older than the retention window. SupabaseKLClient replicas re-read
+-- everything when they have not synced for FULL_RESYNC_AFTER (29 days, under this default);
+-- after purging with a shorter interval, call sync_kl_zones(full=True) on running clients
+CREATE OR REPLACE FUNCTION purge_kl_zone_tombstones(p_older_than INTERVAL DEFAULT '30 days')
+RETURNS BIGINT AS $$
+DECLARE
+    purged BIGINT;
+BEGIN
+    DELETE FROM kl_zones WHERE deleted_at IS NOT NULL AND deleted_at < NOW() - p_older_than;
+    GET DIAGNOSTICS purged = ROW_COUNT;
+    RETURN purged;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from chart_utils import FigureCache, price_figure, series_figure, frame_fingerprint, x_values, GL_THRESHOLD
+from price_data_utils import with_datetime
+
+def weekly_bars(n=120):
+    rng = np.random.default_rng(0)
+    close = 100.0 + np.cumsum(rng.normal(0, 0.5, n))
+    ts = pd.date_range('2024-01-03', periods=n, freq='h', tz='UTC').as_unit('ns').asi8
+    return with_datetime(pd.DataFrame({
+        'ts': ts,
+        'symbol': pd.Categorical(['GC=F'] * n),
+        'Open': close.astype('float32'),
+        'High': (close + 0.5).astype('float32'),
+        'Low': (close - 0.5).astype('float32'),
+        'Close': close.astype('float32'),
+        'Volume': rng.integers(100, 1000, n),
+    }))
+
+def test_x_values_show_display_time():
+    df = weekly_bars(3)
+    shown = pd.to_datetime(x_values(df), unit='ms')
+    assert (shown == df['datetime'].dt.tz_localize(None)).all()
+
+def test_price_figure_is_compact():
+    df = weekly_bars()
+    levels = [{'zone_low': 99.0, 'zone_high': 100.0}, {'zone_low': 104.0, 'zone_high': 105.0}]
+    fig = price_figure(df, levels, title='GC=F')
+    trace = fig.data[0]
+    assert trace.hovertext is None and '%{x|' in trace.hovertemplate
+    legacy = go.Figure(go.Candlestick(
+        x=df['datetime'], open=df['Open'].astype('float64'), high=df['High'].astype('float64'),
+        low=df['Low'].astype('float64'), close=df['Close'].astype('float64'),
+        hovertext=df['datetime'].dt.strftime('%A, %Y-%m-%d %H:%M'), hoverinfo='text',
+    ))
+    assert len(fig.to_json()) < len(legacy.to_json()) / 2
+
+def test_long_series_use_webgl():
+    assert series_figure(weekly_bars(50), 'Volume', 'Volume').data[0].type == 'bar'
+    assert series_figure(weekly_bars(GL_THRESHOLD + 1), 'Volume', 'Volume').data[0].type == 'scattergl'
+
+def test_figure_cache_reuses_unchanged_figures():
+    cache, built = FigureCache(), []
+    def build(df):
+        built.append(1)
+        return series_figure(df, 'Volume', 'Volume')
+    df = weekly_bars()
+    key = frame_fingerprint(df, ['ts', 'Volume'])
+    first = cache.get_or_build('volume', key, build, df)
+    second = cache.get_or_build('volume', frame_fingerprint(df.copy(), ['ts', 'Volume']), build, df)
+    assert first is second and len(built) == 1
+    stats = cache.stats()['volume']
+    assert stats['reused'] and stats['bytes'] > 0 and stats['points'] == len(df)
@@ -0,0 +1,148 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import kl_entry_utils
+import supabase_client
+from http_utils import SingleFlight, ConditionalCache, create_session, get_json
+from test_http_utils import StubCFTCHandler, start_stub_server, BODY
+
+THREADS = 64
+
+def run_concurrently(fn, threads=THREADS):
+    """Call fn from many threads released at the same instant and return their results."""
+    barrier = threading.Barrier(threads)
+    def call(_):
+        barrier.wait()
+        return fn()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(call, range(threads)))
+
+def test_single_flight_runs_once_per_key():
+    flights, calls = SingleFlight(), []
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return object()
+    results = run_concurrently(lambda: flights.do('GC=F', slow))
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert flights.in_flight() == 0
+
+def test_single_flight_shares_errors_and_does_not_cache_them():
+    flights = SingleFlight()
+    def failing():
+        time.sleep(0.1)
+        raise RuntimeError("upstream down")
+    def call():
+        try:
+            flights.do('GC=F', failing)
+        except RuntimeError as e:
+            return str(e)
+    assert set(run_concurrently(call)) == {"upstream down"}
+    assert flights.do('GC=F', lambda: 'ok') == 'ok'
+
+def test_get_json_coalesces_identical_requests():
+    server, url = start_stub_server()
+    try:
+        StubCFTCHandler.delay = 0.2
+        session, cache = create_session(), ConditionalCache()
+        results = run_concurrently(lambda: get_json(url, params={'$where': 'x'}, session=session, cache=cache))
+        assert all(r == BODY for r in results)
+        assert len(StubCFTCHandler.hits) == 1
+    finally:
+        server.shutdown()
+
+def test_get_kl_client_is_created_once(monkeypatch):
+    created = []
+    class SlowClient:
+        def __init__(self):
+            created.append(self)
+            time.sleep(0.05)
+    monkeypatch.setattr(supabase_client, 'SupabaseKLClient', SlowClient)
+    monkeypatch.setattr(supabase_client, '_kl_client', None)
+    clients = run_concurrently(supabase_client.get_kl_client)
+    assert len(created) == 1
+    assert all(c is created[0] for c in clients)
+
+class CountingQuery:
+    def __init__(self, db):
+        self.db = db
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        self.db.requests += 1
+        time.sleep(0.2)
+        return type('Response', (), {'data': [{'id': 1, 'symbol': 'GC=F', 'time_period': 'weekly', 'updated_at': '2024-01-01T00:00:00+00:00'}]})()
+
+class CountingDB:
+    requests = 0
+
+    def table(self, name):
+        return CountingQuery(self)
+
+def test_kl_reads_are_coalesced(monkeypatch):
+    db = CountingDB()
+    monkeypatch.setattr(supabase_client, 'create_client', lambda url, key, options=None: db)
+    client = supabase_client.SupabaseKLClient()
+    results = run_concurrently(lambda: client.sync_kl_zones('GC=F', 'weekly'))
+    assert db.requests == 1
+    assert all(r == results[0] and len(r) == 1 for r in results)
+    run_concurrently(lambda: client.get_kl_zones_for_symbol('GC=F', 'weekly'))
+    assert db.requests == 2
+
+def fake_ticker(result=None, delay=0.0, calls=None):
+    """A yahooquery Ticker stand-in. history() returns ``result`` if given, otherwise hourly
+    bars from start to end; it sleeps ``delay`` seconds and appends the symbol to ``calls``."""
+    class FakeTicker:
+        def __init__(self, symbol, timeout=None):
+            self.symbol = symbol
+        def history(self, start=None, end=None, interval=None):
+            if calls is not None:
+                calls.append(self.symbol)
+            time.sleep(delay)
+            if result is not None:
+                return result
+            index = pd.MultiIndex.from_product(
+                [[self.symbol], pd.date_range(start, end, freq='h', tz='UTC')], names=['symbol', 'date'])
+            return pd.DataFrame({'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.5, 'volume': 100}, index=index)
+    return FakeTicker
+
+def test_price_fetch_is_coalesced(monkeypatch):
+    downloads = []
+    monkeypatch.setattr(kl_entry_utils, 'Ticker', fake_ticker(delay=0.2, calls=downloads))
+    monkeypatch.setattr(kl_entry_utils, 'open_price_history', lambda symbol, interval: None)
+    monkeypatch.setattr(kl_entry_utils, 'write_price_history', lambda df, interval: None)
+    start, end = pd.Timestamp('2024-01-01').date(), pd.Timestamp('2024-01-03').date()
+    frames = run_concurrently(lambda: kl_entry_utils.fetch_price_data('GC=F', start, end), threads=32)
+    assert downloads == ['GC=F']
+    assert len(frames[0]) and all(len(f) == len(frames[0]) for f in frames)
+
+def _write_batches(root, worker, batches=8):
+    import numpy as np
+    import price_store
+    for batch in range(batches):
+        ts = pd.date_range('2024-01-01', periods=24, freq='h', tz='UTC') + pd.Timedelta(days=worker * batches + batch)
+        price_store.write_price_history(pd.DataFrame({
+            'ts': ts.as_unit('ns').asi8,
+            'symbol': pd.Categorical(['GC=F'] * len(ts)),
+            'Open': np.float32(1), 'High': np.float32(2), 'Low': np.float32(0.5), 'Close': np.float32(1.5),
+            'Volume': np.int64(100),
+        }), '1h', root)
+
+def test_concurrent_store_writers_keep_current_valid(tmp_path):
+    import multiprocessing
+    import price_store
+    # Separate processes, so the lock file (not just the thread lock) is what serializes them
+    workers = [multiprocessing.Process(target=_write_batches, args=(str(tmp_path), w)) for w in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+        assert p.exitcode == 0
+    history = price_store.open_price_history('GC=F', '1h', str(tmp_path))
+    assert history is not None and len(history) == 4 * 8 * 24
@@ -0,0 +1,102 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from cot_correlation import CorrelationEngine, MIN_PAIRS
+
+def synthetic_inputs(assets=3, weeks=160, seed=0):
+    rng = np.random.default_rng(seed)
+    mapping = {f'ASSET {i}': f'S{i}' for i in range(assets)}
+    dates = pd.date_range('2020-01-07', periods=weeks, freq='7D')
+    cot = pd.DataFrame({
+        'asset': np.repeat(list(mapping), weeks),
+        'report_date': np.tile(dates, assets),
+        'net_position_ratio': rng.normal(0, 0.02, assets * weeks).cumsum(),
+    })
+    # A few missing reports, like holiday weeks
+    cot = cot.drop(rng.choice(len(cot), assets * 3, replace=False)).reset_index(drop=True)
+    ts = pd.date_range('2020-01-01', dates[-1] + pd.Timedelta(days=2), freq='h', tz='UTC')
+    prices = pd.concat([
+        pd.DataFrame({
+            'ts': ts.as_unit('ns').asi8,
+            'symbol': symbol,
+            'Close': np.exp(rng.normal(0, 0.002, len(ts)).cumsum()).astype('float32'),
+        })
+        for symbol in mapping.values()
+    ], ignore_index=True)
+    return mapping, dates, cot, prices
+
+def test_matches_pandas_rolling_corr():
+    mapping, _, cot, prices = synthetic_inputs()
+    engine = CorrelationEngine(mapping, lags=(-2, 0, 3), windows=(13, 52))
+    engine.update(cot, prices)
+    for l, lag in enumerate(engine.lags):
+        for w, window in enumerate(engine.windows):
+            for a in range(len(mapping)):
+                x = pd.Series(engine.x[:, a])
+                y = pd.Series([engine.r[t + lag, a] if 0 <= t + lag < len(engine.r) else np.nan for t in range(len(x))])
+                expected = x.rolling(window, min_periods=1).corr(y)
+                pairs = (x.notna() & y.notna()).astype(int).rolling(window, min_periods=1).sum()
+                expected[pairs < MIN_PAIRS] = np.nan
+                got = engine.corr[l, w, :, a]
+                assert np.array_equal(np.isnan(got), expected.isna().to_numpy())
+                assert np.allclose(got[~np.isnan(got)], expected.dropna(), atol=1e-4)
+
+def test_incremental_update_matches_full_rebuild(tmp_path):
+    mapping, dates, cot, prices = synthetic_inputs()
+    engine = CorrelationEngine(mapping)
+    cutoff = dates[-3]
+    engine.update(cot[cot['report_date'] < cutoff], prices[prices['ts'] < pd.Timestamp(cutoff, tz='UTC').value])
+    path = str(tmp_path / 'corr.npz')
+    engine.save(path)
+    # New reports and the prices behind them arrive; only the tail is recomputed
+    resumed = CorrelationEngine(mapping)
+    assert resumed.load(path)
+    stats = resumed.update(cot, prices)
+    assert stats['recomputed_weeks'] < 10
+    full = CorrelationEngine(mapping)
+    full.update(cot, prices)
+    assert np.allclose(resumed.corr, full.corr, atol=1e-5, equal_nan=True)
+    assert np.array_equal(resumed.pairs, full.pairs)
+    assert resumed.update(cot, prices)['recomputed_weeks'] == 0
+
+def test_sliding_window_updates_incrementally():
+    mapping, dates, cot, prices = synthetic_inputs()
+    def window(first, last):
+        rows = cot[(cot['report_date'] >= dates[first]) & (cot['report_date'] <= dates[last])]
+        ts = prices['ts']
+        bars = prices[(ts >= pd.Timestamp(dates[first] - pd.Timedelta(weeks=2), tz='UTC').value)
+                      & (ts < pd.Timestamp(dates[last] + pd.Timedelta(days=2), tz='UTC').value)]
+        return rows, bars
+    engine = CorrelationEngine(mapping)
+    engine.update(*window(0, 150))
+    # Next week: the oldest report drops out of the fetch window and a new one arrives
+    stats = engine.update(*window(1, 151))
+    assert stats['recomputed_weeks'] < 10
+    # Fetching only the latest reports works the same way
+    stats = engine.update(*window(140, 152))
+    assert stats['recomputed_weeks'] < 10
+    full = CorrelationEngine(mapping)
+    full.update(*window(0, 152))
+    assert np.allclose(engine.corr, full.corr, atol=1e-5, equal_nan=True)
+    assert np.array_equal(engine.pairs, full.pairs)
+
+def test_full_matrix_for_all_assets_is_fast():
+    # 21 assets x 20 years of weekly reports and hourly prices
+    mapping, _, cot, prices = synthetic_inputs(assets=21, weeks=52 * 20)
+    engine = CorrelationEngine(mapping)
+    started = time.perf_counter()
+    engine.update(cot, prices)
+    elapsed = time.perf_counter() - started
+    matrix = engine.lead_lag_matrix(52)
+    assert matrix.shape == (21, len(engine.lags))
+    assert np.nanmax(np.abs(matrix.to_numpy())) <= 1.0
+    cross = engine.cross_asset_matrix(lag=0, window=52)
+    assert np.allclose(np.diag(cross), matrix[0], atol=1e-5)
+    assert elapsed < 10.0
+
+if __name__ == "__main__":
+    test_matches_pandas_rolling_corr()
+    test_full_matrix_for_all_assets_is_fast()
+    print("cot_correlation checks passed")
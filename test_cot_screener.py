@@ -0,0 +1,100 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import cot_screener
+from cot_data_utils import add_cot_metrics
+from cot_screener import SCREENER_COLUMNS, build_screener, nearest_zones
+from http_utils import StaleWhileRevalidate
+
+def cot_frame():
+    # Two assets with interleaved report rows, as the combined CFTC query returns them
+    return pd.DataFrame({
+        'asset': ['GOLD', 'SILVER', 'GOLD', 'SILVER', 'GOLD', 'SILVER', 'GOLD'],
+        'report_date': pd.to_datetime(['2024-01-02', '2024-01-02', '2024-01-09', '2024-01-09',
+                                       '2024-01-16', '2024-01-16', '2024-01-23']),
+        'net_position_ratio': [0.1, 0.4, 0.3, 0.4, 0.2, 0.4, 0.5],
+    })
+
+def price_frame():
+    ts = pd.date_range('2024-01-22 10:00', periods=3, freq='h', tz='UTC').as_unit('ns').asi8
+    return pd.DataFrame({
+        'ts': np.concatenate([ts, ts]),
+        'symbol': pd.Categorical(['GC=F'] * 3 + ['SI=F'] * 3),
+        'Open': np.float32([100, 101, 103, 50, 50, 50]),
+        'High': np.float32([102, 104, 106, 51, 51, 51]),
+        'Low': np.float32([99, 100, 102, 49, 49, 49]),
+        'Close': np.float32([101, 103, 105, 50, 50, 50]),
+        'Volume': np.int64([10, 20, 30, 5, 5, 5]),
+    })
+
+def test_add_cot_metrics_per_asset():
+    cot = add_cot_metrics(cot_frame(), index_weeks=3)
+    gold = cot[cot['asset'] == 'GOLD']
+    assert np.allclose(gold['ratio_change'], [np.nan, 0.2, -0.1, 0.3], equal_nan=True)
+    # Position of the ratio in its trailing 3-report range; a flat range is 50
+    assert np.allclose(gold['cot_index'], [50.0, 100.0, 50.0, 100.0])
+    silver = cot[cot['asset'] == 'SILVER']
+    assert np.allclose(silver['ratio_change'], [np.nan, 0.0, 0.0], equal_nan=True)
+    assert np.allclose(silver['cot_index'], [50.0, 50.0, 50.0])
+
+def test_nearest_zones_distance():
+    last_prices = pd.DataFrame({'symbol': ['GC=F', 'SI=F', 'CL=F'], 'last_close': [105.0, 50.0, 70.0]})
+    zones = pd.DataFrame({
+        'symbol': ['GC=F', 'GC=F', 'GC=F', 'SI=F'],
+        'zone_low': [100.0, 107.0, 90.0, 49.0],
+        'zone_high': [102.0, 110.0, 95.0, 51.0],
+    })
+    nearest = nearest_zones(last_prices, zones).set_index('symbol')
+    assert nearest.loc['GC=F', ['nearest_zone_low', 'nearest_zone_high', 'zone_distance']].tolist() == [107.0, 110.0, 2.0]
+    # Inside a zone the distance is 0; symbols without zones are left out
+    assert nearest.loc['SI=F', 'zone_distance'] == 0.0
+    assert 'CL=F' not in nearest.index
+    assert nearest_zones(last_prices, zones.iloc[:0]).empty
+
+def test_build_screener_rows():
+    mapping = {'GOLD': 'GC=F', 'SILVER': 'SI=F', 'COPPER': 'HG=F'}
+    zones = pd.DataFrame({'symbol': ['GC=F', 'SI=F'], 'zone_low': [108.0, 40.0], 'zone_high': [110.0, 45.0]})
+    screener = build_screener(cot_frame(), price_frame(), zones, mapping, index_weeks=3).set_index('asset')
+    assert list(screener.reset_index().columns) == SCREENER_COLUMNS
+    assert list(screener.index) == list(mapping)
+    gold = screener.loc['GOLD']
+    assert gold['report_date'] == pd.Timestamp('2024-01-23')
+    assert np.isclose(gold['ratio_change'], 0.3) and gold['cot_index'] == 100.0
+    # True ranges 3, 4, 4 -> ATR 11/3; close 105 is 3 below the 108-110 zone
+    assert gold['last_close'] == 105.0 and np.isclose(gold['atr'], 11 / 3)
+    assert np.isclose(gold['zone_distance_atr'], 3 / (11 / 3))
+    silver = screener.loc['SILVER']
+    assert silver['cot_index'] == 50.0 and np.isclose(silver['zone_distance_atr'], 5 / 2)
+    # No COT, prices or zones for copper: the row is kept with empty metrics
+    assert screener.loc['COPPER', ['net_position_ratio', 'last_close', 'zone_distance_atr']].isna().all()
+
+def test_load_screener_reuses_cot_and_falls_back_to_the_last_good_frame(monkeypatch):
+    calls = []
+    def fetch(assets, start, end):
+        calls.append(assets)
+        if len(calls) > 1:
+            raise ConnectionError("CFTC down")
+        return cot_frame()
+    monkeypatch.setattr(cot_screener, 'fetch_cot_frame', fetch)
+    monkeypatch.setattr(cot_screener, 'load_price_panel', lambda symbols, interval: price_frame())
+    monkeypatch.setattr(cot_screener, '_cot_frames', StaleWhileRevalidate(max_age=0.05, min_interval=0))
+    mapping = {'GOLD': 'GC=F', 'SILVER': 'SI=F'}
+    first = cot_screener.load_screener(mapping, index_weeks=3, zones_by_symbol={})
+    again = cot_screener.load_screener(mapping, index_weeks=3, zones_by_symbol={})
+    assert len(calls) == 1 and not again.attrs['cot_stale']
+    # Past the max age the CFTC API fails: the last good reports are still used, marked stale
+    time.sleep(0.06)
+    stale = cot_screener.load_screener(mapping, index_weeks=3, zones_by_symbol={})
+    assert stale.attrs['cot_stale'] and stale['cot_index'].tolist() == first['cot_index'].tolist()
+    # With nothing cached the screener is still built, with empty COT columns
+    monkeypatch.setattr(cot_screener, '_cot_frames', StaleWhileRevalidate(max_age=0.05, min_interval=0))
+    empty = cot_screener.load_screener(mapping, index_weeks=3, zones_by_symbol={})
+    assert empty.attrs['cot_error'] and empty['cot_index'].isna().all() and empty['last_close'].notna().all()
+
+if __name__ == "__main__":
+    test_add_cot_metrics_per_asset()
+    test_nearest_zones_distance()
+    test_build_screener_rows()
+    print("screener checks passed")
@@ -0,0 +1,148 @@
+import io
+import json
+import threading
+import urllib.request
+from urllib.error import HTTPError
+
+import numpy as np
+import pandas as pd
+
+import data_api
+from price_store import write_price_history
+
+def stored_prices(root, n=500):
+    ts = pd.date_range('2024-01-01', periods=n, freq='h', tz='UTC').as_unit('ns').asi8
+    close = (100.0 + np.arange(n) * 0.1).astype('float32')
+    df = pd.DataFrame({
+        'ts': ts,
+        'symbol': pd.Categorical(['GC=F'] * n),
+        'Open': close, 'High': close + 1, 'Low': close - 1, 'Close': close,
+        'Volume': np.arange(n, dtype='int64'),
+    })
+    write_price_history(df, '1h', root=str(root))
+    return df
+
+def start_server(root):
+    server = data_api.make_server(port=0, price_root=str(root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+def get(url, etag=None):
+    request = urllib.request.Request(url, headers={'If-None-Match': etag} if etag else {})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers.get('ETag'), response.read()
+    except HTTPError as e:
+        return e.code, e.headers.get('ETag'), e.read()
+
+def test_prices_json_range_and_etag(tmp_path):
+    stored_prices(tmp_path)
+    server, base = start_server(tmp_path)
+    try:
+        status, etag, body = get(f'{base}/prices/GC=F?start=2024-01-02&end=2024-01-02')
+        rows = json.loads(body)
+        assert status == 200 and len(rows) == 24
+        # Whole GMT+3 day: 2024-01-01 21:00 UTC to 2024-01-02 21:00 UTC
+        assert rows[0]['ts'] == pd.Timestamp('2024-01-01 21:00', tz='UTC').value
+        assert get(f'{base}/prices/GC=F?start=2024-01-02&end=2024-01-02', etag)[0] == 304
+        # A new store version invalidates the validator
+        stored_prices(tmp_path, n=501)
+        assert get(f'{base}/prices/GC=F?start=2024-01-02&end=2024-01-02', etag)[0] == 200
+        assert get(f'{base}/prices/SI=F')[0] == 404
+    finally:
+        server.shutdown()
+
+def test_prices_streamed_in_chunks_as_arrow(tmp_path, monkeypatch):
+    import pyarrow as pa
+    monkeypatch.setattr(data_api, 'STREAM_CHUNK_ROWS', 100)
+    df = stored_prices(tmp_path)
+    server, base = start_server(tmp_path)
+    try:
+        status, _, body = get(f'{base}/prices/GC=F?format=arrow')
+        table = pa.ipc.open_stream(io.BytesIO(body)).read_all()
+        assert status == 200 and table.num_rows == len(df)
+        assert table.column('ts').to_pylist() == df['ts'].tolist()
+        status, _, body = get(f'{base}/prices/GC=F?format=parquet')
+        assert len(pd.read_parquet(io.BytesIO(body))) == len(df)
+    finally:
+        server.shutdown()
+
+def test_prices_are_copied_out_of_the_store_one_chunk_at_a_time(tmp_path, monkeypatch):
+    from price_store import open_price_history
+    monkeypatch.setattr(data_api, 'STREAM_CHUNK_ROWS', 100)
+    df = stored_prices(tmp_path)
+    chunks = list(data_api.iter_history_chunks(open_price_history('GC=F', '1h', str(tmp_path))))
+    assert [len(c) for c in chunks] == [100] * 5
+    assert pd.concat(chunks, ignore_index=True).equals(df)
+
+def test_error_mid_stream_closes_the_connection(tmp_path, monkeypatch):
+    import socket
+    def broken(chunks):
+        yield b'['
+        raise RuntimeError("disk went away")
+    monkeypatch.setitem(data_api.ENCODERS, 'json', broken)
+    stored_prices(tmp_path)
+    server, base = start_server(tmp_path)
+    try:
+        sock = socket.create_connection(server.server_address[:2], timeout=5)
+        sock.sendall(b'GET /prices/GC=F HTTP/1.1\r\nHost: x\r\n\r\n')
+        response = b''
+        while chunk := sock.recv(65536):
+            response += chunk
+        sock.close()
+        # One status line, a partial body and no terminating chunk
+        assert response.count(b'HTTP/1.1 ') == 1 and response.startswith(b'HTTP/1.1 200')
+        assert not response.endswith(b'0\r\n\r\n')
+    finally:
+        server.shutdown()
+
+def test_cot_is_fetched_once_for_many_consumers(tmp_path, monkeypatch):
+    calls = []
+    def fake_fetch(assets, start, end):
+        calls.append(tuple(assets))
+        return pd.DataFrame({
+            'asset': pd.Categorical(['GOLD'] * 3),
+            'report_date': pd.date_range('2024-01-02', periods=3, freq='7D'),
+            'long': [10.0, 20.0, 30.0], 'short': [10.0, 10.0, 10.0],
+            'net_position_ratio': [0.0, 1 / 3, 0.5],
+        })
+    monkeypatch.setattr(data_api, 'fetch_cot_frame', fake_fetch)
+    data_api._cot_cache.clear()
+    server, base = start_server(tmp_path)
+    try:
+        status, etag, body = get(f'{base}/cot?assets=GOLD&start=2024-01-01&end=2024-02-01')
+        assert status == 200 and 'cot_index' in json.loads(body)[0]
+        assert get(f'{base}/cot?assets=GOLD&start=2024-01-01&end=2024-02-01', etag)[0] == 304
+        assert get(f'{base}/cot?assets=GOLD&start=2024-01-01&end=2024-02-01&format=csv')[0] == 200
+        assert calls == [('GOLD',)]
+    finally:
+        server.shutdown()
+
+def test_zones_and_errors(tmp_path, monkeypatch):
+    zones = [{'id': 1, 'symbol': 'GC=F', 'zone_low': 1.0, 'zone_high': 2.0, 'atr_value': 1.0}]
+    monkeypatch.setattr(data_api, 'load_zones', lambda symbol, period, levels: pd.DataFrame(zones))
+    server, base = start_server(tmp_path)
+    try:
+        status, etag, body = get(f'{base}/zones/GC=F')
+        assert status == 200 and json.loads(body) == zones
+        assert get(f'{base}/zones/GC=F', etag)[0] == 304
+        assert get(f'{base}/zones/GC=F?format=xml')[0] == 400
+        assert get(f'{base}/nope')[0] == 404
+    finally:
+        server.shutdown()
+
+def test_zones_read_the_replica_without_the_write_queue(monkeypatch):
+    import supabase_client
+    calls = []
+    class FakeKLClient:
+        def sync_kl_zones(self, symbol, time_period='weekly'):
+            calls.append((symbol, time_period))
+            return [{'id': 1, 'symbol': symbol, 'zone_low': 1.0, 'zone_high': 2.0, 'atr_value': 1.0}]
+    monkeypatch.setattr(supabase_client, 'get_kl_client', lambda: FakeKLClient())
+    monkeypatch.setattr(supabase_client, '_write_queue', None)
+    data_api._zones_cache.clear()
+    for _ in range(3):
+        assert len(data_api.load_zones('GC=F')) == 1
+    # One delta sync per TTL, and no write-behind worker (or spool) in the API process
+    assert calls == [('GC=F', 'weekly')]
+    assert supabase_client._write_queue is None
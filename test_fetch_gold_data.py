@@ -2,14 +2,14 @@ import os
 import pandas as pd
 from datetime import datetime, timedelta
 from yahooquery import Ticker
-import requests
+from http_utils import get_json, CFTC_COT_URL
 from dotenv import load_dotenv
+from price_data_utils import normalize_price_frame
+from rvol_utils import add_rvol
 
 # Load environment variables
 load_dotenv()
 
-ROLLING_WINDOW = 20  # Example window for avg_volume/rvol
-
 def calculate_net_position_ratio(long, short):
     """Calculates the ratio (Long - Short) / (Long + Short), handling division by zero."""
     total_positions = long + short
@@ -42,36 +42,8 @@ COT_FUTURES_MAPPING = {
 }
 
 def process_hist_df(hist):
-    if isinstance(hist, pd.DataFrame) and not hist.empty:
-        if isinstance(hist.index, pd.MultiIndex):
-            hist = hist.reset_index()
-        hist = hist.rename(columns={"symbol": "ticker"})
-        # Add price column as 'close'
-        if 'close' in hist.columns:
-            hist['price'] = hist['close']
-        elif 'Close' in hist.columns:
-            hist['price'] = hist['Close']
-        # Ensure 'volume' and 'date' columns exist
-        if 'Volume' in hist.columns:
-            hist = hist.rename(columns={'Volume': 'volume'})
-        if 'Date' in hist.columns:
-            hist = hist.rename(columns={'Date': 'date'})
-        if 'Datetime' in hist.columns:
-            hist = hist.rename(columns={'Datetime': 'date'})
-        hist = hist.dropna(subset=["volume", "date"])
-        hist = hist[hist["volume"] > 0]
-        hist["datetime"] = pd.to_datetime(hist["date"], errors="coerce", utc=True)
-        hist = hist.dropna(subset=["datetime"])
-        hist = hist.sort_values("datetime")
-        # Convert to GMT+3
-        hist["datetime_gmt3"] = hist["datetime"] + timedelta(hours=3)
-        hist["datetime_gmt3"] = hist["datetime_gmt3"].dt.strftime("%Y-%m-%dT%H:%M:%S+03:00")
-        # Calculate avg_volume and rvol
-        hist["avg_volume"] = hist["volume"].rolling(ROLLING_WINDOW).mean()
-        hist["rvol"] = hist["volume"] / hist["avg_volume"]
-        return hist
-    else:
-        return pd.DataFrame()
+    # Multi-window and time-of-day rvol in one pass
+    return add_rvol(normalize_price_frame(hist))
 
 # Process each asset
 for cot_asset_name, futures_ticker in COT_FUTURES_MAPPING.items():
@@ -90,8 +62,6 @@ for cot_asset_name, futures_ticker in COT_FUTURES_MAPPING.items():
         print(f"Error fetching {cot_asset_name} futures data: {e}")
 
     # --- COT Data ---
-    base_url = "https://publicreporting.cftc.gov/resource/6dca-aqww.json"
-
     try:
         today = datetime.utcnow().date()
         
@@ -126,9 +96,7 @@ for cot_asset_name, futures_ticker in COT_FUTURES_MAPPING.items():
         }
 
         # Fetch data
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        cot_data = response.json()
+        cot_data = get_json(CFTC_COT_URL, params=params)
         
         # Convert to DataFrame
         cot_df = pd.DataFrame.from_records(cot_data)
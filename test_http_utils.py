@@ -0,0 +1,98 @@
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import http_utils
+from http_utils import ConditionalCache, create_session, get_json
+
+BODY = [{"report_date_as_yyyy_mm_dd": "2024-01-02", "noncomm_positions_long_all": "100"}]
+ETAG = '"cot-v1"'
+
+class StubCFTCHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    hits = []
+    peers = set()
+    fail_next = 0
+    delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        type(self).hits.append(self.path)
+        type(self).peers.add(self.client_address[1])
+        time.sleep(type(self).delay)
+        if type(self).fail_next > 0:
+            type(self).fail_next -= 1
+            self._send(503, b'busy', {'Retry-After': '0'})
+            return
+        if self.headers.get('If-None-Match') == ETAG:
+            self._send(304, headers={'ETag': ETAG})
+            return
+        body = json.dumps(BODY).encode()
+        headers = {'Content-Type': 'application/json', 'ETag': ETAG}
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        self._send(200, body, headers)
+
+def start_stub_server():
+    StubCFTCHandler.hits = []
+    StubCFTCHandler.peers = set()
+    StubCFTCHandler.fail_next = 0
+    StubCFTCHandler.delay = 0.0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubCFTCHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/resource/cot.json'
+
+def test_conditional_request_returns_cached_body_on_304():
+    server, url = start_stub_server()
+    try:
+        session, cache = create_session(), ConditionalCache()
+        first = get_json(url, params={'$where': 'x'}, session=session, cache=cache)
+        second = get_json(url, params={'$where': 'x'}, session=session, cache=cache)
+        assert first == BODY and second == BODY
+        assert len(StubCFTCHandler.hits) == 2
+        # Both requests went over one pooled keep-alive connection
+        assert len(StubCFTCHandler.peers) == 1
+    finally:
+        server.shutdown()
+
+def test_retries_transient_errors(monkeypatch):
+    monkeypatch.setattr(http_utils.time, 'sleep', lambda seconds: None)
+    server, url = start_stub_server()
+    try:
+        StubCFTCHandler.fail_next = 2
+        assert get_json(url, session=create_session(), cache=None) == BODY
+        assert len(StubCFTCHandler.hits) == 3
+    finally:
+        server.shutdown()
+
+def test_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(http_utils.time, 'sleep', lambda seconds: None)
+    server, url = start_stub_server()
+    try:
+        StubCFTCHandler.fail_next = 10
+        try:
+            get_json(url, session=create_session(), cache=None, retries=2)
+        except http_utils.requests.HTTPError as e:
+            assert e.response.status_code == 503
+        else:
+            raise AssertionError("expected HTTPError")
+        assert len(StubCFTCHandler.hits) == 3
+    finally:
+        server.shutdown()
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(12):
+        assert 0 <= http_utils.backoff_delay(attempt) <= http_utils.BACKOFF_MAX
@@ -0,0 +1,58 @@
+from kl_cluster_utils import consolidate_kl_zones
+
+def zone(id, low, high, symbol='GC=F', kl_type='General', atr=1.0, **extra):
+    return {'id': id, 'symbol': symbol, 'zone_low': low, 'zone_high': high, 'atr_value': atr,
+            'kl_type': kl_type, 'candle_label': f'candle-{id}', 'time_period': 'weekly', **extra}
+
+def spans(levels):
+    return [(l['symbol'], l['zone_low'], l['zone_high']) for l in levels]
+
+def test_chained_zones_merge_into_one_level():
+    # c never touches a, but each zone is within tolerance of the level built so far
+    zones = [zone('c', 102.1, 103.0), zone('a', 100.0, 101.0), zone('b', 101.2, 102.0), zone('d', 110.0, 111.0)]
+    levels = consolidate_kl_zones(zones, tolerance_atr=0.25)
+    assert spans(levels) == [('GC=F', 100.0, 103.0), ('GC=F', 110.0, 111.0)]
+    assert levels[0]['source_ids'] == ['a', 'b', 'c'] and levels[0]['zone_count'] == 3
+
+def test_tolerance_boundary():
+    at_edge = consolidate_kl_zones([zone('a', 100.0, 101.0), zone('b', 101.25, 102.0)], tolerance_atr=0.25)
+    past_edge = consolidate_kl_zones([zone('a', 100.0, 101.0), zone('b', 101.26, 102.0)], tolerance_atr=0.25)
+    assert spans(at_edge) == [('GC=F', 100.0, 102.0)]
+    assert spans(past_edge) == [('GC=F', 100.0, 101.0), ('GC=F', 101.26, 102.0)]
+    # The larger ATR of the two sides sets the tolerance; an explicit atr overrides the zones'
+    assert len(consolidate_kl_zones([zone('a', 100.0, 101.0, atr=0.1), zone('b', 101.5, 102.0, atr=2.0)])) == 1
+    assert len(consolidate_kl_zones([zone('a', 100.0, 101.0), zone('b', 101.5, 102.0)], atr={'GC=F': 0.1})) == 2
+    assert len(consolidate_kl_zones([zone('a', 100.0, 101.0), zone('b', 101.5, 102.0)], tolerance_atr=0.0)) == 2
+
+def test_symbols_are_never_merged():
+    zones = [zone('a', 100.0, 101.0), zone('b', 100.5, 101.5, symbol='SI=F'), zone('c', 100.2, 100.8)]
+    levels = consolidate_kl_zones(zones)
+    assert spans(levels) == [('GC=F', 100.0, 101.0), ('SI=F', 100.5, 101.5)]
+    assert levels[0]['source_ids'] == ['a', 'c'] and levels[1]['source_ids'] == ['b']
+
+def test_merged_provenance_and_weighting():
+    zones = [
+        zone('a', 100.0, 102.0, kl_type='Swing High', w=3.0),
+        zone('b', 101.0, 103.0, kl_type='General', w=1.0),
+        zone('c', 101.5, 102.5, kl_type='Swing High', w=0.0),
+    ]
+    level, = consolidate_kl_zones(zones, weight_key='w')
+    assert level['candle_labels'] == ['candle-a', 'candle-b', 'candle-c']
+    assert level['kl_type'] == 'Swing High'
+    assert level['weight'] == 4.0
+    # Weighted mid: (101 * 3 + 102 * 1 + 102 * 0) / 4
+    assert level['level'] == 101.25
+    assert (level['zone_low'], level['zone_high'], level['time_period']) == (100.0, 103.0, 'weekly')
+    assert set(level) >= {'source_ids', 'zone_count', 'atr'} and not any(k.startswith('_') for k in level)
+    # Without weights every zone counts once
+    assert consolidate_kl_zones(zones)[0]['level'] == (101.0 + 102.0 + 102.0) / 3
+
+def test_zones_without_bounds_are_skipped():
+    assert consolidate_kl_zones([zone('a', None, 101.0), zone('b', 100.0, None)]) == []
+
+if __name__ == "__main__":
+    test_chained_zones_merge_into_one_level()
+    test_tolerance_boundary()
+    test_symbols_are_never_merged()
+    test_merged_provenance_and_weighting()
+    print("kl_cluster_utils checks passed")
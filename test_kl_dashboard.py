@@ -1,60 +1,46 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
 from kl_entry_utils import fetch_quarter_data, calculate_kl_for_label, insert_kl_to_supabase
-from kl_data_utils import filter_to_wednesday_tuesday_from_latest, calculate_cot_net_change
-from kl_overlay_utils import fetch_kl_zones, add_kl_overlay
+from kl_data_utils import COT_FUTURES_MAPPING, filter_to_wednesday_tuesday_from_latest, calculate_cot_net_change
+from kl_overlay_utils import fetch_kl_zones
+from chart_utils import cached_figure, price_figure, series_figure, frame_fingerprint, chart_stats, format_chart_stats
+from price_data_utils import with_datetime
+from kl_cluster_utils import consolidate_kl_zones, DEFAULT_TOLERANCE_ATR
 import logging
-from supabase_client import get_kl_client
+from supabase_client import get_kl_client, get_kl_write_queue
 
 
 st.set_page_config(page_title="KL Test Dashboard", layout="wide")
 st.title("KL Test Dashboard")
 
 # --- UI: Asset selection ---
-COT_FUTURES_MAPPING = {
-    "GOLD - COMMODITY EXCHANGE INC.": "GC=F",
-    "SILVER - COMMODITY EXCHANGE INC.": "SI=F",
-    "PLATINUM - NEW YORK MERCANTILE EXCHANGE": "PL=F",
-    "PALLADIUM - NEW YORK MERCANTILE EXCHANGE": "PA=F",
-    "COPPER - COMMODITY EXCHANGE INC.": "HG=F",
-    "CRUDE OIL - NEW YORK MERCANTILE EXCHANGE": "CL=F",
-    "NATURAL GAS - NEW YORK MERCANTILE EXCHANGE": "NG=F",
-    "E-MINI S&P 500 STOCK INDEX - CHICAGO MERCANTILE EXCHANGE": "ES=F",
-    "E-MINI NASDAQ 100 STOCK INDEX - CHICAGO MERCANTILE EXCHANGE": "NQ=F",
-    "E-MINI DOW JONES STOCK INDEX - CHICAGO BOARD OF TRADE": "YM=F",
-    "EURO FX - CHICAGO MERCANTILE EXCHANGE": "6E=F",
-    "BRITISH POUND STERLING - CHICAGO MERCANTILE EXCHANGE": "6B=F",
-    "JAPANESE YEN - CHICAGO MERCANTILE EXCHANGE": "6J=F",
-    "AUSTRALIAN DOLLAR - CHICAGO MERCANTILE EXCHANGE": "6A=F",
-    "CANADIAN DOLLAR - CHICAGO MERCANTILE EXCHANGE": "6C=F",
-    "SWISS FRANC - CHICAGO MERCANTILE EXCHANGE": "6S=F",
-    "NEW ZEALAND DOLLAR - CHICAGO MERCANTILE EXCHANGE": "6N=F",
-    "BITCOIN - CHICAGO MERCANTILE EXCHANGE": "BTC-USD",
-    "ETHER - CHICAGO MERCANTILE EXCHANGE": "ETH-USD",
-    "DOLLAR INDEX - ICE FUTURES U.S.": "DX-Y.NYB",
-    "SPDR S&P 500 ETF TRUST": "SPY",
-}
 
 # Move asset selection to sidebar and make it more visible
 with st.sidebar:
     st.header("Asset Selection")
     selected_asset = st.selectbox("Select Asset", list(COT_FUTURES_MAPPING.keys()), index=0)
+    tolerance_atr = st.slider("KL merge tolerance (ATR)", 0.0, 2.0, DEFAULT_TOLERANCE_ATR, 0.05)
     st.markdown("---")
     st.info("Use the sidebar to select the asset for analysis.")
 selected_symbol = COT_FUTURES_MAPPING[selected_asset]
 
 # --- Fetch data ---
 price_data, cot_data = fetch_quarter_data(selected_symbol, selected_asset, price_interval='1h')
-# Convert all datetimes to GMT+3
-if not price_data.empty and 'datetime' in price_data.columns:
-    price_data['datetime'] = price_data['datetime'].dt.tz_convert('Etc/GMT-3')
-weekly_price_data = filter_to_wednesday_tuesday_from_latest(price_data)
+# Stale data is served while it refreshes in the background; say how old it is
+for name, data in (('Price', price_data), ('COT', cot_data)):
+    if data.attrs.get('stale'):
+        st.warning(f"{name} data is {data.attrs['age_seconds'] / 3600:.1f}h old; refreshing in the background.")
+# Slice the week first, then add GMT+3 datetimes for display on that slice only
+weekly_price_data = with_datetime(filter_to_wednesday_tuesday_from_latest(price_data))
 # Fetch all KLs for the selected symbol (futures ticker)
 all_kl_zones_raw = fetch_kl_zones(selected_symbol, period='weekly')
 # Only keep required fields for each KL entry
 kl_zones = [
     {
+        'id': kl.get('id'),
+        'symbol': kl.get('symbol'),
+        'atr_value': kl.get('atr_value'),
+        'kl_type': kl.get('kl_type'),
         'zone_high': kl.get('zone_high'),
         'zone_low': kl.get('zone_low'),
         'time_period': kl.get('time_period'),
@@ -62,6 +48,8 @@ kl_zones = [
     }
     for kl in all_kl_zones_raw
 ]
+# Merge overlapping zones into consolidated levels for the chart and table
+kl_levels = consolidate_kl_zones(kl_zones, tolerance_atr=tolerance_atr)
 
 # --- Display latest net change in non-commercial positions ---
 latest_cnet_change = None
@@ -77,53 +65,29 @@ else:
 # --- Price Chart with KL Overlay ---
 st.header("Price Chart (Wednesday-Tuesday)")
 if not weekly_price_data.empty:
-    fig = go.Figure()
-    # Candlestick chart
-    fig.add_trace(go.Candlestick(
-        x=weekly_price_data['datetime'],
-        open=weekly_price_data['Open'],
-        high=weekly_price_data['High'],
-        low=weekly_price_data['Low'],
-        close=weekly_price_data['Close'],
-        name='Price',
-        increasing_line_color='green',
-        decreasing_line_color='red',
-        showlegend=True
-    ))
-    # Overlay KL zones
-    fig = add_kl_overlay(fig, kl_zones, weekly_price_data)
-    # Modern layout
-    fig.update_layout(
-        title={
-            'text': f"{selected_asset} ({selected_symbol}) - Weekly Price (1H)",
-            'x': 0.5,
-            'xanchor': 'center',
-            'font': {'size': 22}
-        },
-        xaxis_title='Date',
-        yaxis_title='Price',
-        xaxis_rangeslider_visible=False,
-        height=500,
-        template='plotly_white',
-        legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='right', x=1)
+    # Figures are rebuilt only when the bars or levels change; other reruns reuse the built
+    # object (server-side only, the chart is still sent to the browser on every rerun)
+    price_key = (
+        frame_fingerprint(weekly_price_data, ['ts', 'Open', 'High', 'Low', 'Close']),
+        tuple((level['zone_low'], level['zone_high']) for level in kl_levels),
+        selected_asset,
     )
-    st.plotly_chart(fig, use_container_width=True)
+    fig = cached_figure(
+        'price', price_key, price_figure, weekly_price_data, kl_levels,
+        title=f"{selected_asset} ({selected_symbol}) - Weekly Price (1H)",
+    )
+    st.plotly_chart(fig, use_container_width=True, key='price-chart')
 
 # --- Volume Chart ---
 # Remove the RVol/Volume chart title
 def show_volume_chart():
     if not weekly_price_data.empty and 'Volume' in weekly_price_data.columns:
-        fig2 = go.Figure()
-        fig2.add_trace(go.Bar(
-            x=weekly_price_data['datetime'],
-            y=weekly_price_data['Volume'],
-            name='Volume',
-            marker_color='blue',
-            opacity=0.7
-        ))
-        fig2.update_layout(height=300, yaxis_title='Volume')
-        st.plotly_chart(fig2, use_container_width=True)
+        volume_key = (frame_fingerprint(weekly_price_data, ['ts', 'Volume']), selected_symbol)
+        fig2 = cached_figure('volume', volume_key, series_figure, weekly_price_data, 'Volume', 'Volume')
+        st.plotly_chart(fig2, use_container_width=True, key='volume-chart')
 show_volume_chart()
+if chart_stats():
+    st.caption(f"Charts (latest build in this server process): {format_chart_stats(chart_stats())}")
 
 # --- KL Entry UI ---
 st.header("KL Calculation and Entry")
@@ -158,7 +122,7 @@ if not weekly_price_data.empty:
                     result = insert_kl_to_supabase(kl_zone, selected_symbol, selected_asset, selected_label)
                     st.write(f"[KL UI] Insert result: {result}")
                     st.write(f"[DEBUG] Insert result: {result}")
-                    if result and result.get('action') in ('inserted', 'updated'):
+                    if result and result.get('action') in ('inserted', 'updated', 'queued'):
                         st.success(f"KL {result['action']}! {selected_label}")
                         st.rerun()
                     elif result:
@@ -170,12 +134,14 @@ if not weekly_price_data.empty:
                 st.write(f"[DEBUG] Exception: {e}")
     with col2:
         if st.button("Refresh KLs"):
+            # Reruns pull only rows changed since the replica's watermark
             st.rerun()
 
     # --- Remove KL Entry Dropdown and Button ---
     st.markdown("---")
     kl_client = get_kl_client()
-    all_kl = kl_client.get_kl_zones_for_symbol(selected_symbol, time_period='weekly')
+    write_queue = get_kl_write_queue()
+    all_kl = write_queue.overlay(kl_client.get_replica_zones(selected_symbol, time_period='weekly'), selected_symbol, 'weekly')
     kl_labels = [str(entry.get('candle_label')) for entry in all_kl]
     if kl_labels:
         kl_to_remove = st.selectbox("Select KL to remove (by candle):", kl_labels, key="remove-kl-dropdown")
@@ -186,12 +152,9 @@ if not weekly_price_data.empty:
                     entry_to_delete = entry
                     break
             if entry_to_delete:
-                success = kl_client.delete_kl_zone(entry_to_delete['id'])
-                if success:
-                    st.success(f"KL entry for {selected_symbol} @ {kl_to_remove} deleted.")
-                    st.rerun()
-                else:
-                    st.error("Failed to delete KL entry.")
+                write_queue.enqueue_delete(selected_symbol, 'weekly', entry_to_delete['candle_label'])
+                st.success(f"KL entry for {selected_symbol} @ {kl_to_remove} deleted.")
+                st.rerun()
             else:
                 st.warning("No KL entry found for this symbol and candle.")
     else:
@@ -199,9 +162,10 @@ if not weekly_price_data.empty:
 
 # --- KL Table ---
 # Move KL table to the bottom
-st.header("Current KL Zones (from DB)")
-if kl_zones:
-    kl_df = pd.DataFrame(kl_zones)
+st.header("Current KL Levels (from DB)")
+if kl_levels:
+    kl_df = pd.DataFrame(kl_levels)[['zone_low', 'zone_high', 'level', 'zone_count', 'kl_type', 'candle_labels']]
+    st.caption(f"{len(kl_zones)} zones consolidated into {len(kl_levels)} levels")
     st.dataframe(kl_df, use_container_width=True)
 else:
     st.info("No KL zones found in database.") 
\ No newline at end of file
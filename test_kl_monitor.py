@@ -0,0 +1,92 @@
+import time
+import numpy as np
+import pandas as pd
+from kl_monitor import ZoneMonitor, ReplayPriceFeed
+
+ZONES = {
+    'GC=F': [
+        {'id': 'a', 'symbol': 'GC=F', 'zone_low': 100.0, 'zone_high': 102.0, 'atr_value': 1.0, 'kl_type': 'General'},
+        {'id': 'b', 'symbol': 'GC=F', 'zone_low': 110.0, 'zone_high': 112.0, 'atr_value': 1.0, 'kl_type': 'Swing High'},
+    ],
+}
+
+def replay_events(closes, zones=ZONES, symbol='GC=F'):
+    start = pd.Timestamp('2024-01-01', tz='UTC')
+    bars = pd.DataFrame({
+        'symbol': symbol,
+        'datetime': [start + pd.Timedelta(minutes=i) for i in range(len(closes))],
+        'close': closes,
+    })
+    events = []
+    monitor = ZoneMonitor(zones, tolerance_atr=0.0, on_event=events.append)
+    monitor.run(ReplayPriceFeed(bars), poll_seconds=0)
+    return [(e['event'], e['source_ids'][0], e['side']) for e in events]
+
+def test_enter_and_exit_same_side():
+    assert replay_events([98.0, 101.0, 99.0]) == [
+        ('enter', 'a', 'below'),
+        ('exit', 'a', 'below'),
+    ]
+
+def test_break_through_level():
+    assert replay_events([98.0, 101.0, 105.0]) == [
+        ('enter', 'a', 'below'),
+        ('break', 'a', 'above'),
+    ]
+
+def test_gap_across_levels_breaks_each():
+    assert replay_events([115.0, 101.0, 95.0]) == [
+        ('break', 'b', 'above'),
+        ('enter', 'a', 'above'),
+        ('break', 'a', 'below'),
+    ]
+
+def test_start_inside_level_leaves_as_exit():
+    # The side price entered from is unknown, so leaving either way is not a break
+    assert replay_events([101.0, 99.0]) == [('exit', 'a', 'below')]
+    assert replay_events([101.0, 105.0]) == [('exit', 'a', 'above')]
+
+def test_zones_reloaded_while_running():
+    class Feed:
+        bars = [[('GC=F', 1, 98.0)], [('GC=F', 2, 121.0)], [('GC=F', 3, 125.0)]]
+        exhausted = False
+        def poll(self):
+            batch = self.bars.pop(0)
+            self.exhausted = not self.bars
+            return batch
+    added = {'id': 'c', 'symbol': 'GC=F', 'zone_low': 120.0, 'zone_high': 122.0, 'atr_value': 1.0, 'kl_type': 'General'}
+    loads = []
+    def loader():
+        loads.append(1)
+        return {'GC=F': ZONES['GC=F'][1:] + [added]}
+    events = []
+    monitor = ZoneMonitor(ZONES, tolerance_atr=0.0, on_event=events.append)
+    monitor.run(Feed(), poll_seconds=0, zone_loader=loader, reload_seconds=0)
+    assert len(loads) == 3
+    # Zone a was deleted and zone c added after the monitor started
+    assert [(e['event'], e['source_ids'][0]) for e in events] == [('break', 'b'), ('enter', 'c'), ('break', 'c')]
+
+def test_replay_throughput_all_symbols():
+    # 21 symbols x one trading day of 1-minute bars against 200 zones each
+    rng = np.random.default_rng(0)
+    symbols = [f'SYM{i}' for i in range(21)]
+    zones = {
+        s: [{'id': f'{s}-{k}', 'symbol': s, 'zone_low': 10.0 * k, 'zone_high': 10.0 * k + 2.0, 'atr_value': 1.0}
+            for k in range(200)]
+        for s in symbols
+    }
+    monitor = ZoneMonitor(zones, tolerance_atr=0.0)
+    closes = 1000.0 + np.cumsum(rng.normal(0, 1.0, size=(1440, len(symbols))), axis=0)
+    started = time.perf_counter()
+    for t in range(closes.shape[0]):
+        for j, s in enumerate(symbols):
+            monitor.on_bar(s, t, closes[t, j])
+    elapsed = time.perf_counter() - started
+    assert elapsed < 5.0
+
+if __name__ == "__main__":
+    test_enter_and_exit_same_side()
+    test_break_through_level()
+    test_gap_across_levels_breaks_each()
+    test_replay_throughput_all_symbols()
+    print("kl_monitor checks passed")
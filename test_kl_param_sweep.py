@@ -0,0 +1,57 @@
+import time
+import numpy as np
+import pandas as pd
+from kl_entry_utils import calculate_kl_zone
+from kl_param_sweep import sweep_kl_zones, sweep_all_symbols, zones_for
+
+def random_prices(n, seed=0, symbol='GC=F'):
+    rng = np.random.default_rng(seed)
+    close = 100.0 + np.cumsum(rng.normal(0, 1.0, n))
+    high = close + rng.uniform(0.1, 1.0, n)
+    low = close - rng.uniform(0.1, 1.0, n)
+    ts = pd.date_range('2024-01-01', periods=n, freq='h', tz='UTC')
+    return pd.DataFrame({
+        'ts': ts.as_unit('ns').asi8,
+        'datetime': ts,
+        'symbol': symbol,
+        'Open': close,
+        'High': high,
+        'Low': low,
+        'Close': close,
+        'Volume': 1000,
+    })
+
+def test_sweep_matches_calculate_kl_zone():
+    df = random_prices(40)
+    sweep = sweep_kl_zones(df, periods=(5, 14), windows=(2, 3), multipliers=(1.5, 2.0), cot_weights=(0.0, 0.5))
+    for p, period in enumerate(sweep['periods']):
+        for w, window in enumerate(sweep['windows']):
+            for row in (4, 10, 17, 25, 33):
+                zone = calculate_kl_zone(df['datetime'].iloc[row], df, 0.5, atr_multiplier=2.0,
+                                         atr_period=period, swing_window=window)
+                assert np.isclose(sweep['zone_high'][p, w, 1, 1, row], zone['zone_high'], rtol=1e-6)
+                assert np.isclose(sweep['zone_low'][p, w, 1, 1, row], zone['zone_low'], rtol=1e-6)
+                assert zone['atr_multiplier'] == 2.0
+
+def test_zones_for_returns_swing_zones_only():
+    df = random_prices(200)
+    sweep = sweep_kl_zones(df)
+    zones = zones_for(sweep, df, 14, 3, 2.0, 0.5)
+    assert len(zones) and (zones['kl_type'] != 'General').all()
+    assert (zones['zone_high'] > zones['zone_low']).all()
+
+def test_grid_across_all_symbols_is_fast():
+    # 21 symbols x ~1 year of hourly bars against the default 320-point grid
+    prices = pd.concat([random_prices(6000, seed=i, symbol=f'SYM{i}') for i in range(21)], ignore_index=True)
+    started = time.perf_counter()
+    result = sweep_all_symbols(prices)
+    elapsed = time.perf_counter() - started
+    assert len(result['overall']) == 4 * 4 * 5 * 4
+    assert result['overall']['hold_rate'].between(0, 1).all()
+    assert elapsed < 30.0
+
+if __name__ == "__main__":
+    test_sweep_matches_calculate_kl_zone()
+    test_zones_for_returns_swing_zones_only()
+    test_grid_across_all_symbols_is_fast()
+    print("kl_param_sweep checks passed")
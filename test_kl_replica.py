@@ -0,0 +1,101 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from http_utils import SingleFlight
+from supabase_client import FULL_RESYNC_AFTER, SYNC_OVERLAP, KLZoneReplica, SupabaseKLClient
+from test_kl_write_queue import FakeKLClient, FakeTable
+
+T0 = datetime(2024, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+def row(label, seconds, deleted=False):
+    return {'id': f'id-{label}', 'symbol': 'GC=F', 'time_period': 'weekly', 'candle_label': label,
+            'zone_low': 1.0, 'zone_high': 2.0, 'created_at': (T0 + timedelta(seconds=seconds)).isoformat(),
+            'updated_at': (T0 + timedelta(seconds=seconds)).isoformat(),
+            'deleted_at': (T0 + timedelta(seconds=seconds)).isoformat() if deleted else None}
+
+def kl_client(table):
+    # The replica logic only needs .client.table(); skip creating a real Supabase client
+    client = SupabaseKLClient.__new__(SupabaseKLClient)
+    client.client = FakeKLClient()
+    client.client.kl_zones = table
+    client._replicas = {}
+    client._replica_lock = threading.Lock()
+    client._reads = SingleFlight()
+    return client
+
+def labels(zones):
+    return sorted(z['candle_label'] for z in zones)
+
+def selects(table):
+    return [filters for op, _, filters in table.calls if op == 'select']
+
+def test_first_sync_reads_live_rows_then_only_deltas():
+    table = FakeTable()
+    table.rows = {'a': row('a', 0), 'b': row('b', 10, deleted=True)}
+    client = kl_client(table)
+    assert labels(client.sync_kl_zones('GC=F')) == ['a']
+    assert selects(table)[0]['deleted_at'] == ('is', 'null')
+    table.rows['c'] = row('c', 60)
+    assert labels(client.sync_kl_zones('GC=F')) == ['a', 'c']
+    # The delta re-reads SYNC_OVERLAP before the watermark (a's updated_at)
+    assert selects(table)[1]['updated_at'] == ('gte', (T0 - SYNC_OVERLAP).isoformat())
+    assert client._replicas[('GC=F', 'weekly')].watermark == T0 + timedelta(seconds=60)
+
+def test_tombstone_removes_the_zone():
+    table = FakeTable()
+    table.rows = {'a': row('a', 0), 'b': row('b', 5)}
+    client = kl_client(table)
+    client.sync_kl_zones('GC=F')
+    table.rows['a'] = row('a', 100, deleted=True)
+    assert labels(client.sync_kl_zones('GC=F')) == ['b']
+
+def test_late_commit_inside_the_overlap_is_picked_up():
+    table = FakeTable()
+    table.rows = {'a': row('a', 100)}
+    client = kl_client(table)
+    client.sync_kl_zones('GC=F')
+    # Committed after the last sync but stamped 10s before the watermark
+    table.rows['late'] = row('late', 90)
+    assert labels(client.sync_kl_zones('GC=F')) == ['a', 'late']
+    assert client._replicas[('GC=F', 'weekly')].watermark == T0 + timedelta(seconds=100)
+
+def test_out_of_order_rows_keep_the_latest_watermark():
+    replica = KLZoneReplica()
+    replica.apply([row('b', 50), row('a', 20, deleted=True), row('c', 5)])
+    assert labels(replica.zones()) == ['b', 'c']
+    assert replica.watermark == T0 + timedelta(seconds=50)
+
+def test_failed_full_resync_keeps_the_current_replica():
+    seen = []
+    class SlowTable(FakeTable):
+        def execute(self, query):
+            # What concurrent readers see while the full read is in flight
+            seen.append(labels(client.get_replica_zones('GC=F')))
+            return super().execute(query)
+    table = SlowTable()
+    table.rows = {'a': row('a', 0), 'b': row('b', 5)}
+    client = kl_client(table)
+    client.sync_kl_zones('GC=F')
+    table.fail_calls = 1
+    assert labels(client.sync_kl_zones('GC=F', full=True)) == ['a', 'b']
+    assert seen[1:] == [['a', 'b']]
+    # A successful full read replaces the replica
+    del table.rows['a']
+    assert labels(client.sync_kl_zones('GC=F', full=True)) == ['b']
+
+def test_replica_resyncs_fully_after_the_purge_window():
+    table = FakeTable()
+    table.rows = {'a': row('a', 0), 'b': row('b', 5)}
+    client = kl_client(table)
+    client.sync_kl_zones('GC=F')
+    # b was deleted and its tombstone purged while this replica was not syncing
+    del table.rows['b']
+    client._replicas[('GC=F', 'weekly')].synced_at = time.time() - FULL_RESYNC_AFTER.total_seconds() - 1
+    assert labels(client.sync_kl_zones('GC=F')) == ['a']
+    assert selects(table)[-1]['deleted_at'] == ('is', 'null')
+
+if __name__ == "__main__":
+    test_first_sync_reads_live_rows_then_only_deltas()
+    test_tombstone_removes_the_zone()
+    print("replica checks passed")
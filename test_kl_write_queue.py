@@ -0,0 +1,195 @@
+import json
+import os
+
+import supabase_client
+from supabase_client import KLWriteBehindQueue, _parse_ts
+
+class FakeQuery:
+    def __init__(self, table, op, payload):
+        self.table = table
+        self.op = op
+        self.payload = payload
+        self.filters = {}
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def in_(self, column, values):
+        self.filters[column] = list(values)
+        return self
+
+    def is_(self, column, value):
+        self.filters[column] = ('is', value)
+        return self
+
+    def gte(self, column, value):
+        self.filters[column] = ('gte', value)
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def execute(self):
+        return self.table.execute(self)
+
+class FakeTable:
+    """kl_zones stand-in: records each call; fails the first ``fail_calls`` and any row whose
+    candle_label is in ``reject``. ``rows`` is keyed by candle_label."""
+
+    def __init__(self, fail_calls=0, reject=()):
+        self.fail_calls = fail_calls
+        self.reject = set(reject)
+        self.calls = []
+        self.rows = {}
+
+    def upsert(self, rows, on_conflict=None):
+        return FakeQuery(self, 'upsert', rows)
+
+    def update(self, values):
+        return FakeQuery(self, 'update', values)
+
+    def select(self, columns):
+        return FakeQuery(self, 'select', columns)
+
+    def execute(self, query):
+        self.calls.append((query.op, query.payload, dict(query.filters)))
+        if self.fail_calls > 0:
+            self.fail_calls -= 1
+            raise ConnectionError("upstream down")
+        if query.op == 'upsert':
+            if any(row['candle_label'] in self.reject for row in query.payload):
+                raise ValueError("violates check constraint")
+            for row in query.payload:
+                self.rows[row['candle_label']] = dict(row)
+            return type('Response', (), {'data': query.payload})()
+        if query.op == 'select':
+            return type('Response', (), {'data': self._select(query.filters)})()
+        labels = query.filters['candle_label']
+        updated = []
+        for label in labels:
+            if label in self.rows:
+                self.rows[label].update(query.payload)
+                updated.append(self.rows[label])
+        return type('Response', (), {'data': updated})()
+
+    def _select(self, filters):
+        rows = []
+        for row in self.rows.values():
+            keep = True
+            for column, value in filters.items():
+                if isinstance(value, tuple) and value[0] == 'is':
+                    keep &= row.get(column) is None
+                elif isinstance(value, tuple) and value[0] == 'gte':
+                    keep &= _parse_ts(row[column]) >= _parse_ts(value[1])
+                else:
+                    keep &= row.get(column) == value
+            if keep:
+                rows.append(dict(row))
+        return sorted(rows, key=lambda r: _parse_ts(r['updated_at']))
+
+class FakeKLClient:
+    """Just what the queue uses: ``client.table('kl_zones')`` and ``_apply_to_replica``."""
+
+    def __init__(self, **table_kwargs):
+        self.kl_zones = FakeTable(**table_kwargs)
+        self.client = self
+        self.applied = []
+
+    def table(self, name):
+        return self.kl_zones
+
+    def _apply_to_replica(self, rows):
+        self.applied.extend(rows or [])
+
+def zone(label, high=102.0):
+    return {'symbol': 'GC=F', 'kl_type': 'General', 'zone_high': high, 'zone_low': 100.0, 'zone_size': high - 100.0,
+            'atr': 1.0, 'candle_label': label, 'time_period': 'weekly'}
+
+def test_writes_to_one_candle_are_coalesced(tmp_path):
+    client = FakeKLClient()
+    queue = KLWriteBehindQueue(client, spool_path=str(tmp_path / 'spool.jsonl'), linger=0.2)
+    queue.enqueue_upsert(zone('a', 101.0))
+    queue.enqueue_upsert(zone('b'))
+    queue.enqueue_upsert(zone('a', 103.0))
+    assert len(queue) == 2
+    assert queue.flush(timeout=5)
+    queue.close()
+    upserts = [payload for op, payload, _ in client.kl_zones.calls if op == 'upsert']
+    # One batched upsert carrying only the latest write per candle
+    assert len(upserts) == 1
+    assert sorted(row['candle_label'] for row in upserts[0]) == ['a', 'b']
+    assert client.kl_zones.rows['a']['zone_high'] == 103.0
+    assert not os.path.exists(tmp_path / 'spool.jsonl')
+
+def test_spool_is_replayed_after_restart(tmp_path):
+    spool = str(tmp_path / 'spool.jsonl')
+    down = FakeKLClient(fail_calls=10**6)
+    queue = KLWriteBehindQueue(down, spool_path=spool, linger=0.01)
+    queue.enqueue_upsert(zone('a'))
+    queue.enqueue_delete('GC=F', 'weekly', 'old')
+    queue.close(timeout=0.2)
+    assert os.path.exists(spool)
+    # A new process picks up the spooled writes and flushes them
+    up = FakeKLClient()
+    up.kl_zones.rows['old'] = {'candle_label': 'old', 'deleted_at': None}
+    restarted = KLWriteBehindQueue(up, spool_path=spool, linger=0.01)
+    assert len(restarted) == 2
+    assert restarted.flush(timeout=5)
+    restarted.close()
+    assert 'a' in up.kl_zones.rows and up.kl_zones.rows['old']['deleted_at'] is not None
+    assert not os.path.exists(spool)
+
+def test_failed_flushes_are_retried_with_backoff(tmp_path, monkeypatch):
+    delays = []
+    monkeypatch.setattr(supabase_client, 'backoff_delay', lambda attempt: delays.append(attempt) or 0.01)
+    client = FakeKLClient(fail_calls=2)
+    queue = KLWriteBehindQueue(client, spool_path=str(tmp_path / 'spool.jsonl'), linger=0.01)
+    queue.enqueue_upsert(zone('a'))
+    assert queue.flush(timeout=5)
+    queue.close()
+    assert len(client.kl_zones.calls) == 3
+    assert delays == [1, 2]
+    assert 'a' in client.kl_zones.rows
+
+def test_rejected_write_is_set_aside(tmp_path, monkeypatch):
+    monkeypatch.setattr(supabase_client, 'backoff_delay', lambda attempt: 0.01)
+    monkeypatch.setattr(supabase_client, 'WRITE_MAX_ATTEMPTS', 2)
+    spool = str(tmp_path / 'spool.jsonl')
+    client = FakeKLClient(reject={'bad'})
+    queue = KLWriteBehindQueue(client, spool_path=spool, linger=0.01)
+    queue.enqueue_upsert(zone('good'))
+    queue.enqueue_upsert(zone('bad'))
+    assert queue.flush(timeout=5)
+    queue.close()
+    # The bad row does not hold back the good one, and ends up in the rejected file
+    assert 'good' in client.kl_zones.rows and 'bad' not in client.kl_zones.rows
+    with open(spool + '.rejected') as f:
+        rejected = [json.loads(line) for line in f]
+    assert [op['key'][2] for op in rejected] == ['bad']
+    assert rejected[0]['attempts'] == 2
+
+def test_outage_is_retried_without_rejecting_or_splitting(tmp_path, monkeypatch):
+    monkeypatch.setattr(supabase_client, 'backoff_delay', lambda attempt: 0.001)
+    monkeypatch.setattr(supabase_client, 'WRITE_MAX_ATTEMPTS', 2)
+    spool = str(tmp_path / 'spool.jsonl')
+    client = FakeKLClient(fail_calls=10)
+    queue = KLWriteBehindQueue(client, spool_path=spool, linger=0.01)
+    queue.enqueue_upsert(zone('a'))
+    queue.enqueue_upsert(zone('b'))
+    assert queue.flush(timeout=5)
+    queue.close()
+    # Connection errors never count toward the attempt limit, and the batch is not retried row by row
+    assert len(client.kl_zones.calls) == 11
+    assert all(len(payload) == 2 for op, payload, _ in client.kl_zones.calls)
+    assert sorted(client.kl_zones.rows) == ['a', 'b']
+    assert not os.path.exists(spool + '.rejected')
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    with tempfile.TemporaryDirectory() as tmp:
+        test_writes_to_one_candle_are_coalesced(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_spool_is_replayed_after_restart(Path(tmp))
+    print("write queue checks passed")
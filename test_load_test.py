@@ -0,0 +1,11 @@
+from load_test import run_load_test, FLOWS
+
+def test_load_test_runs_offline():
+    report = run_load_test(sessions=2, concurrency=2, iterations=1, assets=['GOLD - COMMODITY EXCHANGE INC.'])
+    latency = {row['flow']: row for row in report['latency']}
+    assert set(latency) == {'all', *FLOWS}
+    assert latency['all']['errors'] == 0, report['errors']
+    assert latency['all']['p50_ms'] <= latency['all']['p95_ms'] <= latency['all']['p99_ms']
+    assert report['throughput_rps'] > 0
+    # Sessions on the same asset share the stored history instead of downloading it again
+    assert report['upstream']['yahoo_downloads'] == 1
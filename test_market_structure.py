@@ -0,0 +1,74 @@
+import time
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from market_structure import rolling_max, scale_structure, build_structure_index, build_structure_indexes
+
+def random_bars(n, seed=0, symbol='GC=F'):
+    rng = np.random.default_rng(seed)
+    close = 100.0 + np.cumsum(rng.normal(0, 1.0, n))
+    return pd.DataFrame({
+        'ts': np.arange(n, dtype='int64') * 3_600_000_000_000,
+        'symbol': symbol,
+        'High': close + rng.uniform(0, 1, n),
+        'Low': close - rng.uniform(0, 1, n),
+        'Close': close,
+    })
+
+def test_rolling_max_matches_naive():
+    values = np.random.default_rng(1).normal(size=1001)
+    for size in (1, 3, 7, 21, 61, 1001):
+        assert np.array_equal(rolling_max(values, size), sliding_window_view(values, size).max(axis=1))
+
+def test_labels_breaks_and_trend():
+    # Two rising swing highs and lows, then a close below the last swing low
+    close = np.array([10, 12, 14, 12, 11, 13, 16, 14, 12, 9, 8], dtype=float)
+    s = scale_structure(close, close, close, window=1)
+    labels = {i: (s['high_label'][i], s['low_label'][i]) for i in np.flatnonzero(s['swing'])}
+    assert list(labels) == [2, 4, 6]
+    assert s['high_label'][6] == 1  # HH
+    assert s['bos'][9] == -1 and s['trend'][10] == -1
+    assert s['last_low'][9] == 11.0
+
+def test_plateaus_and_double_tops():
+    high = np.array([1, 2, 3, 5, 5, 3, 2, 1, 2, 3, 4, 5, 4, 3, 2, 1, 2], dtype=float)
+    s = scale_structure(high, high, high, window=3)
+    # Only the first bar of the 5/5 plateau is a swing high; the later 5 is an equal high, not LH
+    assert list(np.flatnonzero(s['swing'] == 1)) == [3, 11]
+    assert s['high_label'][11] == 5  # EQH
+    assert s['high_label'][4] == 0
+    low = -high
+    s = scale_structure(low, low, low, window=3)
+    assert list(np.flatnonzero(s['swing'] == -1)) == [3, 11] and s['low_label'][11] == 6  # EQL
+
+def test_index_lookups():
+    df = random_bars(500)
+    index = build_structure_index(df, scales=(3, 10))
+    assert index.position(df['ts'].iloc[250]) == 250
+    assert index.position(df['ts'].iloc[250] + 1) == 250
+    assert index.position(-1) == -1
+    swings = index.swings(3)
+    for pos in swings['pos']:
+        assert index.kl_type(pos, 3) in ("Swing High", "Swing Low")
+    assert set(swings['label']) <= {'', 'HH', 'LH', 'HL', 'LL', 'EQH', 'EQL'}
+    # One off-grid bar does not shrink the lookup step, and positions stay exact around it
+    ts = df['ts'].to_numpy().copy()
+    ts[300] += 60_000_000_000
+    index = build_structure_index(df.assign(ts=ts), scales=(3,))
+    assert index._step == 3_600_000_000_000
+    for t in (ts[299], ts[300] - 1, ts[300], ts[301] - 1, ts[301]):
+        assert index.position(t) == np.searchsorted(ts, t, side='right') - 1
+
+def test_all_assets_multi_year_is_fast():
+    prices = pd.concat([random_bars(24 * 365 * 3, seed=i, symbol=f'SYM{i}') for i in range(21)], ignore_index=True)
+    started = time.perf_counter()
+    indexes = build_structure_indexes(prices)
+    assert time.perf_counter() - started < 10.0
+    assert len(indexes) == 21 and all(len(ix) == 24 * 365 * 3 for ix in indexes.values())
+
+if __name__ == "__main__":
+    test_rolling_max_matches_naive()
+    test_labels_breaks_and_trend()
+    test_index_lookups()
+    test_all_assets_multi_year_is_fast()
+    print("market_structure checks passed")
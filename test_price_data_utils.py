@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from price_data_utils import PRICE_SCHEMA, normalize_price_frame
+
+def yahoo_history(symbols=('GC=F',), periods=3, start='2024-01-02 10:00'):
+    """The (symbol, date) MultiIndex frame yahooquery's Ticker.history returns."""
+    dates = pd.date_range(start, periods=periods, freq='h', tz='UTC')
+    index = pd.MultiIndex.from_product([list(symbols), dates], names=['symbol', 'date'])
+    n = len(index)
+    return pd.DataFrame({
+        'open': np.arange(n) + 100.0, 'high': np.arange(n) + 101.0, 'low': np.arange(n) + 99.0,
+        'close': np.arange(n) + 100.5, 'volume': np.arange(n) + 10.0,
+    }, index=index)
+
+def assert_canonical(df):
+    assert list(df.columns) == list(PRICE_SCHEMA)
+    assert {col: str(dtype) for col, dtype in df.dtypes.items()} == PRICE_SCHEMA
+
+def test_multiindex_history():
+    # Symbols arrive out of order; the result is sorted by (symbol, ts)
+    hist = yahoo_history(('SI=F', 'GC=F'))
+    df = normalize_price_frame(hist)
+    assert_canonical(df)
+    assert df['symbol'].astype(str).tolist() == ['GC=F'] * 3 + ['SI=F'] * 3
+    assert df['ts'].iloc[0] == pd.Timestamp('2024-01-02 10:00', tz='UTC').value
+    assert df['Close'].tolist() == [103.5, 104.5, 105.5, 100.5, 101.5, 102.5]
+    # A reset frame and a DatetimeIndex frame give the same bars
+    assert normalize_price_frame(hist.reset_index()).equals(df)
+    single = hist.loc['GC=F']
+    assert normalize_price_frame(single, symbol='GC=F').equals(df.iloc[:3].reset_index(drop=True).assign(
+        symbol=pd.Categorical(['GC=F'] * 3)))
+
+def test_error_shapes_give_an_empty_canonical_frame():
+    for hist in ({'GC=F': 'No data found, symbol may be delisted'}, 'No data found', None, pd.DataFrame()):
+        df = normalize_price_frame(hist)
+        assert df.empty
+        assert_canonical(df)
+
+def test_duplicate_bars_keep_the_latest_copy():
+    hist = yahoo_history(periods=3).reset_index()
+    # Yahoo repeats the still-forming last bar with updated values
+    repeat = hist.iloc[[2]].assign(close=999.0, volume=50.0)
+    df = normalize_price_frame(pd.concat([hist, repeat], ignore_index=True))
+    assert len(df) == 3
+    assert df['Close'].iloc[-1] == 999.0 and df['Volume'].iloc[-1] == 50
+
+def test_volume_and_missing_values():
+    hist = yahoo_history(periods=4).reset_index()
+    hist.loc[1, 'volume'] = np.nan
+    hist.loc[2, 'volume'] = 0.0
+    hist.loc[3, 'close'] = np.nan
+    # NaN volume becomes 0, and zero-volume bars are dropped by default; a NaN close never survives
+    df = normalize_price_frame(hist)
+    assert df['Volume'].tolist() == [10]
+    kept = normalize_price_frame(hist, drop_zero_volume=False)
+    assert kept['Volume'].tolist() == [10, 0, 0]
+    assert_canonical(kept)
+    # Unparseable timestamps are dropped too
+    hist = hist.astype({'date': object})
+    hist.loc[0, 'date'] = 'not a date'
+    assert normalize_price_frame(hist, drop_zero_volume=False)['Volume'].tolist() == [0, 0]
+
+if __name__ == "__main__":
+    test_multiindex_history()
+    test_error_shapes_give_an_empty_canonical_frame()
+    test_duplicate_bars_keep_the_latest_copy()
+    test_volume_and_missing_values()
+    print("price_data_utils checks passed")
@@ -0,0 +1,157 @@
+import threading
+import time
+
+import pandas as pd
+
+import http_utils
+import kl_entry_utils
+import price_store
+from http_utils import CircuitBreaker, CircuitOpenError, StaleWhileRevalidate, create_session, get_json
+from test_concurrency import fake_ticker
+from test_http_utils import start_stub_server, StubCFTCHandler
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_breaker_opens_then_half_opens():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    time.sleep(0.06)
+    # One trial call is let through; a failed trial opens the breaker again
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.allow()
+
+def test_get_json_stops_calling_a_failing_host(monkeypatch):
+    monkeypatch.setattr(http_utils.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(http_utils, '_breakers', {})
+    server, url = start_stub_server()
+    try:
+        StubCFTCHandler.fail_next = 100
+        for _ in range(http_utils.BREAKER_FAILURES):
+            try:
+                get_json(url, session=create_session(), cache=None, retries=0)
+            except http_utils.requests.HTTPError:
+                pass
+        hits = len(StubCFTCHandler.hits)
+        try:
+            get_json(url, session=create_session(), cache=None)
+        except CircuitOpenError:
+            pass
+        else:
+            raise AssertionError("expected CircuitOpenError")
+        assert len(StubCFTCHandler.hits) == hits
+    finally:
+        server.shutdown()
+
+def test_failed_trial_with_any_request_error_reopens(monkeypatch):
+    monkeypatch.setattr(http_utils, '_breakers', {})
+    breaker = http_utils.get_breaker('example.invalid')
+    breaker.reset_timeout = 0.05
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    time.sleep(0.06)
+    def truncated(*args):
+        raise http_utils.requests.exceptions.ChunkedEncodingError("connection broken")
+    monkeypatch.setattr(http_utils, '_get_json', truncated)
+    try:
+        get_json('http://example.invalid/x', cache=None)
+    except http_utils.requests.exceptions.ChunkedEncodingError:
+        pass
+    # The trial is released: the breaker is open again and lets the next trial through later
+    assert breaker.state == 'open'
+    time.sleep(0.06)
+    assert breaker.allow()
+
+def test_stale_value_served_while_refreshing():
+    cache = StaleWhileRevalidate(max_age=0.05, min_interval=0)
+    release = threading.Event()
+    calls = []
+    def loader(fail=False):
+        calls.append(fail)
+        if calls[1:]:
+            release.wait(5)
+        if fail:
+            raise RuntimeError("upstream down")
+        return len(calls)
+    assert cache.get('k', loader) == (1, 0.0, False)
+    time.sleep(0.06)
+    value, age, stale = cache.get('k', loader)
+    assert (value, stale) == (1, True) and age >= 0.05
+    release.set()
+    assert wait_for(lambda: cache.get('k', loader)[0] == 2)
+    # A failed refresh keeps serving the last good value
+    time.sleep(0.06)
+    assert cache.get('k', loader, True)[0] == 2
+    assert wait_for(lambda: len(calls) >= 3)
+    time.sleep(0.05)
+    assert cache.get('k', loader)[0] == 2
+
+def test_stale_store_served_immediately(monkeypatch, tmp_path):
+    downloads = []
+    monkeypatch.setattr(kl_entry_utils, 'Ticker', fake_ticker(delay=0.2, calls=downloads))
+    monkeypatch.setattr(price_store, 'PRICE_STORE_DIR', str(tmp_path))
+    start, end = pd.Timestamp('2023-05-01').date(), pd.Timestamp('2023-05-03').date()
+    kl_entry_utils.download_price_data('SI=F', pd.Timestamp('2023-04-01').date(), end)
+    downloads.clear()
+    monkeypatch.setattr(kl_entry_utils, '_price_checked', {})
+    # The stored bars are long past STORE_MAX_AGE, so they come back marked stale without waiting
+    started = time.perf_counter()
+    df = kl_entry_utils.fetch_price_data('SI=F', start, end)
+    assert time.perf_counter() - started < 0.2
+    assert len(df) and df.attrs['stale'] and df.attrs['age_seconds'] > 86400
+    # Wait for the refresh to land in the store before tmp_path goes away
+    assert wait_for(lambda: downloads == ['SI=F'] and not kl_entry_utils._price_flights.in_flight())
+
+def test_partial_store_is_not_served_as_the_full_range(monkeypatch, tmp_path):
+    monkeypatch.setattr(kl_entry_utils, 'Ticker', fake_ticker())
+    monkeypatch.setattr(price_store, 'PRICE_STORE_DIR', str(tmp_path))
+    monkeypatch.setattr(kl_entry_utils, '_price_checked', {})
+    # Only the last day of the range is stored, so the full range is downloaded, not served stale
+    kl_entry_utils.download_price_data('HG=F', pd.Timestamp('2023-06-29').date(), pd.Timestamp('2023-06-30').date())
+    monkeypatch.setattr(kl_entry_utils, '_price_checked', {})
+    df = kl_entry_utils.fetch_price_data('HG=F', pd.Timestamp('2023-04-01').date(), pd.Timestamp('2023-06-30').date())
+    assert not df.attrs['stale']
+    assert pd.Timestamp(int(df['ts'].iloc[0]), tz='UTC') < pd.Timestamp('2023-04-02', tz='UTC')
+
+def test_no_data_answers_do_not_trip_the_yahoo_breaker(monkeypatch, tmp_path):
+    monkeypatch.setattr(kl_entry_utils, 'Ticker', fake_ticker({'BAD=F': 'No data found, symbol may be delisted'}))
+    monkeypatch.setattr(price_store, 'PRICE_STORE_DIR', str(tmp_path))
+    monkeypatch.setattr(http_utils, '_breakers', {})
+    for _ in range(http_utils.BREAKER_FAILURES * 2):
+        assert kl_entry_utils.download_price_data('BAD=F', '2023-01-01', '2023-01-05').empty
+    assert http_utils.get_breaker('yahoo').state == 'closed'
+
+def test_weekend_gap_is_not_stale(tmp_path):
+    # Four weeks of weekday-only hourly bars ending Friday 2024-03-29 23:00 UTC
+    hours = pd.date_range('2024-03-04', '2024-03-29 23:00', freq='h', tz='UTC')
+    hours = hours[hours.dayofweek < 5]
+    frame = pd.DataFrame({'ts': hours.as_unit('ns').asi8, 'symbol': pd.Categorical(['GC=F'] * len(hours)),
+                          'Open': 1.0, 'High': 2.0, 'Low': 0.5, 'Close': 1.5, 'Volume': 100})
+    price_store.write_price_history(frame, '1h', str(tmp_path))
+    history = price_store.open_price_history('GC=F', '1h', str(tmp_path))
+    two_hours = pd.Timedelta(hours=2).value
+    saturday = pd.Timestamp('2024-03-30 12:00', tz='UTC').value
+    monday = pd.Timestamp('2024-04-01 10:30', tz='UTC').value
+    assert price_store.expected_last_bar_ns(history, saturday) == int(history.ts[-1])
+    assert price_store.is_fresh(history, int(history.ts[0]), two_hours, now_ns=saturday)
+    assert not price_store.is_fresh(history, int(history.ts[0]), two_hours, now_ns=monday)
+    # Re-writing the same bars publishes no new version
+    version = history.version
+    price_store.write_price_history(frame, '1h', str(tmp_path))
+    assert price_store.open_price_history('GC=F', '1h', str(tmp_path)).version == version
+
+if __name__ == "__main__":
+    test_breaker_opens_then_half_opens()
+    test_stale_value_served_while_refreshing()
+    print("resilience checks passed")
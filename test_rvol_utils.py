@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from rvol_utils import NS_PER_HOUR, rolling_means, time_of_day_rvol
+
+def bars(seed=0):
+    """Hourly bars for two symbols sorted by (symbol, ts), with whole sessions and single hours missing."""
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range('2024-01-01', '2024-02-15', freq='h', tz='UTC')
+    frames = []
+    for code, skip_days in enumerate([('2024-01-15', '2024-01-16'), ('2024-01-01', '2024-01-20', '2024-02-05')]):
+        keep = ~hours.normalize().isin(pd.DatetimeIndex(skip_days, tz='UTC')) & (rng.random(len(hours)) > 0.1)
+        ts = hours[keep].as_unit('ns').asi8
+        frames.append(pd.DataFrame({'ts': ts, 'code': code, 'Volume': rng.integers(0, 500, len(ts)).astype('float64')}))
+    return pd.concat(frames, ignore_index=True)
+
+def pandas_rolling_means(df, windows):
+    grouped = df.groupby('code')['Volume']
+    return {w: grouped.rolling(w, min_periods=1).mean().droplevel(0).sort_index().to_numpy() for w in windows}
+
+def pandas_time_of_day_rvol(df, sessions, tz_offset_hours):
+    local = pd.to_datetime(df['ts'], utc=True) + pd.Timedelta(hours=tz_offset_hours)
+    df = df.assign(day=local.dt.floor('D'), hour=local.dt.hour)
+    df['session'] = df.groupby('code')['day'].rank(method='dense').astype(int) - 1
+    slot = df.groupby(['code', 'session', 'hour'])['Volume'].sum()
+    # Mean of the same hour over the previous ``sessions`` sessions that had a bar in it
+    full = slot.unstack(['code', 'hour']).reindex(range(df['session'].max() + 1))
+    baseline = full.rolling(sessions, min_periods=1).mean().shift(1).stack(['code', 'hour'], future_stack=True)
+    keys = pd.MultiIndex.from_frame(df[['session', 'code', 'hour']])
+    current = slot.reorder_levels(['session', 'code', 'hour']).reindex(keys).to_numpy()
+    base = baseline.reindex(keys).to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(base > 0, current / base, np.nan)
+
+def test_rolling_means_match_groupby_rolling():
+    df = bars()
+    got = rolling_means(df['Volume'], df['code'].to_numpy(), (5, 20, 60))
+    expected = pandas_rolling_means(df, (5, 20, 60))
+    for window in (5, 20, 60):
+        assert np.allclose(got[window], expected[window])
+
+def test_time_of_day_rvol_matches_groupby_with_missing_sessions():
+    df = bars()
+    for sessions, offset in ((3, 3), (20, 0)):
+        got = time_of_day_rvol(df['ts'], df['Volume'], df['code'], sessions, offset)
+        expected = pandas_time_of_day_rvol(df, sessions, offset)
+        assert np.array_equal(np.isnan(got), np.isnan(expected))
+        assert np.allclose(got[~np.isnan(got)], expected[~np.isnan(expected)])
+
+def test_sub_hourly_bars_are_summed_into_the_hour():
+    ts = pd.date_range('2024-01-01', periods=3, freq='D', tz='UTC').as_unit('ns').asi8
+    half = ts + NS_PER_HOUR // 2
+    df = pd.DataFrame({'ts': np.sort(np.concatenate([ts, half])), 'code': 0, 'Volume': [10.0, 10.0, 30.0, 10.0, 40.0, 40.0]})
+    got = time_of_day_rvol(df['ts'], df['Volume'], df['code'], sessions=2, tz_offset_hours=0)
+    assert np.allclose(got, pandas_time_of_day_rvol(df, 2, 0), equal_nan=True)
+    assert np.allclose(got[-2:], 80.0 / 30.0)
+
+if __name__ == "__main__":
+    test_rolling_means_match_groupby_rolling()
+    test_time_of_day_rvol_matches_groupby_with_missing_sessions()
+    print("rvol checks passed")